@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Compare the columnar duration engine against the per-task loop.
+
+Usage: bench_columnar.py [num_tasks ...]
+
+For each repo size (1k and 10k tasks by default) a repo covering three
+years is generated and its tasks loaded once. Then the per-date durations
+for the whole span are computed from each task's spans, the way
+TaskManager.get_durations_by_date does, and with `columnar.TimelogColumns`.
+'load' is the one-off cost of building the columns, which further queries
+over the same tasks don't pay again. Needs NumPy.
+"""
+import datetime
+import shutil
+import sys
+import tempfile
+import time
+
+import fixtures
+from tt import columnar
+from tt import utils
+
+
+YEARS = 3
+
+
+def per_task(tasks, start, end, now):
+    # As TaskManager.get_durations_by_date does it
+    for task in tasks:
+        task.durations.get_durations_by_date(start, end, now)
+
+
+def timeit(fn):
+    start = time.time()
+    result = fn()
+    return time.time() - start, result
+
+
+def main():
+    if not columnar.available():
+        sys.exit("NumPy is not installed")
+
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000]
+    now = utils.get_now()
+    end = now.date()
+    start = end - datetime.timedelta(days=YEARS * 365)
+
+    print "%8s %10s %10s %10s %10s %8s" % (
+        "tasks", "entries", "loop", "load", "columnar", "speedup")
+    for num_tasks in sizes:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            manager = fixtures.generate_repo(tmp_dir + "/.tt", num_tasks,
+                                             years=YEARS)
+            tasks = list(manager.get_all_tasks())
+            num_entries = sum(len(t.log) for t in tasks)
+
+            loop, _ = timeit(lambda: per_task(tasks, start, end, now))
+            load, columns = timeit(lambda: columnar.TimelogColumns(tasks))
+            compute, _ = timeit(
+                lambda: columns.get_durations_by_date(start, end, now))
+            print "%8d %10d %9.3fs %9.3fs %9.3fs %7.1fx" % (
+                num_tasks, num_entries, loop, load, compute,
+                loop / (load + compute))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
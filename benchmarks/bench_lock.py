@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Measure what the repo lock adds to the start/stop path.
+
+Usage: bench_lock.py [num_procs] [cycles]
+
+First times the lock on its own and uncontended start/stop, then has
+`num_procs` processes (4 by default) each start and stop their own task
+`cycles` times at once, the way several hooks firing together would, and
+reports the latency distribution of each call. Finally checks that no more
+than one task ended up started.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import fixtures
+from tt import exceptions
+from tt import task_manager
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * pct / 100.0))
+    return values[index]
+
+
+def print_latencies(label, latencies):
+    print "  %-22s n=%-6d median %6.2fms  p95 %6.2fms  max %7.2fms" % (
+        label, len(latencies), percentile(latencies, 50) * 1000,
+        percentile(latencies, 95) * 1000, max(latencies) * 1000)
+
+
+def time_calls(fn, count):
+    latencies = []
+    for _ in xrange(count):
+        start = time.time()
+        fn()
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def start_stop(tt_dir, task_id, cycles):
+    """Start and stop a task `cycles` times, returning the latencies"""
+    manager = task_manager.TaskManager(tt_dir, lock_timeout=60)
+    latencies = []
+    for _ in xrange(cycles):
+        start = time.time()
+        manager.start_task(manager.get_task(task_id))
+        latencies.append(time.time() - start)
+        start = time.time()
+        try:
+            manager.stop_current_task()
+        except exceptions.StatusChangeException:
+            # Another process already stopped us by starting its own task
+            pass
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def run_contended(tt_dir, task_ids, cycles):
+    """Fork a process per task and collect all of their latencies"""
+    children = []
+    for task_id in task_ids:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            latencies = start_stop(tt_dir, task_id, cycles)
+            os.write(write_fd, " ".join(repr(l) for l in latencies))
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    latencies = []
+    for pid, read_fd in children:
+        chunks = []
+        while True:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        latencies.extend(float(l) for l in "".join(chunks).split())
+    return latencies
+
+
+def main():
+    num_procs = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tt_dir = os.path.join(tmp_dir, ".tt")
+        manager = fixtures.generate_repo(tt_dir, 1000,
+                                         num_open=2 * num_procs)
+        task_ids = manager.get_task_ids_by_status("pending")[:num_procs]
+        repo_lock = manager.storage.lock
+
+        print "uncontended"
+        print_latencies("lock acquire/release",
+                        time_calls(lambda: (repo_lock.acquire(),
+                                            repo_lock.release()), 1000))
+        print_latencies("start/stop",
+                        start_stop(tt_dir, task_ids[0], cycles))
+
+        print "%d processes contending" % num_procs
+        print_latencies("start/stop", run_contended(tt_dir, task_ids, cycles))
+
+        started = manager.get_task_ids_by_status("started")
+        print "started tasks at the end: %d" % len(started)
+        if len(started) > 1:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Measure the memory held by a full load of every task.
+
+Usage: bench_memory.py [--years Y] [--churn C] [num_tasks ...]
+
+For each repo size (100k tasks by default) a synthetic repo is generated
+with fixtures.py. Each load runs in a forked child, which keeps every task
+returned by `get_all_tasks` alive, with its log and durations touched so
+that nothing is left unparsed. The peak RSS of the child is reported, along
+with how much it grew over a child that loads nothing.
+"""
+import gc
+import shutil
+import sys
+import tempfile
+
+import fixtures
+from bench_scaling import run_forked
+from tt import task_manager
+
+
+def make_loader(tt_dir, cold):
+    def run():
+        manager = task_manager.TaskManager(tt_dir)
+        if cold:
+            shutil.rmtree(manager.storage._get_cache_dir(), ignore_errors=True)
+        tasks = list(manager.get_all_tasks())
+        for task in tasks:
+            len(task.log)
+            task.durations
+        manager.save_cache()
+        gc.collect()
+        return len(tasks)
+    return run
+
+
+def main():
+    args = sys.argv[1:]
+    years = 3
+    churn = 3
+    if "--years" in args:
+        i = args.index("--years")
+        years = float(args[i + 1])
+        del args[i:i + 2]
+    if "--churn" in args:
+        i = args.index("--churn")
+        churn = int(args[i + 1])
+        del args[i:i + 2]
+    sizes = [int(a) for a in args] or [100000]
+
+    print "%8s %10s %10s %10s %12s" % (
+        "tasks", "load", "peak", "growth", "bytes/task")
+    for num_tasks in sizes:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            tt_dir = tmp_dir + "/.tt"
+            fixtures.generate_repo(tt_dir, num_tasks, years=years,
+                                   churn=churn)
+            _, _, base_kb = run_forked(lambda: 0)
+            for label, cold in (("cold", True), ("warm", False)):
+                _, count, peak_kb = run_forked(make_loader(tt_dir, cold))
+                growth_kb = peak_kb - base_kb
+                print "%8d %10s %8.1fMB %8.1fMB %12.0f" % (
+                    count, label, peak_kb / 1024.0, growth_kb / 1024.0,
+                    growth_kb * 1024.0 / count)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
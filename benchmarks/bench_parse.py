@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Compare the fixed-width timestamp parser against strptime.
+
+Usage: bench_parse.py [num_lines]
+
+Builds a synthetic corpus of timelog lines (1M by default) and times
+parsing it with `utils.get_datetime_from_str` (strptime),
+`utils.parse_datetime_str`, `utils.parse_timestamp_seconds` and
+`TimeLog.from_lines`, which is what reading a task file goes through.
+"""
+import datetime
+import random
+import sys
+import time
+
+from tt import utils
+from tt.timelog import TimeLog
+
+
+STATUSES = ("pending", "started", "stopped", "done", "closed")
+
+
+def make_corpus(num_lines, seed=0):
+    """Return `num_lines` timelog lines spread over a couple of years,
+    roughly in time order like a real task file
+    """
+    rand = random.Random(seed)
+    dt = datetime.datetime(2010, 1, 1, 8, 0, 0)
+    lines = []
+    for i in xrange(num_lines):
+        dt += datetime.timedelta(seconds=rand.randint(1, 120))
+        status = STATUSES[i % len(STATUSES)]
+        lines.append("%s %s\n" % (status, utils.format_datetime_str(dt)))
+    return lines
+
+
+def timeit(label, fn, num_lines):
+    start = time.time()
+    fn()
+    elapsed = time.time() - start
+    rate = num_lines / elapsed if elapsed else float('inf')
+    print "%-28s %8.3fs %12.0f lines/s" % (label, elapsed, rate)
+    return elapsed
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lines = make_corpus(num_lines)
+    timestamps = [l.rstrip('\n').split(" ", 1)[1] for l in lines]
+    print "%d lines" % num_lines
+
+    def strptime():
+        parse = utils.get_datetime_from_str
+        for timestamp in timestamps:
+            parse(timestamp)
+
+    def fixed_width():
+        parse = utils.parse_datetime_str
+        for timestamp in timestamps:
+            parse(timestamp)
+
+    def seconds():
+        parse = utils.parse_timestamp_seconds
+        for timestamp in timestamps:
+            parse(timestamp)
+
+    def timelog():
+        TimeLog.from_lines(lines)
+
+    baseline = timeit("strptime", strptime, num_lines)
+    for label, fn in (("parse_datetime_str", fixed_width),
+                      ("parse_timestamp_seconds", seconds),
+                      ("TimeLog.from_lines", timelog)):
+        elapsed = timeit(label, fn, num_lines)
+        print "%-28s %8.1fx" % ("  speedup", baseline / elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Measure finding the repo to use from deep in a source tree.
+
+Usage: bench_projects.py [depth ...]
+
+For each depth a project repo is made at the top of a tree that deep, and
+the repo for its deepest directory is looked up: first with no cached
+answers, walking all the way up, then from the cache, and then from a new
+directory next to a cached one. Each is reported as the median time and
+the number of stat calls made, which is what costs on a network filesystem.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tt import projects
+from tt import task_manager
+
+
+RUNS = 20
+
+
+class StatCounter(object):
+    """Counts the calls to os.stat, which every os.path test goes through"""
+
+    def __init__(self):
+        self.calls = 0
+        self.stat = os.stat
+
+    def __call__(self, path):
+        self.calls += 1
+        return self.stat(path)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def time_find(found, path, forget=None):
+    """Return the median time of finding the repo for `path`, and the stats
+    each took, forgetting the answers under `forget` first if given
+    """
+    counter = StatCounter()
+    times = []
+    for _ in xrange(RUNS):
+        if forget is not None:
+            found.forget(forget)
+        counter.calls = 0
+        os.stat = counter
+        try:
+            start = time.time()
+            found.find(path)
+            times.append(time.time() - start)
+        finally:
+            os.stat = counter.stat
+    return median(times), counter.calls
+
+
+def bench_depth(depth):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        project_dir = os.path.join(tmp_dir, "project")
+        manager = task_manager.TaskManager(os.path.join(project_dir, ".tt"))
+        manager.initialize_state()
+        parts = ["d%d" % i for i in xrange(depth)]
+        deep_dir = os.path.join(project_dir, *parts)
+        os.makedirs(deep_dir)
+        sibling_dir = os.path.join(os.path.dirname(deep_dir), "sibling")
+        os.makedirs(sibling_dir)
+
+        found = projects.Projects(os.path.join(tmp_dir, "cache"),
+                                  os.path.join(tmp_dir, "home", ".tt"))
+        print "depth %d" % depth
+        for label, path, forget in (
+                ("walk", deep_dir, project_dir),
+                ("cached", deep_dir, None),
+                ("next to cached", sibling_dir, sibling_dir)):
+            seconds, stats = time_find(found, path, forget)
+            print "  %-16s %8.3fms %4d stats" % (label, seconds * 1000,
+                                                  stats)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main():
+    for depth in [int(arg) for arg in sys.argv[1:]] or [2, 8, 32]:
+        bench_depth(depth)
+
+
+if __name__ == "__main__":
+    main()
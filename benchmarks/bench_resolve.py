@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Measure looking up and updating the task index behind `tt start <query>`
+and completion.
+
+Usage: bench_resolve.py [num_tasks ...]
+
+For each size an index of that many open tasks, named like the fixtures'
+tasks, is written, and each lookup and update is timed as the median of
+several runs. Lookups read the index afresh each time, as a `tt` process
+would.
+"""
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tt import task_index
+from tt.task import Task
+
+
+RUNS = 9
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def time_runs(fn, runs=RUNS):
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return median(times)
+
+
+def make_entries(num_tasks):
+    end_date = datetime.date.today()
+    entries = []
+    for i in xrange(num_tasks):
+        date = end_date - datetime.timedelta(days=i % 1000)
+        name = "Synthetic task %d" % i
+        task_id = "%s-%s" % (Task._slugify("task %d" % i),
+                             date.strftime("%Y_%m_%d"))
+        entries.append(("pending", task_id, name))
+    return entries
+
+
+def bench_size(num_tasks):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        index = task_index.TaskIndex(os.path.join(tmp_dir, "completion"))
+        entries = make_entries(num_tasks)
+        index.write(entries)
+        _, task_id, name = entries[num_tasks // 2]
+        print "%d open tasks (%.1fMB index)" % (
+            num_tasks, os.path.getsize(index.index_file) / 1e6)
+
+        statuses = ["pending", "started"]
+
+        def update():
+            statuses.reverse()
+            index.update([(task_id, statuses[0], name)])
+
+        for label, fn in (
+                ("whole task_id", lambda: index.get(task_id)),
+                ("task_id prefix", lambda: index.find(task_id[:9])),
+                ("part of name", lambda: index.find(name[-8:])),
+                ("no match", lambda: index.find("nothing")),
+                ("status change", update)):
+            print "  %-16s %8.1fms" % (label, time_runs(fn) * 1000)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main():
+    for num_tasks in [int(arg) for arg in sys.argv[1:]] or [1000, 100000]:
+        bench_size(num_tasks)
+
+
+if __name__ == "__main__":
+    main()
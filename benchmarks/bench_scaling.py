@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""Measure how the main TaskManager entry points and reports scale.
+
+Usage: bench_scaling.py [--years Y] [--churn C] [num_tasks ...]
+
+For each repo size a synthetic repo is generated with fixtures.py, then each
+entry point is run in a forked child so that its peak memory can be
+reported on its own. Throughput is given in the unit that entry point is
+bound by: tasks loaded, or log entries walked.
+"""
+import datetime
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import fixtures
+from tt import cli
+from tt import durations
+from tt import task_manager
+
+
+def get_maxrss_kb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_forked(fn):
+    """Run `fn` in a child process and return (elapsed, count, peak_kb).
+
+    `fn` returns the count of things it processed, or (count, elapsed) if
+    only part of its work should be timed.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        start = time.time()
+        count = fn()
+        elapsed = time.time() - start
+        if isinstance(count, tuple):
+            count, elapsed = count
+        os.write(write_fd, "%r %d %d" % (elapsed, count, get_maxrss_kb()))
+        os._exit(0)
+
+    os.close(write_fd)
+    data = os.read(read_fd, 1024)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    elapsed, count, peak_kb = data.split()
+    return float(elapsed), int(count), int(peak_kb)
+
+
+def get_entry_points(tt_dir, date):
+    """Return (label, unit, fn) for each entry point to measure"""
+    def new_manager(**kwargs):
+        return task_manager.TaskManager(tt_dir, **kwargs)
+
+    def get_all_tasks_cold(**kwargs):
+        def run():
+            manager = new_manager(**kwargs)
+            shutil.rmtree(manager.storage._get_cache_dir(), ignore_errors=True)
+            return len(list(manager.get_all_tasks()))
+        return run
+
+    def get_all_tasks_warm():
+        # Relies on the cold run having saved the cache
+        return len(list(new_manager().get_all_tasks()))
+
+    def get_tasks_worked_on_date():
+        return len(list(new_manager().get_tasks_worked_on_date(date)))
+
+    def get_durations():
+        tasks = list(new_manager().get_all_tasks())
+        now = datetime.datetime.now()
+        num_entries = 0
+        start = time.time()
+        for task in tasks:
+            durations.Durations(task.log).get_duration(now)
+            num_entries += len(task.log)
+        return num_entries, time.time() - start
+
+    def report(fn, *args):
+        def run():
+            with open(os.devnull, "w") as devnull:
+                stdout = sys.stdout
+                sys.stdout = devnull
+                try:
+                    fn(new_manager(), *args)
+                finally:
+                    sys.stdout = stdout
+            return 1
+        return run
+
+    return [
+        ("get_all_tasks (8 threads)", "tasks",
+         get_all_tasks_cold(workers=8)),
+        ("get_all_tasks (4 procs)", "tasks",
+         get_all_tasks_cold(workers=4, pool_type="process")),
+        ("get_all_tasks (cold)", "tasks", get_all_tasks_cold()),
+        ("get_all_tasks (warm)", "tasks", get_all_tasks_warm),
+        ("get_tasks_worked_on_date", "tasks", get_tasks_worked_on_date),
+        ("Durations", "entries", get_durations),
+        ("daily_report", "reports",
+         report(cli.daily_report, date, date, {})),
+        ("weekly_report", "reports",
+         report(cli.weekly_report, date - datetime.timedelta(days=6), date,
+                {})),
+        ("range_report (year)", "reports",
+         report(cli.range_report, date - datetime.timedelta(days=364), date,
+                {})),
+    ]
+
+
+def bench_size(num_tasks, years, churn):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        tt_dir = os.path.join(tmp_dir, ".tt")
+        start = time.time()
+        fixtures.generate_repo(tt_dir, num_tasks, years=years, churn=churn)
+        print "%d tasks over %s years, churn %d (generated in %.1fs)" % (
+            num_tasks, years, churn, time.time() - start)
+
+        date = datetime.date.today()
+        base_kb = get_maxrss_kb()
+        for label, unit, fn in get_entry_points(tt_dir, date):
+            elapsed, count, peak_kb = run_forked(fn)
+            rate = count / elapsed if elapsed else float('inf')
+            print "  %-26s %8.3fs %12.0f %s/s  peak %7.1fMB (+%.1fMB)" % (
+                label, elapsed, rate, unit, peak_kb / 1024.0,
+                max(0, peak_kb - base_kb) / 1024.0)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main():
+    args = sys.argv[1:]
+    years = 3
+    churn = 3
+    sizes = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--years":
+            years = float(args.pop(0))
+        elif arg == "--churn":
+            churn = int(args.pop(0))
+        else:
+            sizes.append(int(arg))
+
+    for num_tasks in sizes or [1000, 10000, 100000]:
+        bench_size(num_tasks, years, churn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""Measure wall time of `tt` subcommands against generated repos.
+
+Usage: bench_startup.py [num_tasks ...]
+
+For each repo size (1k, 10k and 100k tasks by default) a repo is generated
+under a temporary $HOME and each subcommand is run as a separate process,
+the way hooks run it. 'cold' is the first run with state/cache removed,
+'warm' is the median of the following runs. 'ls' is then timed again with
+a `tt serve` daemon answering it.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fixtures
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TT = os.path.join(ROOT_DIR, "bin", "tt")
+WARM_RUNS = 5
+
+
+def get_env(home):
+    env = dict(os.environ)
+    env["HOME"] = home
+    env["PYTHONPATH"] = ROOT_DIR
+    return env
+
+
+def run_tt(home, args):
+    env = get_env(home)
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call([sys.executable, TT] + args, env=env,
+                              stdout=devnull)
+    return time.time() - start
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def bench_command(home, manager, commands):
+    """Time a sequence of commands (run together so state-changing ones like
+    start/stop can undo each other) and report each one
+    """
+    shutil.rmtree(manager.storage._get_cache_dir(), ignore_errors=True)
+    cold = [run_tt(home, args) for args in commands]
+    warm = [[] for _ in commands]
+    for _ in xrange(WARM_RUNS):
+        for i, args in enumerate(commands):
+            warm[i].append(run_tt(home, args))
+
+    for i, args in enumerate(commands):
+        label = " ".join(args) if args[0] == "report" else args[0]
+        print "  %-14s cold %7.1fms  warm %7.1fms" % (
+            label, cold[i] * 1000, median(warm[i]) * 1000)
+
+
+def bench_daemon(home, manager):
+    from tt import client
+
+    server = subprocess.Popen([sys.executable, TT, "serve"],
+                              env=get_env(home))
+    try:
+        socket_file = client.get_socket_file(manager.tt_dir)
+        while not os.path.exists(socket_file):
+            time.sleep(0.05)
+        # The daemon preloads every task before answering
+        run_tt(home, ["ls"])
+        times = [run_tt(home, ["ls"]) for _ in xrange(WARM_RUNS)]
+        print "  %-14s          %7s  warm %7.1fms" % (
+            "ls (daemon)", "", median(times) * 1000)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_size(num_tasks):
+    home = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        manager = fixtures.generate_repo(os.path.join(home, ".tt"),
+                                         num_tasks)
+        print "%d tasks (generated in %.1fs)" % (num_tasks,
+                                                 time.time() - start)
+
+        task_id = manager.get_task_ids_by_status("pending")[0]
+        bench_command(home, manager, [["ls"]])
+        bench_command(home, manager,
+                      [["report", "today"], ["report", "week"]])
+        bench_command(home, manager,
+                      [["start", task_id], ["stop"]])
+        bench_daemon(home, manager)
+    finally:
+        shutil.rmtree(home)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+
+    # The floor every subcommand pays just to start the interpreter
+    times = []
+    for _ in xrange(WARM_RUNS):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", "pass"])
+        times.append(time.time() - start)
+    print "interpreter startup %7.1fms" % (median(times) * 1000)
+
+    for num_tasks in sizes:
+        bench_size(num_tasks)
+
+
+if __name__ == "__main__":
+    main()
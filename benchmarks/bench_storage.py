@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""Compare the plain-file and SQLite storage backends on the same repo.
+
+Usage: bench_storage.py [--years Y] [num_tasks ...]
+
+For each repo size a plain-file repo is generated with fixtures.py and then
+copied into an SQLite repo with `TaskManager.import_tasks`, as `tt export
+--sqlite` does. Each operation is then run against both with a fresh
+TaskManager, the way a `tt` process would, and the median of several runs
+is reported. The plain-file runs are warm: its task cache is filled first.
+"""
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import fixtures
+from tt import task_manager
+
+
+RUNS = 5
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def get_size(tt_dir):
+    # Including the write-ahead log, which holds whatever hasn't been
+    # checkpointed into tt.db yet
+    return sum(os.path.getsize(os.path.join(tt_dir, name))
+               for name in os.listdir(tt_dir) if name.startswith("tt.db"))
+
+
+def time_runs(fn, runs=RUNS):
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return median(times)
+
+
+def get_operations(tt_dir, date, task_id):
+    """Return (label, fn) for each operation to measure"""
+    def new_manager():
+        return task_manager.TaskManager(tt_dir)
+
+    def ls():
+        manager = new_manager()
+        for status in ("started", "stopped", "pending", "done"):
+            for task in manager.get_tasks_by_status(status):
+                task.get_duration()
+
+    def get_task():
+        new_manager().get_task(task_id).get_duration()
+
+    def durations(days):
+        def run():
+            start = date - datetime.timedelta(days=days - 1)
+            new_manager().get_durations_by_date(start, date)
+        return run
+
+    def journal_day():
+        start = datetime.datetime.combine(date, datetime.time())
+        list(new_manager().get_journal_events(
+            start, start + datetime.timedelta(days=1)))
+
+    def task_id_at():
+        at = datetime.datetime.combine(date, datetime.time(12))
+        new_manager().get_task_id_at(at)
+
+    def start_stop():
+        manager = new_manager()
+        manager.start_task(manager.get_task(task_id))
+        manager.stop_current_task()
+
+    def get_all_tasks():
+        for task in new_manager().get_all_tasks():
+            pass
+
+    return [
+        ("ls", ls),
+        ("get_task", get_task),
+        ("durations (day)", durations(1)),
+        ("durations (week)", durations(7)),
+        ("durations (year)", durations(365)),
+        ("journal (day)", journal_day),
+        ("get_task_id_at", task_id_at),
+        ("start/stop", start_stop),
+        ("get_all_tasks", get_all_tasks),
+    ]
+
+
+def bench_size(num_tasks, years):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        files_dir = os.path.join(tmp_dir, "files")
+        sqlite_dir = os.path.join(tmp_dir, "sqlite")
+
+        start = time.time()
+        files = fixtures.generate_repo(files_dir, num_tasks, years=years)
+        # The fixtures skip the days a task ran through, which the SQLite
+        # date index gets from the import
+        files.rebuild_date_index()
+        generated = time.time() - start
+
+        start = time.time()
+        sqlite = task_manager.TaskManager(sqlite_dir, backend="sqlite")
+        sqlite.initialize_state()
+        sqlite.import_tasks(files.get_all_tasks())
+        print "%d tasks over %s years (generated in %.1fs, " \
+            "imported into SQLite in %.1fs, %.1fMB)" % (
+                num_tasks, years, generated, time.time() - start,
+                get_size(sqlite_dir) / 1e6)
+
+        date = datetime.date.today()
+        task_id = files.get_task_ids_by_status("pending")[0]
+        files.save_cache()
+        print "  %-20s %10s %10s" % ("", "files", "sqlite")
+        file_ops = get_operations(files_dir, date, task_id)
+        sqlite_ops = get_operations(sqlite_dir, date, task_id)
+        for (label, file_fn), (_, sqlite_fn) in zip(file_ops, sqlite_ops):
+            # Fills the task cache of the plain-file repo
+            file_fn()
+            print "  %-20s %8.1fms %8.1fms" % (
+                label, time_runs(file_fn) * 1000,
+                time_runs(sqlite_fn) * 1000)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main():
+    args = sys.argv[1:]
+    years = 3
+    sizes = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--years":
+            years = float(args.pop(0))
+        else:
+            sizes.append(int(arg))
+
+    for num_tasks in sizes or [1000, 10000, 100000]:
+        bench_size(num_tasks, years)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Generate synthetic tt repos for benchmarking.
+
+The repos are written straight to disk in the same layout `tt` uses,
+rather than through `TaskManager`, so that building 100k tasks takes
+seconds instead of minutes.
+"""
+import datetime
+import os
+import random
+import time
+
+from tt import task_manager
+from tt import utils
+from tt.task import Task
+
+
+def generate_repo(tt_dir, num_tasks, years=1, churn=3, midnight_ratio=0.05,
+                  num_open=20, end_date=None, seed=0):
+    """Create a repo at `tt_dir` holding `num_tasks` tasks.
+
+    Task creation dates are spread at random over the `years` leading up to
+    `end_date` (today by default). Each task is started and stopped `churn`
+    times on average, and `midnight_ratio` of those intervals start late in
+    the evening and run past midnight.
+
+    The newest `num_open` tasks are left alternately pending and stopped;
+    the rest are done and closed, as they would be in a long-lived repo.
+
+    Returns the TaskManager for the new repo.
+    """
+    rand = random.Random(seed)
+    if end_date is None:
+        end_date = utils.get_now().date()
+
+    manager = task_manager.TaskManager(tt_dir)
+    manager.initialize_state()
+
+    num_days = max(1, int(years * 365))
+    days_back = sorted(rand.randrange(num_days) for _ in xrange(num_tasks))
+
+    index = {}
+    completion = []
+    journal = []
+    for i, day_back in enumerate(days_back):
+        date = end_date - datetime.timedelta(days=day_back)
+        created = utils.date2datetime(date) + datetime.timedelta(
+            hours=8, minutes=rand.randint(0, 480))
+        name = "Synthetic task %d" % i
+        slug = Task._slugify("task %d" % i)
+        task_id = "%s-%s" % (slug, utils.format_date_str(date, "%Y_%m_%d"))
+
+        log = [("pending", created)]
+        if i >= num_open or i % 2:
+            num_intervals = rand.randint(1, max(1, 2 * churn - 1))
+            log.extend(_generate_intervals(rand, created, num_intervals,
+                                           midnight_ratio))
+        if i >= num_open:
+            finished = log[-1][1]
+            log.append(("done", finished))
+            log.append(("closed", finished))
+        status = log[-1][0]
+
+        _write_task(manager, task_id, name, log)
+        if status in Task.DIRECTORY_STATUSES:
+            _write_status_link(manager, task_id, status)
+            completion.append((status, task_id, name))
+        for log_status, dt in log:
+            journal.append((dt, log_status, task_id))
+            task_ids = index.setdefault(dt.date(), [])
+            if task_id not in task_ids:
+                task_ids.append(task_id)
+
+    _write_date_index(manager, index)
+    _write_journal(manager, journal)
+    manager.task_index.write(completion)
+    return manager
+
+
+def _generate_intervals(rand, after, num_intervals, midnight_ratio):
+    """Return the started/stopped log entries for `num_intervals` intervals
+    following `after`
+    """
+    entries = []
+    dt = after
+    for _ in xrange(num_intervals):
+        if rand.random() < midnight_ratio:
+            # Late evening start, running past midnight
+            evening = utils.date2datetime(dt.date()) + datetime.timedelta(
+                hours=23)
+            started = max(evening, dt) + datetime.timedelta(
+                minutes=rand.randint(1, 59))
+            stopped = started + datetime.timedelta(
+                minutes=rand.randint(60, 180))
+        else:
+            started = dt + datetime.timedelta(minutes=rand.randint(1, 240))
+            stopped = started + datetime.timedelta(
+                seconds=rand.randint(60, 5400))
+        entries.append(("started", started))
+        entries.append(("stopped", stopped))
+        dt = stopped
+    return entries
+
+
+def _write_task(manager, task_id, name, log):
+    task_file = manager.storage.get_task_file(task_id)
+    utils.mkdirs_easy(os.path.dirname(task_file))
+    with open(task_file, "w") as f:
+        f.write("%s\n" % name)
+        for status, dt in log:
+            f.write("%s %s\n" % (status, utils.format_datetime_str(dt)))
+
+    # Date the file by its last status change, as if it were written then
+    mtime = time.mktime(log[-1][1].timetuple())
+    if mtime < time.time():
+        os.utime(task_file, (mtime, mtime))
+
+
+def _write_status_link(manager, task_id, status):
+    status_dir = manager.storage._get_status_dir(status)
+    open(os.path.join(status_dir, task_id), "w").close()
+
+
+def _write_date_index(manager, index):
+    for date, task_ids in index.iteritems():
+        with open(manager.storage._get_date_index_file(date), "w") as f:
+            for task_id in task_ids:
+                f.write("%s\n" % task_id)
+
+
+def _write_journal(manager, events):
+    # In the order `rebuild_journal` gives, a stop before a start in the
+    # same second
+    events.sort(key=lambda e: (e[0], e[1] == "started"))
+    with open(manager.storage._get_journal_file(), "w") as f:
+        for dt, status, task_id in events:
+            f.write("%s %s %s\n" % (utils.format_datetime_str(dt), status,
+                                     task_id))
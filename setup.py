@@ -19,4 +19,5 @@ setup(
         'Programming Language :: Python :: 2.6'
     ],
     install_requires=[], # removed for better compat
+    extras_require={'columnar': ['numpy']},
     scripts=['bin/tt', 'bin/_tt_completer'])
@@ -0,0 +1,21 @@
+import os
+import re
+import unittest
+
+from tt import cli
+
+
+HOOK_FILE = os.path.join(os.path.dirname(__file__), os.pardir, "etc",
+                         "tt_bash_completion_hook")
+
+
+class CompletionHookTest(unittest.TestCase):
+
+    def test_hook_completes_every_action(self):
+        with open(HOOK_FILE) as f:
+            match = re.search(r'^_TT_ACTIONS="([^"]*)"', f.read(), re.M)
+        self.assertEqual(sorted(match.group(1).split()), sorted(cli.ACTIONS))
+
+
+if __name__ == '__main__':
+    unittest.main()
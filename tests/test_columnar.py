@@ -0,0 +1,100 @@
+import datetime
+import random
+import unittest
+
+from tt import columnar
+from tt import exceptions
+from tt import task
+from tt import task_manager
+from tt import utils
+
+
+def make_task(manager, name, log):
+    t = task.Task.create(manager=manager, name=name, status=log[-1][0])
+    t.log = log
+    return t
+
+
+def seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def random_log(rand, start):
+    """A valid timelog with intervals crossing midnight and unclosed
+    starts and stops"""
+    log = [("pending", start)]
+    dt = start
+    running = False
+    for i in xrange(rand.randint(0, 30)):
+        dt += datetime.timedelta(seconds=rand.randint(60, 60 * 3600))
+        status = running and "stopped" or rand.choice(["started", "stopped"])
+        running = status == "started"
+        log.append((status, dt))
+    return log
+
+
+class TimelogColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = task_manager.TaskManager("fakedir")
+        self.now = datetime.datetime(2011, 1, 20, 14, 30, 0)
+        utils.get_now = lambda: self.now
+
+        rand = random.Random(0)
+        self.tasks = []
+        for i in xrange(50):
+            start = datetime.datetime(2011, 1, 1) + datetime.timedelta(
+                seconds=rand.randint(0, 18 * 86400))
+            self.tasks.append(
+                make_task(self.manager, "Task %d" % i,
+                          random_log(rand, start)))
+        self.columns = columnar.TimelogColumns(self.tasks)
+
+    def test_durations(self):
+        durations = self.columns.get_durations(self.now)
+        for t, duration in zip(self.tasks, durations):
+            self.assertAlmostEqual(duration, seconds(t.get_duration()))
+
+    def test_durations_by_date(self):
+        start = datetime.date(2011, 1, 1)
+        end = datetime.date(2011, 1, 25)
+        dates, matrix = self.columns.get_durations_by_date(start, end,
+                                                           self.now)
+        self.assertEqual(dates, list(utils.date_range(start, end)))
+        for t, row in zip(self.tasks, matrix):
+            for date, duration in zip(dates, row):
+                expected = seconds(t.get_duration_for_date(date))
+                self.assertAlmostEqual(duration, expected)
+
+    def test_durations_by_hour(self):
+        # Before today, so no log entries are later than now
+        start = datetime.date(2011, 1, 1)
+        end = datetime.date(2011, 1, 19)
+        _, by_date = self.columns.get_durations_by_date(start, end, self.now)
+        by_hour = self.columns.get_durations_by_hour(start, end, self.now)
+        for date_row, hour_row in zip(by_date, by_hour):
+            self.assertAlmostEqual(date_row.sum(), hour_row.sum())
+
+        t = make_task(self.manager, "Hours", [
+            ("started", datetime.datetime(2011, 1, 5, 9, 30, 0)),
+            ("stopped", datetime.datetime(2011, 1, 5, 11, 0, 0))])
+        by_hour = columnar.TimelogColumns([t]).get_durations_by_hour(
+            start, end, self.now)
+        self.assertEqual(list(by_hour[0][8:12]), [0, 1800, 3600, 0])
+
+    def test_invalid_interval(self):
+        t = make_task(self.manager, "Invalid", [
+            ("started", datetime.datetime(2011, 1, 5, 1, 0, 0)),
+            ("closed", datetime.datetime(2011, 1, 5, 1, 1, 0))])
+        columns = columnar.TimelogColumns(self.tasks + [t])
+        self.assertRaises(exceptions.StatusChangeException,
+                          columns.get_durations, self.now)
+
+
+# unittest.skipIf is new in 2.7; without NumPy there's just nothing to run
+if not columnar.available():
+    del TimelogColumnsTest
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import StringIO
+import datetime
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from tt import client
+from tt import daemon
+from tt import task_manager
+from tt import utils
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tt_dir = os.path.join(self.tmp_dir, ".tt")
+        self.manager = task_manager.TaskManager(self.tt_dir)
+        self.manager.initialize_state()
+        utils.get_now = lambda: datetime.datetime(2011, 1, 7, 2, 0, 0, 0)
+        self.daemon = None
+
+    def tearDown(self):
+        if self.daemon is not None:
+            self.daemon.close()
+            self.thread.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def start_daemon(self):
+        resident = daemon.ResidentTaskManager(self.tt_dir)
+        self.daemon = daemon.Daemon(resident)
+        self.daemon.bind()
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def call(self, *args):
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = StringIO.StringIO()
+        sys.stderr = StringIO.StringIO()
+        try:
+            status = client.call(self.tt_dir, ["tt"] + list(args))
+            return status, sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def test_no_daemon(self):
+        self.assertEqual(self.call("ls"), (None, "", ""))
+
+    def test_stale_socket_is_taken_over(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(client.get_socket_file(self.tt_dir))
+        stale.close()
+        self.assertEqual(self.call("ls"), (None, "", ""))
+
+        self.start_daemon()
+        self.assertEqual(self.call("ls")[0], 0)
+
+    def test_second_daemon_refused(self):
+        self.start_daemon()
+        other = daemon.Daemon(self.manager)
+        self.assertRaises(daemon.DaemonRunning, other.bind)
+
+    def test_start_and_ls(self):
+        task = self.manager.add_task("Serve it")
+        self.start_daemon()
+
+        status, stdout, stderr = self.call("start", task.task_id)
+        self.assertEqual((status, stderr), (0, ""))
+        self.assertEqual(self.manager.get_started_task_id(), task.task_id)
+
+        status, stdout, stderr = self.call("ls")
+        self.assertTrue(stdout.startswith("STARTED\n - Serve it ("))
+
+    def test_errors_are_passed_on(self):
+        self.start_daemon()
+        status, stdout, stderr = self.call("start", "nope")
+        self.assertEqual(status, 1)
+        self.assertTrue(stderr.startswith("ERROR: "))
+
+    def test_stalled_client_times_out(self):
+        self.start_daemon()
+        self.daemon.CONNECTION_TIMEOUT = 0.2
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(client.get_socket_file(self.tt_dir))
+        try:
+            results = []
+            caller = threading.Thread(
+                target=lambda: results.append(self.call("ls")))
+            caller.start()
+            caller.join(5)
+            self.assertEqual(results and results[0][0], 0)
+        finally:
+            # Let the daemon go if it was waiting on us after all
+            stalled.close()
+            caller.join()
+
+    def test_only_serves_daemon_actions(self):
+        self.start_daemon()
+        status, stdout, stderr = self.call("add", "Not here")
+        self.assertEqual(status, 1)
+        self.assertEqual(list(self.manager.get_task_ids_by_status("pending")),
+                         [])
+
+
+class ResidentTaskManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        tt_dir = os.path.join(self.tmp_dir, ".tt")
+        self.manager = task_manager.TaskManager(tt_dir)
+        self.manager.initialize_state()
+        self.resident = daemon.ResidentTaskManager(tt_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_listing_follows_directory_changes(self):
+        first = self.manager.add_task("First")
+        pending_dir = self.manager.storage._get_status_dir("pending")
+        long_ago = time.time() - 60
+        os.utime(pending_dir, (long_ago, long_ago))
+        self.assertEqual(self.resident.get_task_ids_by_status("pending"),
+                         [first.task_id])
+
+        second = self.manager.add_task("Second")
+        self.assertEqual(
+            sorted(self.resident.get_task_ids_by_status("pending")),
+            sorted([first.task_id, second.task_id]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from tt import multi
+from tt import reports
+
+from test_task_manager import BaseTaskManagerTest
+
+
+class MultiTaskManagerTest(BaseTaskManagerTest):
+
+    def setUp(self):
+        # Two repos side by side, rather than the one the base class makes
+        self.tmp_dir = tempfile.mkdtemp()
+        self.alice = self.make_manager("team/alice/.tt", backend="files")
+        self.bob = self.make_manager("team/bob/.tt", backend="sqlite")
+        self.root = os.path.join(self.tmp_dir, "team")
+
+        self.work(self.alice.add_task("Write it"),
+                  datetime.datetime(2011, 1, 7, 9, 0, 0),
+                  datetime.datetime(2011, 1, 7, 10, 0, 0), self.alice)
+        self.work(self.bob.add_task("Test it"),
+                  datetime.datetime(2011, 1, 7, 23, 0, 0),
+                  datetime.datetime(2011, 1, 8, 1, 0, 0), self.bob)
+        self.set_now(datetime.datetime(2011, 1, 9, 12, 0, 0))
+
+    def test_discover(self):
+        os.makedirs(os.path.join(self.root, "carol", ".git", ".tt"))
+        os.makedirs(os.path.join(self.root, "dave", ".tt"))
+
+        manager = multi.MultiTaskManager.discover(
+            [self.root, self.alice.tt_dir])
+        self.assertEqual(manager.tt_dirs, [self.alice.tt_dir, self.bob.tt_dir])
+        self.assertEqual(manager.names, ["alice", "bob"])
+        self.assertEqual(multi.get_repo_names(["/a/b/.tt"]), ["b"])
+
+    def test_iter_rows(self):
+        dates = [datetime.date(2011, 1, 7), datetime.date(2011, 1, 8)]
+        for pool_type in ("thread", "process"):
+            manager = multi.MultiTaskManager.discover(
+                [self.root], pool_type=pool_type)
+            rows = [(row["date"].day, row["repo"], row["name"],
+                     reports.get_seconds(row["duration"]))
+                    for row in manager.iter_rows(dates)]
+            self.assertEqual(rows, [(7, "alice", "Write it", 3600),
+                                    (7, "bob", "Test it", 3600),
+                                    (8, "bob", "Test it", 3600)])
+
+    def test_journal(self):
+        manager = multi.MultiTaskManager.discover([self.root])
+        events = [(dt.hour, status, repo) for dt, status, _, repo
+                  in manager.get_journal_events(
+                      datetime.datetime(2011, 1, 7, 3, 0, 0))]
+        self.assertEqual(events, [(9, "started", "alice"),
+                                  (10, "stopped", "alice"),
+                                  (10, "pending", "bob"),
+                                  (23, "started", "bob"),
+                                  (1, "stopped", "bob")])
+
+    def test_bad_repo_skipped(self):
+        bad_dir = os.path.join(self.root, "broken", ".tt")
+        os.makedirs(bad_dir)
+        with open(os.path.join(bad_dir, "tt.db"), "w") as f:
+            f.write("not a database")
+
+        manager = multi.MultiTaskManager.discover([self.root])
+        rows = list(manager.iter_rows([datetime.date(2011, 1, 7)]))
+        self.assertEqual([row["repo"] for row in rows], ["alice", "bob"])
+        self.assertEqual([name for name, _ in manager.errors], ["broken"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt import projects
+from tt import task_manager
+
+
+class ProjectsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.home_tt_dir = self.make_repo("home/.tt")
+        self.project_tt_dir = self.make_repo("code/project/.tt")
+        self.deep_dir = self.path("code/project/src/tt/tests")
+        os.makedirs(self.deep_dir)
+        self.projects = projects.Projects(self.path("cache"),
+                                          self.home_tt_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, path):
+        return os.path.join(self.tmp_dir, path)
+
+    def make_repo(self, path):
+        manager = task_manager.TaskManager(self.path(path))
+        manager.initialize_state()
+        return manager.tt_dir
+
+    def test_most_specific_repo(self):
+        self.assertEqual(self.projects.find(self.deep_dir),
+                         self.project_tt_dir)
+        self.assertEqual(self.projects.find(self.path("code/project")),
+                         self.project_tt_dir)
+        self.assertEqual(self.projects.find(self.path("code")),
+                         self.home_tt_dir)
+        self.assertEqual(self.projects.get_all(),
+                         [self.project_tt_dir, self.home_tt_dir])
+
+    def test_cached_lookups(self):
+        self.projects.find(self.deep_dir)
+        lookups = self.projects._read_lookups()
+        self.assertEqual(lookups[self.deep_dir], self.project_tt_dir)
+        self.assertEqual(lookups[self.path("code/project")],
+                         self.project_tt_dir)
+        self.assertFalse(self.path("code") in lookups)
+
+        # A repo made in between isn't seen until its answers are forgotten,
+        # as `tt init` does
+        src_tt_dir = self.make_repo("code/project/src/.tt")
+        self.assertEqual(self.projects.find(self.deep_dir),
+                         self.project_tt_dir)
+        self.projects.forget(self.path("code/project/src"))
+        self.assertEqual(self.projects.find(self.deep_dir), src_tt_dir)
+
+        # A repo that's gone is noticed straight away
+        shutil.rmtree(src_tt_dir)
+        self.assertEqual(self.projects.find(self.deep_dir),
+                         self.project_tt_dir)
+        self.assertEqual(self.projects.get_all(),
+                         [self.project_tt_dir, self.home_tt_dir])
+
+    def test_default(self):
+        shutil.rmtree(self.home_tt_dir)
+        self.assertEqual(self.projects.find(self.path("code")),
+                         self.home_tt_dir)
+        self.assertEqual(self.projects.find(self.path("code")),
+                         self.home_tt_dir)
+        self.assertEqual(self.projects.get_all(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
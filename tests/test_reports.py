@@ -0,0 +1,129 @@
+import StringIO
+import datetime
+import json
+import unittest
+
+from tt import reports
+from tt import utils
+
+from test_task_manager import BaseTaskManagerTest
+
+
+class ReportsTest(BaseTaskManagerTest):
+
+    def setUp(self):
+        super(ReportsTest, self).setUp()
+        self.write = self.manager.add_task("Write the report")
+        self.test = self.manager.add_task("Test the report")
+        self.work(self.write, datetime.datetime(2011, 1, 7, 9, 0, 0, 0),
+                  datetime.datetime(2011, 1, 7, 10, 0, 0, 0))
+        self.work(self.test, datetime.datetime(2011, 1, 7, 23, 0, 0, 0),
+                  datetime.datetime(2011, 1, 8, 1, 0, 0, 0))
+        self.set_now(datetime.datetime(2011, 1, 9, 12, 0, 0, 0))
+
+    def test_daily_text(self):
+        stream = StringIO.StringIO()
+        sink = reports.TextSink(stream, " - %(name)s (%(duration)s)",
+                                header="2011-01-07",
+                                footer="\nTotal Duration: %(total)s")
+        sink.write(reports.daily(self.manager, datetime.date(2011, 1, 7)))
+        self.assertEqual(stream.getvalue(),
+                         "2011-01-07\n"
+                         " - Write the report (01:00:00)\n"
+                         " - Test the report (01:00:00)\n"
+                         "\n"
+                         "Total Duration: 02:00:00\n")
+
+    def test_weekly_includes_idle_days(self):
+        rows = list(reports.weekly(self.manager, datetime.date(2011, 1, 9),
+                                   days_back=4))
+        self.assertEqual(
+            [(row["date"].day, row["duration"].seconds) for row in rows],
+            [(9, 0), (8, 3600), (7, 7200), (6, 0)])
+
+    def test_group_by_streams_consecutive_keys(self):
+        hour = datetime.timedelta(hours=1)
+        rows = [{"date": 1, "duration": hour}, {"date": 1, "duration": hour},
+                {"date": 2, "duration": hour}]
+        self.assertEqual(list(reports.group_by(iter(rows), "date")),
+                         [{"date": 1, "duration": 2 * hour},
+                          {"date": 2, "duration": hour}])
+
+    def test_tally_totals_by_task(self):
+        tally = reports.Tally()
+        dates = utils.date_range(datetime.date(2011, 1, 7),
+                                 datetime.date(2011, 1, 8))
+        list(tally.count(reports.by_date(self.manager, dates)))
+        self.assertEqual(
+            [(row["name"], row["duration"].seconds) for row in tally.rows()],
+            [("Test the report", 7200), ("Write the report", 3600)])
+
+    def test_by_date_loads_a_month_at_once(self):
+        month_end = self.manager.add_task("Close the month")
+        self.work(month_end, datetime.datetime(2011, 1, 31, 23, 0, 0, 0),
+                  datetime.datetime(2011, 2, 1, 1, 0, 0, 0))
+        calls = []
+        get_tasks_on_dates = self.manager.get_tasks_on_dates
+
+        def counting_get_tasks_on_dates(dates):
+            calls.append(dates)
+            return get_tasks_on_dates(dates)
+
+        self.manager.get_tasks_on_dates = counting_get_tasks_on_dates
+        dates = utils.date_range(datetime.date(2011, 1, 7),
+                                 datetime.date(2011, 2, 1))
+        rows = reports.by_date(self.manager, dates)
+        first = next(rows)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            [(row["date"].day, row["name"], row["duration"].seconds)
+             for row in [first] + list(rows)],
+            [(7, "Write the report", 3600), (7, "Test the report", 3600),
+             (8, "Test the report", 3600), (31, "Close the month", 3600),
+             (1, "Close the month", 3600)])
+        self.assertEqual(len(calls), 2)
+
+    def test_filters(self):
+        self.manager.done_task(self.test)
+        dates = [datetime.date(2011, 1, 7), datetime.date(2011, 1, 8)]
+        rows = reports.by_date(self.manager, dates, statuses=["done"])
+        self.assertEqual([(row["date"].day, row["name"]) for row in rows],
+                         [(7, "Test the report"), (8, "Test the report")])
+
+        # The 8th was a Saturday
+        rows = reports.by_date(self.manager, dates, weekdays=range(5))
+        self.assertEqual([(row["date"].day, row["name"]) for row in rows],
+                         [(7, "Write the report"), (7, "Test the report")])
+
+        rows = reports.filter_dates(reports.by_date(self.manager, dates),
+                                    start=datetime.date(2011, 1, 8))
+        self.assertEqual([row["date"].day for row in rows], [8])
+
+    def test_timed_status(self):
+        self.manager.done_task(self.test)
+        rows = reports.timed_status(self.manager, "done")
+        self.assertEqual([(row["name"], row["duration"].seconds)
+                          for row in rows], [("Test the report", 7200)])
+
+    def test_csv_sink(self):
+        stream = StringIO.StringIO()
+        fields = ("date",) + reports.TASK_FIELDS
+        reports.CSVSink(stream, fields).write(
+            reports.daily(self.manager, datetime.date(2011, 1, 8)))
+        self.assertEqual(stream.getvalue().splitlines(), [
+            "date,task_id,name,status,duration",
+            "2011-01-08,%s,Test the report,stopped,3600" % self.test.task_id,
+        ])
+
+    def test_json_sink_writes_a_line_per_row(self):
+        stream = StringIO.StringIO()
+        reports.JSONSink(stream, ("date", "duration")).write(
+            reports.weekly(self.manager, datetime.date(2011, 1, 8),
+                           days_back=2))
+        rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(rows, [{"date": "2011-01-08", "duration": 3600},
+                                {"date": "2011-01-07", "duration": 7200}])
+
+
+if __name__ == '__main__':
+    unittest.main()
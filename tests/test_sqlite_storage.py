@@ -0,0 +1,191 @@
+import datetime
+import os
+import unittest
+
+from tt import exceptions
+from tt import storage
+from tt import task_manager
+
+from test_task_manager import BaseTaskManagerTest
+
+
+class BaseSQLiteTest(BaseTaskManagerTest):
+
+    backend = "sqlite"
+
+
+class SQLiteStorageTest(BaseSQLiteTest):
+
+    def test_backend_detected(self):
+        manager = task_manager.TaskManager(self.manager.tt_dir)
+        self.assertEqual(manager.backend, "sqlite")
+        self.assertTrue(os.path.exists(storage.get_db_file(manager.tt_dir)))
+
+    def test_status_changes(self):
+        task = self.manager.add_task("Write it")
+        self.assertRaises(exceptions.TaskAlreadyExists,
+                          self.manager.add_task, "Write it")
+        self.work(task, datetime.datetime(2011, 1, 7, 9, 0, 0),
+                  datetime.datetime(2011, 1, 7, 10, 0, 0))
+        self.manager.done_task(self.manager.get_task(task.task_id))
+
+        manager = task_manager.TaskManager(self.manager.tt_dir)
+        loaded = manager.get_task(task.task_id)
+        self.assertEqual(loaded.status, "done")
+        self.assertEqual([s for s, _ in loaded.log],
+                         ["pending", "started", "stopped", "done"])
+        self.assertEqual(manager.get_task_ids_by_status("done"),
+                         [task.task_id])
+        self.assertEqual(manager.task_index.get_entries(),
+                         [("done", task.task_id, "Write it")])
+
+        manager.close_done_tasks()
+        self.assertEqual(manager.get_task_ids_by_status("done"), [])
+        self.assertEqual(manager.get_task(task.task_id).status, "closed")
+
+    def test_failed_change_is_rolled_back(self):
+        running = self.manager.add_task("Running")
+        finished = self.manager.add_task("Finished")
+        self.work(finished, datetime.datetime(2011, 1, 7, 9, 0, 0),
+                  datetime.datetime(2011, 1, 7, 10, 0, 0))
+        self.manager.done_task(self.manager.get_task(finished.task_id))
+        self.manager.start_task(self.manager.get_task(running.task_id))
+
+        # Stops the running task, then refuses to start a done one
+        self.assertRaises(exceptions.StatusChangeException,
+                          self.manager.start_task,
+                          self.manager.get_task(finished.task_id))
+        self.assertEqual(self.manager.get_started_task_id(), running.task_id)
+        self.assertEqual(len(self.manager.get_task(running.task_id).log), 2)
+        self.assertTrue(("started", running.task_id, "Running") in
+                        self.manager.task_index.get_entries())
+
+    def test_durations_and_journal(self):
+        task1 = self.manager.add_task("First task")
+        task2 = self.manager.add_task("Second task")
+        self.work(task1, datetime.datetime(2011, 1, 7, 22, 0, 0),
+                  datetime.datetime(2011, 1, 9, 1, 0, 0))
+        self.work(task2, datetime.datetime(2011, 1, 9, 1, 0, 0),
+                  datetime.datetime(2011, 1, 9, 1, 30, 0))
+
+        durations_by_date = self.manager.get_durations_by_date(
+            datetime.date(2011, 1, 7), datetime.date(2011, 1, 9))
+        seconds = dict((date, sorted((t.task_id, d.days * 86400 + d.seconds)
+                                     for t, d in durations_by_date[date]))
+                       for date in durations_by_date)
+        self.assertEqual(seconds, {
+            datetime.date(2011, 1, 7): [(task1.task_id, 7200)],
+            datetime.date(2011, 1, 8): [(task1.task_id, 86400)],
+            datetime.date(2011, 1, 9): [(task1.task_id, 3600),
+                                        (task2.task_id, 1800)]})
+        self.assertEqual(
+            self.manager.get_task_ids_for_date(datetime.date(2011, 1, 8)),
+            [task1.task_id])
+
+        events = list(self.manager.get_journal_events(
+            datetime.datetime(2011, 1, 9, 1, 0, 0)))
+        self.assertEqual([(s, t) for _, s, t in events],
+                         [("stopped", task1.task_id),
+                          ("started", task2.task_id),
+                          ("stopped", task2.task_id)])
+        at = self.manager.get_task_id_at
+        self.assertEqual(at(datetime.datetime(2011, 1, 8, 12, 0, 0)),
+                         task1.task_id)
+        self.assertEqual(at(datetime.datetime(2011, 1, 9, 1, 0, 0)),
+                         task2.task_id)
+        self.assertEqual(at(datetime.datetime(2011, 1, 9, 2, 0, 0)), None)
+
+    def test_running_task_on_dates(self):
+        task = self.manager.add_task("Running task")
+        self.set_now(datetime.datetime(2011, 1, 7, 22, 0, 0))
+        self.manager.start_task(task)
+        self.set_now(datetime.datetime(2011, 1, 9, 6, 0, 0))
+
+        worked = self.manager.get_tasks_worked_on_date(
+            datetime.date(2011, 1, 8))
+        self.assertEqual([t.task_id for t in worked], [task.task_id])
+
+    def test_rebuild_state(self):
+        task = self.manager.add_task("Task")
+        db = self.manager.storage.db
+        db.execute("UPDATE tasks SET status = 'done'")
+        db.execute("INSERT INTO events VALUES ('gone-2011_01_07', 0, "
+                   "'pending', 0)")
+
+        report = self.manager.rebuild_state()
+        self.assertEqual(report.misplaced, [(task.task_id, "done", "pending")])
+        self.assertEqual(report.orphans, [("gone-2011_01_07", "pending")])
+        self.assertFalse(
+            self.manager.rebuild_state(repair=False).has_problems())
+
+    def test_no_task_files(self):
+        task = self.manager.add_task("Task")
+        self.assertRaises(exceptions.TTException, task.get_task_file)
+        self.assertRaises(exceptions.TTException,
+                          self.manager.archive_closed_tasks,
+                          datetime.date(2011, 1, 7))
+
+
+class ImportTest(BaseSQLiteTest):
+
+    def test_round_trip(self):
+        task1 = self.manager.add_task("First task")
+        task2 = self.manager.add_task("Second task")
+        self.work(task1, datetime.datetime(2011, 1, 7, 9, 0, 0),
+                  datetime.datetime(2011, 1, 8, 10, 0, 0))
+        self.manager.start_task(self.manager.get_task(task2.task_id))
+
+        files = task_manager.TaskManager(
+            os.path.join(self.tmp_dir, "files"), backend="files")
+        files.initialize_state()
+        imported, skipped = files.import_tasks(self.manager.get_all_tasks())
+        self.assertEqual((len(imported), skipped), (2, []))
+        self.assertFalse(files.rebuild_state(repair=False).has_problems())
+
+        back = task_manager.TaskManager(
+            os.path.join(self.tmp_dir, "back"), backend="sqlite")
+        back.initialize_state()
+        back.import_tasks(files.get_all_tasks())
+
+        for manager in (files, back):
+            self.assertEqual(manager.get_started_task_id(), task2.task_id)
+            for task in self.manager.get_all_tasks():
+                loaded = manager.get_task(task.task_id)
+                self.assertEqual((loaded.name, loaded.status, loaded.log),
+                                 (task.name, task.status, task.log))
+            self.assertEqual(list(manager.get_journal_events()),
+                             list(self.manager.get_journal_events()))
+            self.assertEqual(
+                sorted(manager.get_task_ids_for_date(
+                    datetime.date(2011, 1, 8))),
+                [task1.task_id, task2.task_id])
+
+        imported, skipped = back.import_tasks(files.get_all_tasks())
+        self.assertEqual((imported, len(skipped)), ([], 2))
+
+    def test_import_keeps_one_started_task(self):
+        task = self.manager.add_task("Started here")
+        self.manager.start_task(task)
+
+        files = self.make_manager("files", backend="files")
+        other = files.add_task("Started there")
+        files.start_task(other)
+        self.assertRaises(exceptions.StatusChangeException,
+                          files.import_tasks, self.manager.get_all_tasks())
+        self.assertEqual(files.get_task_ids_by_status("started"),
+                         [other.task_id])
+        self.assertRaises(exceptions.BadTaskId, files.get_task, task.task_id)
+
+        files.stop_current_task()
+        imported, skipped = files.import_tasks(self.manager.get_all_tasks())
+        self.assertEqual([t.task_id for t in imported], [task.task_id])
+        self.assertEqual(files.get_task_ids_by_status("started"),
+                         [task.task_id])
+
+        # Already here, so it's skipped rather than started twice
+        imported, skipped = files.import_tasks(self.manager.get_all_tasks())
+        self.assertEqual((imported, len(skipped)), ([], 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
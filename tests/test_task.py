@@ -155,6 +155,20 @@ class GetDurationForDateTest(BaseTaskTest):
         msg = "(2011-01-6 00:00:00 - 2011-01-6 00:01:00) = 60 seconds"
         self.assertEqual(duration.seconds, 60, msg)
 
+    def test_crosses_several_midnights(self):
+        entry = self.make_log_entry
+        self.task.log = [
+            entry('pending', '2011-01-3 01:00:00'),
+            entry('started', '2011-01-3 23:00:00'),
+            entry('stopped', '2011-01-6 00:30:00')
+        ]
+
+        # No entries on the 4th or 5th, but it was running all day
+        for day, seconds in ((3, 3600), (4, 86400), (5, 86400), (6, 1800)):
+            duration = self.task.get_duration_for_date(
+                datetime.date(2011, 1, day))
+            self.assertEqual(duration, datetime.timedelta(seconds=seconds))
+
     def test_unbounded(self):
         entry = self.make_log_entry
         self.task.log = [
@@ -0,0 +1,741 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from tt import durations
+from tt import exceptions
+from tt import lock
+from tt import task_manager
+from tt import timelog
+from tt import utils
+
+
+class BaseTaskManagerTest(unittest.TestCase):
+    """Runs each test against a new repo in `self.manager`, stored with
+    `backend`, with the time set to early on 2011-01-07
+    """
+
+    backend = None
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manager = self.make_manager(".tt")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def set_now(self, now):
+        utils.get_now = lambda: now
+
+    def make_manager(self, path, backend=None):
+        """Return the manager of a new repo at `path` in the temporary
+        directory, stored with `backend` or else the class's
+        """
+        self.set_now(datetime.datetime(2011, 1, 7, 2, 0, 0, 0))
+        manager = task_manager.TaskManager(os.path.join(self.tmp_dir, path),
+                                           backend=backend or self.backend)
+        manager.initialize_state()
+        return manager
+
+    def work(self, task, start, stop, manager=None):
+        """Start `task` at `start` and stop it at `stop`"""
+        if manager is None:
+            manager = self.manager
+        self.set_now(start)
+        manager.start_task(manager.get_task(task.task_id))
+        self.set_now(stop)
+        manager.stop_current_task()
+
+
+class DateIndexTest(BaseTaskManagerTest):
+
+    def test_worked_on_date_uses_index(self):
+        task = self.manager.add_task("Write the index")
+        self.manager.add_task("Never started")
+        self.set_now(datetime.datetime(2011, 1, 8, 9, 0, 0, 0))
+        self.manager.start_task(task)
+        self.set_now(datetime.datetime(2011, 1, 8, 10, 0, 0, 0))
+        self.manager.stop_current_task()
+
+        date = datetime.date(2011, 1, 8)
+        self.assertEqual(self.manager.get_task_ids_for_date(date),
+                         [task.task_id])
+        task_ids = [t.task_id for t in
+                    self.manager.get_tasks_worked_on_date(date)]
+        self.assertEqual(task_ids, [task.task_id])
+
+        date = datetime.date(2011, 1, 7)
+        self.assertEqual(len(self.manager.get_task_ids_for_date(date)), 2)
+        self.assertEqual(
+            list(self.manager.get_tasks_worked_on_date(date)), [])
+
+    def test_rebuild_date_index(self):
+        task = self.manager.add_task("Write the index")
+        index_dir = self.manager.storage._get_date_index_dir()
+        shutil.rmtree(index_dir)
+
+        # Without an index every task is a candidate
+        date = datetime.date(2011, 1, 7)
+        tasks = list(self.manager.get_tasks_on_date(date))
+        self.assertEqual([t.task_id for t in tasks], [task.task_id])
+
+        self.manager.rebuild_date_index()
+        self.assertEqual(self.manager.get_task_ids_for_date(date),
+                         [task.task_id])
+
+    def test_no_index(self):
+        old = self.manager.add_task("Old")
+        self.manager.add_task("Idle")
+        self.set_now(datetime.datetime(2011, 3, 6, 9, 0, 0))
+        self.manager.start_task(self.manager.get_task(old.task_id))
+        self.set_now(datetime.datetime(2011, 3, 8, 9, 0, 0))
+
+        # As in a repo from before the index, every task is looked at
+        shutil.rmtree(self.manager.storage._get_date_index_dir())
+        tasks = self.manager.get_tasks_worked_on_date(
+            datetime.date(2011, 3, 7))
+        self.assertEqual([t.task_id for t in tasks], [old.task_id])
+
+    def test_deleted_task_skipped(self):
+        task = self.manager.add_task("Write the index")
+        self.manager.delete_task(task)
+
+        date = datetime.date(2011, 1, 7)
+        self.assertEqual(list(self.manager.get_tasks_on_date(date)), [])
+
+
+class LazyLoadTest(BaseTaskManagerTest):
+
+    def test_lazy_load(self):
+        task = self.manager.add_task("Load me lazily")
+        for hour in range(3, 23):
+            self.set_now(datetime.datetime(2011, 1, 7, hour, 0, 0))
+            task = self.manager.get_task(task.task_id)
+            self.manager.start_task(task)
+            self.set_now(datetime.datetime(2011, 1, 7, hour, 30, 0))
+            self.manager.stop_current_task()
+
+        eager = self.manager.get_task(task.task_id)
+        lazy = self.manager.get_task(task.task_id, lazy=True)
+        self.assertEqual(lazy.name, "Load me lazily")
+        self.assertEqual(lazy.status, "stopped")
+        self.assertEqual(lazy._log, None)
+
+        self.assertEqual(lazy.log, eager.log)
+        self.assertEqual(len(lazy.log), 41)
+        self.assertEqual(lazy.get_duration(), eager.get_duration())
+
+    def test_status_change_on_lazy_task(self):
+        task = self.manager.add_task("Load me lazily")
+        task = self.manager.get_task(task.task_id, lazy=True)
+        self.manager.start_task(task)
+
+        self.assertEqual([s for s, _ in task.log], ["pending", "started"])
+        reloaded = self.manager.get_task(task.task_id)
+        self.assertEqual(reloaded.log, task.log)
+
+
+class TaskCacheTest(BaseTaskManagerTest):
+
+    def age_task_file(self, task, seconds=60):
+        """Push the task file's mtime out of the cache's racy window"""
+        task_file = task.get_task_file()
+        mtime = os.stat(task_file).st_mtime - seconds
+        os.utime(task_file, (mtime, mtime))
+
+    def test_cache_survives_new_manager(self):
+        task = self.manager.add_task("Cache me")
+        self.age_task_file(task)
+        list(self.manager.get_all_tasks())
+
+        manager = task_manager.TaskManager(self.manager.tt_dir)
+        task_file = task.get_task_file()
+        name, status, log, task_durations = manager.storage.cache.get(
+            task.task_id, task_file)
+        self.assertEqual((name, status, log), (task.name, "pending", task.log))
+        self.assertEqual((task_durations.starts, task_durations.ends),
+                         (task.durations.starts, task.durations.ends))
+
+    def test_edited_file_is_reparsed(self):
+        task = self.manager.add_task("Cache me")
+        self.age_task_file(task, seconds=120)
+        list(self.manager.get_all_tasks())
+
+        with open(task.get_task_file(), "w") as f:
+            f.write("Edited name\npending 2011-01-07 02:00:00\n")
+        self.age_task_file(task)
+
+        manager = task_manager.TaskManager(self.manager.tt_dir)
+        self.assertEqual(manager.get_task(task.task_id).name, "Edited name")
+
+    def test_recent_file_not_cached(self):
+        task = self.manager.add_task("Cache me")
+        self.manager.get_task(task.task_id)
+        self.assertEqual(
+            self.manager.storage.cache.get(task.task_id,
+                                           task.get_task_file()), None)
+
+
+class CompletionCacheTest(BaseTaskManagerTest):
+
+    def test_cache_follows_status_changes(self):
+        task1 = self.manager.add_task("First task")
+        task2 = self.manager.add_task("Second task")
+        self.manager.start_task(task1)
+        self.assertEqual(self.manager.task_index.get_entries(),
+                         [("started", task1.task_id, "First task"),
+                          ("pending", task2.task_id, "Second task")])
+
+        self.manager.done_task(task1)
+        self.manager.close_done_tasks()
+        self.manager.delete_task(task2)
+        self.assertEqual(self.manager.task_index.get_entries(), [])
+
+    def test_missing_cache_is_rebuilt(self):
+        task1 = self.manager.add_task("First task")
+        os.unlink(self.manager._get_completion_cache_file())
+
+        task2 = self.manager.add_task("Second task")
+        self.assertEqual(self.manager.task_index.get_entries(),
+                         [("pending", task1.task_id, "First task"),
+                          ("pending", task2.task_id, "Second task")])
+
+
+class ResolveTaskTest(BaseTaskManagerTest):
+
+    def setUp(self):
+        super(ResolveTaskTest, self).setUp()
+        self.login = self.manager.add_task("Fix the login page")
+        self.flaky = self.manager.add_task("Fix flaky tests")
+        self.set_now(datetime.datetime(2011, 1, 9, 2, 0, 0, 0))
+        self.report = self.manager.add_task("Write the report")
+        self.tests = self.manager.add_task("Write more tests")
+        self.resolve = self.manager.resolve_task
+
+    def assertResolves(self, query, task, *args):
+        self.assertEqual(self.resolve(query, *args).task_id, task.task_id)
+
+    def test_matches(self):
+        self.assertResolves(self.login.task_id, self.login)
+        self.assertResolves("fix_fl", self.flaky)
+        self.assertResolves("LOGIN", self.login)
+        self.assertRaises(exceptions.BadTaskId, self.resolve, "nothing")
+
+    def test_most_recent(self):
+        # Two were made on the 9th, the others on the 7th
+        self.assertResolves("test", self.tests)
+        self.assertRaises(exceptions.AmbiguousTaskId, self.resolve, "fix")
+        self.assertRaises(exceptions.AmbiguousTaskId, self.resolve, "write")
+        self.assertRaises(exceptions.AmbiguousTaskId, self.resolve, "test",
+                          None, False)
+
+    def test_statuses(self):
+        self.manager.start_task(self.flaky)
+        self.assertResolves("test", self.flaky, ["started"])
+        self.assertResolves("fix", self.login, ["pending"])
+        self.assertRaises(exceptions.BadTaskId, self.resolve, "login",
+                          ["started"])
+
+        # A whole task_id is taken whatever the status, even closed
+        self.assertResolves(self.login.task_id, self.login, ["started"])
+        self.manager.start_task(self.login)
+        self.manager.stop_current_task()
+        self.manager.done_task(self.login)
+        self.manager.close_done_tasks()
+        self.assertResolves(self.login.task_id, self.login)
+        self.assertRaises(exceptions.BadTaskId, self.resolve, "login")
+
+    def test_index_updates(self):
+        self.manager.delete_task(self.tests)
+        self.assertResolves("test", self.flaky)
+
+        # The old format, without names, is rebuilt
+        with open(self.manager._get_completion_cache_file(), "w") as f:
+            f.write("pending %s\n" % self.report.task_id)
+        self.assertResolves("the rep", self.report)
+
+        with open(self.report.get_task_file(), "r") as f:
+            lines = f.readlines()
+        with open(self.report.get_task_file(), "w") as f:
+            f.writelines(["Write the summary\n"] + lines[1:])
+        self.manager.reindex_task(self.report.task_id)
+        self.assertResolves("summary", self.report)
+
+
+class ParallelLoadTest(BaseTaskManagerTest):
+
+    def setUp(self):
+        super(ParallelLoadTest, self).setUp()
+        for i in range(10):
+            self.set_now(datetime.datetime(2011, 1, 1 + i, 2, 0, 0))
+            self.manager.add_task("Task %d" % i)
+
+    def assert_same_tasks(self, manager):
+        expected = [(t.task_id, t.name, t.status, t.log)
+                    for t in self.manager.get_all_tasks()]
+        tasks = [(t.task_id, t.name, t.status, t.log)
+                 for t in manager.get_all_tasks()]
+        self.assertEqual(len(tasks), 10)
+        self.assertEqual(tasks, expected)
+
+    def test_thread_pool(self):
+        manager = task_manager.TaskManager(self.manager.tt_dir, workers=4)
+        self.assert_same_tasks(manager)
+
+    def test_process_pool(self):
+        manager = task_manager.TaskManager(self.manager.tt_dir, workers=2,
+                                           pool_type="process")
+        self.assert_same_tasks(manager)
+
+    def test_bad_pool_type(self):
+        self.assertRaises(ValueError, task_manager.TaskManager,
+                          self.manager.tt_dir, workers=2, pool_type="fiber")
+
+
+class JournalTest(BaseTaskManagerTest):
+
+    def setUp(self):
+        super(JournalTest, self).setUp()
+        self.task1 = self.manager.add_task("First task")
+        self.task2 = self.manager.add_task("Second task")
+        # Alternate between the two tasks every 10 minutes for a day
+        dt = datetime.datetime(2011, 1, 8, 0, 0, 0)
+        for i in range(144):
+            task = (self.task1, self.task2)[i % 2]
+            self.set_now(dt + datetime.timedelta(minutes=10 * i))
+            self.manager.start_task(self.manager.get_task(task.task_id))
+        self.set_now(datetime.datetime(2011, 1, 9, 0, 0, 0))
+        self.manager.stop_current_task()
+
+    def test_events_in_range(self):
+        start = datetime.datetime(2011, 1, 8, 12, 0, 0)
+        end = datetime.datetime(2011, 1, 8, 13, 0, 0)
+        events = list(self.manager.get_journal_events(start, end))
+        # 6 switches, each stopping one task and starting the other
+        self.assertEqual(len(events), 12)
+        self.assertEqual(events[0], (start, "stopped", self.task2.task_id))
+        self.assertEqual(events[1], (start, "started", self.task1.task_id))
+        self.assertTrue(all(start <= dt < end for dt, _, _ in events))
+
+    def test_all_events(self):
+        events = list(self.manager.get_journal_events())
+        self.assertEqual(len(events), 2 + 144 + 143 + 1)
+        self.assertEqual(events, sorted(events, key=lambda e: e[0]))
+
+    def test_task_id_at(self):
+        at = self.manager.get_task_id_at
+        self.assertEqual(at(datetime.datetime(2011, 1, 7, 12, 0, 0)), None)
+        self.assertEqual(at(datetime.datetime(2011, 1, 8, 12, 0, 0)),
+                         self.task1.task_id)
+        self.assertEqual(at(datetime.datetime(2011, 1, 8, 12, 15, 0)),
+                         self.task2.task_id)
+        self.assertEqual(at(datetime.datetime(2011, 1, 9, 0, 0, 0)), None)
+
+    def test_task_id_at_deleted_task(self):
+        self.manager.delete_task(self.manager.get_task(self.task2.task_id))
+        at = self.manager.get_task_id_at
+        self.assertEqual(at(datetime.datetime(2011, 1, 8, 12, 0, 0)),
+                         self.task1.task_id)
+        self.assertEqual(at(datetime.datetime(2011, 1, 8, 12, 15, 0)), None)
+
+    def test_context_switches(self):
+        start = datetime.datetime(2011, 1, 8, 0, 0, 0)
+        end = datetime.datetime(2011, 1, 9, 0, 0, 0)
+        switches = self.manager.get_context_switches(start, end)
+        self.assertEqual(len(switches), 24)
+        self.assertEqual(set(switches.values()), set([6]))
+
+    def test_rebuild_journal(self):
+        events = list(self.manager.get_journal_events())
+        os.unlink(self.manager.storage._get_journal_file())
+        self.manager.rebuild_journal()
+        self.assertEqual(list(self.manager.get_journal_events()), events)
+
+
+class ArchiveTest(BaseTaskManagerTest):
+
+    def close_task(self, name, now):
+        self.set_now(now)
+        task = self.manager.add_task(name)
+        self.manager.start_task(task)
+        self.set_now(now + datetime.timedelta(hours=1))
+        self.manager.done_task(self.manager.get_task(task.task_id))
+        self.manager.close_done_tasks()
+        return task
+
+    def test_archive_closed_tasks(self):
+        old1 = self.close_task("Old one", datetime.datetime(2010, 5, 1, 9))
+        old2 = self.close_task("Old two", datetime.datetime(2010, 5, 3, 9))
+        old3 = self.close_task("Old three", datetime.datetime(2010, 6, 1, 9))
+        recent = self.close_task("Recent", datetime.datetime(2011, 1, 5, 9))
+        self.set_now(datetime.datetime(2011, 1, 7, 9, 0, 0))
+        pending = self.manager.add_task("Pending")
+        expected = dict((t.task_id, (t.name, t.status, t.log)) for t in
+                        self.manager.get_all_tasks())
+
+        archived = self.manager.archive_closed_tasks(datetime.date(2011, 1, 1))
+        self.assertEqual(sorted(archived),
+                         sorted([old1.task_id, old2.task_id, old3.task_id]))
+        self.assertFalse(os.path.exists(old1.get_task_file()))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.manager.storage._get_tasks_dir(), "2010")))
+        self.assertEqual(self.manager.storage.archive.get_months(),
+                         [("2010", "05"), ("2010", "06")])
+
+        # Archived tasks are still readable, one by one or all together
+        task = self.manager.get_task(old2.task_id)
+        self.assertEqual((task.name, task.status, task.log),
+                         expected[old2.task_id])
+        tasks = dict((t.task_id, (t.name, t.status, t.log)) for t in
+                     self.manager.get_all_tasks())
+        self.assertEqual(tasks, expected)
+
+        date = datetime.date(2010, 5, 3)
+        tasks = self.manager.get_tasks_worked_on_date(date)
+        self.assertEqual([t.task_id for t in tasks], [old2.task_id])
+
+    def test_archive_reads_only_archived_tasks(self):
+        old = self.close_task("Old one", datetime.datetime(2010, 5, 1, 9))
+        self.close_task("Recent", datetime.datetime(2011, 1, 5, 9))
+        self.set_now(datetime.datetime(2011, 1, 7, 9, 0, 0))
+        self.manager.add_task("Pending")
+
+        def fail_parse(cls, lines):
+            raise AssertionError("parsed a whole task file")
+
+        from_lines = timelog.TimeLog.__dict__["from_lines"]
+        timelog.TimeLog.from_lines = classmethod(fail_parse)
+        try:
+            archived = self.manager.archive_closed_tasks(
+                datetime.date(2011, 1, 1))
+        finally:
+            timelog.TimeLog.from_lines = from_lines
+        self.assertEqual(archived, [old.task_id])
+
+    def test_archive_appends_to_pack(self):
+        old1 = self.close_task("Old one", datetime.datetime(2010, 5, 1, 9))
+        self.manager.archive_closed_tasks(datetime.date(2011, 1, 1))
+        old2 = self.close_task("Old two", datetime.datetime(2010, 5, 3, 9))
+        self.manager.archive_closed_tasks(datetime.date(2011, 1, 1))
+
+        manager = task_manager.TaskManager(self.manager.tt_dir)
+        self.assertEqual(manager.get_task(old1.task_id).name, "Old one")
+        self.assertEqual(manager.get_task(old2.task_id).name, "Old two")
+
+
+class RebuildStateTest(BaseTaskManagerTest):
+
+    def link(self, task_id, status):
+        return self.manager.storage._get_status_link(task_id, status)
+
+    def test_clean_repo(self):
+        self.manager.add_task("Fine")
+        report = self.manager.rebuild_state()
+        self.assertFalse(report.has_problems())
+        self.assertEqual(report.num_tasks, 1)
+        self.assertEqual([p for p, _ in report.timings],
+                         ["scan tasks", "scan status table", "compare",
+                          "repair"])
+
+    def test_repairs(self):
+        edited = self.manager.add_task("Edited by hand")
+        unlinked = self.manager.add_task("Lost its link")
+        doubled = self.manager.add_task("Linked twice")
+        orphan = self.manager.add_task("Task file deleted")
+
+        # As if `tt edit` marked the task stopped
+        with open(edited.get_task_file(), "a") as f:
+            f.write("started 2011-01-07 02:10:00\n"
+                    "stopped 2011-01-07 02:20:00\n")
+        os.unlink(self.link(unlinked.task_id, "pending"))
+        open(self.link(doubled.task_id, "done"), "w").close()
+        os.unlink(orphan.get_task_file())
+
+        report = self.manager.rebuild_state(repair=False)
+        self.assertEqual(report.orphans, [(orphan.task_id, "pending")])
+        self.assertEqual(report.misplaced,
+                         [(edited.task_id, "pending", "stopped"),
+                          (doubled.task_id, "done", None)])
+        self.assertEqual(report.unlinked, [(unlinked.task_id, "pending")])
+        self.assertTrue(os.path.exists(self.link(edited.task_id, "pending")))
+
+        self.manager.rebuild_state()
+        self.assertFalse(self.manager.rebuild_state().has_problems())
+        self.assertEqual(self.manager.get_task_ids_by_status("stopped"),
+                         [edited.task_id])
+        self.assertEqual(
+            sorted(self.manager.get_task_ids_by_status("pending")),
+            sorted([unlinked.task_id, doubled.task_id]))
+        self.assertEqual(self.manager.get_task_ids_by_status("done"), [])
+
+    def test_invalid_timelog(self):
+        task = self.manager.add_task("Started twice")
+        with open(task.get_task_file(), "a") as f:
+            f.write("started 2011-01-07 02:10:00\n"
+                    "started 2011-01-07 02:20:00\n")
+
+        report = self.manager.rebuild_state()
+        self.assertEqual([t for t, _ in report.invalid], [task.task_id])
+
+    def test_unparseable_task_file(self):
+        bad = self.manager.add_task("Bad hour")
+        good = self.manager.add_task("Fine")
+        with open(bad.get_task_file(), "a") as f:
+            f.write("started 2011-01-07 25:00:00\n")
+
+        for workers in (0, 2):
+            manager = task_manager.TaskManager(self.manager.tt_dir,
+                                               workers=workers)
+            report = manager.rebuild_state()
+            self.assertEqual([t for t, _ in report.invalid], [bad.task_id])
+            self.assertEqual(report.num_tasks, 2)
+            # Its link is left as it was, not taken for an orphan
+            self.assertEqual(report.orphans, [])
+            self.assertEqual(
+                sorted(manager.get_task_ids_by_status("pending")),
+                sorted([bad.task_id, good.task_id]))
+
+
+class LockTest(BaseTaskManagerTest):
+
+    def test_lock_timeout(self):
+        lock_file = self.manager.storage._get_lock_file()
+        holder = lock.RepoLock(lock_file)
+        waiter = lock.RepoLock(lock_file, timeout=0.05)
+        with holder:
+            self.assertRaises(exceptions.LockTimeout, waiter.acquire)
+        with waiter:
+            pass
+
+    def test_lock_is_reentrant(self):
+        with self.manager.storage.lock:
+            with self.manager.storage.lock:
+                pass
+            task = self.manager.add_task("Inside the lock")
+        self.assertEqual(self.manager.get_task_ids_by_status("pending"),
+                         [task.task_id])
+
+    def test_busy_lock_blocks_status_change(self):
+        task = self.manager.add_task("Blocked")
+        manager = task_manager.TaskManager(self.manager.tt_dir,
+                                           lock_timeout=0.05)
+        with self.manager.storage.lock:
+            self.assertRaises(exceptions.LockTimeout, manager.start_task,
+                              manager.get_task(task.task_id))
+
+    def test_busy_lock_blocks_archive(self):
+        manager = task_manager.TaskManager(self.manager.tt_dir,
+                                           lock_timeout=0.05)
+        with self.manager.storage.lock:
+            self.assertRaises(exceptions.LockTimeout,
+                              manager.archive_closed_tasks,
+                              datetime.date(2011, 1, 7))
+
+    def test_busy_lock_blocks_reindex(self):
+        manager = task_manager.TaskManager(self.manager.tt_dir,
+                                           lock_timeout=0.05)
+        with self.manager.storage.lock:
+            self.assertRaises(exceptions.LockTimeout,
+                              manager.rebuild_date_index)
+            self.assertRaises(exceptions.LockTimeout, manager.rebuild_journal)
+
+    def test_recover_interrupted_transition(self):
+        task1 = self.manager.add_task("Interrupted")
+        task2 = self.manager.add_task("Next")
+
+        # As if a process died after moving the link but before writing the
+        # timelog entry
+        storage = self.manager.storage
+        os.rename(storage._get_status_link(task1.task_id, "pending"),
+                  storage._get_status_link(task1.task_id, "started"))
+        storage._write_transition_record([task1.task_id])
+
+        manager = task_manager.TaskManager(self.manager.tt_dir)
+        manager.start_task(manager.get_task(task2.task_id))
+        self.assertEqual(manager.get_task_ids_by_status("started"),
+                         [task2.task_id])
+        self.assertEqual(manager.get_task_ids_by_status("pending"),
+                         [task1.task_id])
+        self.assertFalse(
+            os.path.exists(manager.storage._get_transition_file()))
+
+    def test_stale_task_object(self):
+        task = self.manager.add_task("Started elsewhere")
+        stale = self.manager.get_task(task.task_id)
+        self.manager.start_task(task)
+
+        # `stale` still thinks it's pending, start_task must not trust that
+        self.manager.done_task(stale)
+        self.assertEqual(self.manager.get_task(task.task_id).status, "done")
+
+
+    def test_failed_start_leaves_current_task(self):
+        running = self.manager.add_task("Running")
+        finished = self.manager.add_task("Finished")
+        self.manager.rebuild_journal()
+        self.work(finished, datetime.datetime(2011, 1, 7, 9, 0, 0),
+                  datetime.datetime(2011, 1, 7, 10, 0, 0))
+        self.manager.done_task(self.manager.get_task(finished.task_id))
+        self.set_now(datetime.datetime(2011, 1, 7, 11, 0, 0))
+        self.manager.start_task(running)
+        events = list(self.manager.get_journal_events())
+
+        self.set_now(datetime.datetime(2011, 1, 7, 12, 0, 0))
+        for task in (finished, running):
+            self.assertRaises(exceptions.StatusChangeException,
+                              self.manager.start_task,
+                              self.manager.get_task(task.task_id))
+        self.assertEqual(self.manager.get_task_ids_by_status("started"),
+                         [running.task_id])
+        self.assertEqual(
+            [s for s, _ in self.manager.get_task(running.task_id).log],
+            ["pending", "started"])
+        self.assertEqual(list(self.manager.get_journal_events()), events)
+
+
+class GetDurationsByDateTest(BaseTaskManagerTest):
+
+    def test_durations_by_date(self):
+        task1 = self.manager.add_task("First task")
+        task2 = self.manager.add_task("Second task")
+        self.work(task1, datetime.datetime(2011, 1, 7, 9, 0, 0),
+                  datetime.datetime(2011, 1, 7, 10, 0, 0))
+        self.work(task2, datetime.datetime(2011, 1, 7, 10, 0, 0),
+                  datetime.datetime(2011, 1, 7, 10, 30, 0))
+        self.work(task1, datetime.datetime(2011, 1, 9, 23, 0, 0),
+                  datetime.datetime(2011, 1, 10, 1, 0, 0))
+
+        start = datetime.date(2011, 1, 7)
+        end = datetime.date(2011, 1, 10)
+        durations_by_date = self.manager.get_durations_by_date(start, end)
+
+        def seconds(date):
+            return sorted((t.task_id, d.seconds) for t, d in
+                          durations_by_date[date])
+
+        self.assertEqual(sorted(durations_by_date),
+                         list(utils.date_range(start, end)))
+        self.assertEqual(seconds(datetime.date(2011, 1, 7)),
+                         [(task1.task_id, 3600), (task2.task_id, 1800)])
+        self.assertEqual(seconds(datetime.date(2011, 1, 8)), [])
+        self.assertEqual(seconds(datetime.date(2011, 1, 9)),
+                         [(task1.task_id, 3600)])
+        self.assertEqual(seconds(datetime.date(2011, 1, 10)),
+                         [(task1.task_id, 3600)])
+
+
+class DurationsTest(BaseTaskManagerTest):
+
+    def test_totals_follow_appends(self):
+        task = self.manager.add_task("Task")
+        self.set_now(datetime.datetime(2011, 1, 7, 9, 0, 0))
+        self.manager.start_task(task)
+        self.set_now(datetime.datetime(2011, 1, 7, 10, 0, 0))
+        self.manager.stop_current_task()
+
+        task = self.manager.get_task(task.task_id)
+        totals = task.durations
+        self.set_now(datetime.datetime(2011, 1, 7, 23, 0, 0))
+        task.start()
+
+        # Updated in place rather than rebuilt from the log
+        self.assertTrue(task.durations is totals)
+        rebuilt = durations.Durations(task.log)
+        self.assertEqual((totals.starts, totals.ends, totals.running),
+                         (rebuilt.starts, rebuilt.ends, rebuilt.running))
+
+        self.set_now(datetime.datetime(2011, 1, 8, 0, 30, 0))
+        self.assertEqual(task.get_duration().seconds, 9000)
+        self.assertEqual(
+            task.get_duration_for_date(datetime.date(2011, 1, 7)).seconds,
+            7200)
+        self.assertEqual(
+            task.get_duration_for_date(datetime.date(2011, 1, 8)).seconds,
+            1800)
+
+    def test_span_over_several_days(self):
+        task1 = self.manager.add_task("Long task")
+        task2 = self.manager.add_task("Running task")
+        self.set_now(datetime.datetime(2011, 1, 7, 22, 0, 0))
+        self.manager.start_task(task1)
+        self.set_now(datetime.datetime(2011, 1, 10, 1, 0, 0))
+        self.manager.start_task(task2)
+        self.set_now(datetime.datetime(2011, 1, 12, 6, 0, 0))
+
+        start = datetime.date(2011, 1, 7)
+        end = datetime.date(2011, 1, 12)
+        durations_by_date = self.manager.get_durations_by_date(start, end)
+        hours = dict((date, sorted((t.task_id, d.days * 24 + d.seconds // 3600)
+                                   for t, d in durations_by_date[date]))
+                     for date in durations_by_date)
+        self.assertEqual(hours, {
+            datetime.date(2011, 1, 7): [(task1.task_id, 2)],
+            datetime.date(2011, 1, 8): [(task1.task_id, 24)],
+            datetime.date(2011, 1, 9): [(task1.task_id, 24)],
+            datetime.date(2011, 1, 10): [(task1.task_id, 1),
+                                         (task2.task_id, 23)],
+            datetime.date(2011, 1, 11): [(task2.task_id, 24)],
+            datetime.date(2011, 1, 12): [(task2.task_id, 6)]})
+
+        # Indexed for the days it ran through once it was stopped
+        self.assertEqual(
+            self.manager.get_task_ids_for_date(datetime.date(2011, 1, 8)),
+            [task1.task_id])
+        worked = self.manager.get_tasks_worked_on_date(
+            datetime.date(2011, 1, 11))
+        self.assertEqual([t.task_id for t in worked], [task2.task_id])
+
+        task1 = self.manager.get_task(task1.task_id)
+        self.assertEqual(task1.get_duration_between(
+            datetime.datetime(2011, 1, 8, 12, 0, 0),
+            datetime.datetime(2011, 1, 10, 0, 30, 0)),
+            datetime.timedelta(hours=36, minutes=30))
+
+
+class AddTasksTest(BaseTaskManagerTest):
+
+    def test_add_tasks(self):
+        existing = self.manager.add_task("Existing task")
+        tasks, failures = self.manager.add_tasks(
+            ["First task", "Existing task", "Second task", "first task"])
+
+        self.assertEqual([t.task_id for t in tasks],
+                         ["first_task-2011_01_07", "second_task-2011_01_07"])
+        self.assertEqual([(name, type(e)) for name, e in failures],
+                         [("Existing task", exceptions.TaskAlreadyExists),
+                          ("first task", exceptions.TaskAlreadyExists)])
+        self.assertFalse(
+            os.path.exists(self.manager.storage._get_transition_file()))
+
+        # Batch-added tasks look exactly like ones added one at a time
+        new_manager = task_manager.TaskManager(self.manager.tt_dir)
+        for task in tasks:
+            loaded = new_manager.get_task(task.task_id)
+            self.assertEqual((loaded.name, loaded.status, loaded.log),
+                             (task.name, "pending", task.log))
+        self.assertFalse(
+            self.manager.rebuild_state(repair=False).has_problems())
+        self.assertEqual(
+            sorted(self.manager.get_task_ids_for_date(
+                datetime.date(2011, 1, 7))),
+            sorted([existing.task_id] + [t.task_id for t in tasks]))
+        self.assertEqual(len(list(self.manager.get_journal_events())), 3)
+
+    def test_batch_over_midnight(self):
+        times = iter([datetime.datetime(2011, 1, 7, 23, 59, 59)] +
+                     [datetime.datetime(2011, 1, 8, 0, 0, 1)] * 10)
+        utils.get_now = lambda: next(times)
+
+        tasks, failures = self.manager.add_tasks(["First task",
+                                                  "Second task"])
+        self.assertEqual(failures, [])
+        self.assertEqual([t.task_id for t in tasks],
+                         ["first_task-2011_01_07", "second_task-2011_01_07"])
+        for task in tasks:
+            self.assertTrue(os.path.exists(task.get_task_file()))
+
+
+if __name__ == "__main__":
+    unittest.main()
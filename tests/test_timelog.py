@@ -0,0 +1,43 @@
+import cPickle as pickle
+import datetime
+import unittest
+
+from tt import timelog
+
+
+class TimeLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = ["pending 2011-01-07 01:00:00\n",
+                      "started 2011-01-07 01:10:00\n",
+                      "stopped 2011-01-08 00:10:00\n"]
+        self.entries = [
+            ("pending", datetime.datetime(2011, 1, 7, 1, 0, 0)),
+            ("started", datetime.datetime(2011, 1, 7, 1, 10, 0)),
+            ("stopped", datetime.datetime(2011, 1, 8, 0, 10, 0))]
+        self.log = timelog.TimeLog.from_lines(self.lines)
+
+    def test_behaves_like_list(self):
+        self.assertEqual(self.log, self.entries)
+        self.assertEqual(list(self.log), self.entries)
+        self.assertEqual(len(self.log), 3)
+        self.assertEqual(self.log[-1], self.entries[-1])
+        self.assertEqual(self.log[1:], self.entries[1:])
+
+        entry = ("done", datetime.datetime(2011, 1, 9, 12, 0, 0))
+        self.log.append(entry)
+        self.assertEqual(self.log, self.entries + [entry])
+
+    def test_unknown_status(self):
+        log = timelog.TimeLog.from_lines(
+            self.lines + ["blocked 2011-01-09 00:00:00\n"])
+        self.assertEqual(log[-1][0], "blocked")
+        self.assertEqual(log.copy(), log)
+
+    def test_pickle(self):
+        log = pickle.loads(pickle.dumps(self.log, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(log, self.entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import datetime
+import unittest
+
+from tt import utils
+
+
+class ParseDatetimeStrTest(unittest.TestCase):
+
+    def test_matches_strptime(self):
+        for datetime_str in ("2011-01-07 01:10:06", "1999-12-31 23:59:59",
+                             "2012-02-29 00:00:00"):
+            self.assertEqual(utils.parse_datetime_str(datetime_str),
+                             utils.get_datetime_from_str(datetime_str))
+
+    def test_unpadded_falls_back(self):
+        dt = utils.parse_datetime_str("2011-01-7 01:10:00")
+        self.assertEqual(dt, datetime.datetime(2011, 1, 7, 1, 10, 0))
+
+    def test_malformed(self):
+        for datetime_str in ("2011-13-07 01:10:06", "2011-02-30 01:10:06",
+                             "2011-01-07 25:10:06", "2011-01-07T01:10:06",
+                             "2011-01-+7 01:10:06", "garbage"):
+            self.assertRaises(ValueError, utils.parse_datetime_str,
+                              datetime_str)
+
+
+class TimestampSecondsTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for datetime_str in ("2011-01-07 01:10:06", "1969-12-31 23:59:59",
+                             "2012-02-29 00:00:00", "2011-01-7 01:10:00"):
+            dt = utils.parse_datetime_str(datetime_str)
+            seconds = utils.parse_timestamp_seconds(datetime_str)
+            self.assertEqual(seconds, utils.datetime_to_seconds(dt))
+            self.assertEqual(utils.seconds_to_datetime(seconds), dt)
+
+    def test_malformed(self):
+        for datetime_str in ("2011-02-30 01:10:06", "2011-01-07 25:10:06",
+                             "garbage"):
+            self.assertRaises(ValueError, utils.parse_timestamp_seconds,
+                              datetime_str)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import errno
+import os
+
+from tt import utils
+
+
+class Archive(object):
+    """Packed storage for closed tasks.
+
+    Closed tasks are moved out of tasks/ into one pack file per month of
+    task creation. Each pack is just the task files' contents concatenated,
+    with an index alongside giving the offset and length of each task:
+
+        archive/
+            2011/
+                01.pack
+                01.idx      <task_id> <offset> <length>
+
+    This keeps the number of files in the repo proportional to the number
+    of months rather than the number of tasks.
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self._indexes = {}
+
+    def get(self, task_id):
+        """Return the contents of an archived task file, or None if the task
+        isn't archived
+        """
+        year, month = self._get_year_month(task_id)
+        index = self._get_index(year, month)
+        try:
+            offset, length = index[task_id]
+        except KeyError:
+            return None
+
+        with open(self._get_pack_file(year, month), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def iter_all(self):
+        """Yields (task_id, contents) for every archived task, ordered by
+        month then task_id
+        """
+        for year, month in self.get_months():
+            index = self._get_index(year, month)
+            with open(self._get_pack_file(year, month), "rb") as f:
+                for task_id in sorted(index):
+                    offset, length = index[task_id]
+                    f.seek(offset)
+                    yield task_id, f.read(length)
+
+    def get_months(self):
+        """Return the sorted ('YYYY', 'MM') pairs that have a pack"""
+        try:
+            years = sorted(os.listdir(self.archive_dir))
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                return []
+            else:
+                raise
+
+        months = []
+        for year in years:
+            year_dir = os.path.join(self.archive_dir, year)
+            for filename in sorted(os.listdir(year_dir)):
+                month, ext = os.path.splitext(filename)
+                if ext == ".idx":
+                    months.append((year, month))
+        return months
+
+    def add(self, tasks):
+        """Append tasks to their month's pack.
+
+        `tasks` is a list of (task_id, contents). The pack is written and
+        flushed before its index, so an interrupted archive leaves at worst
+        some unreferenced bytes at the end of the pack.
+        """
+        by_month = {}
+        for task_id, contents in tasks:
+            year_month = self._get_year_month(task_id)
+            by_month.setdefault(year_month, []).append((task_id, contents))
+
+        for (year, month), month_tasks in sorted(by_month.iteritems()):
+            index = self._get_index(year, month)
+            pack_file = self._get_pack_file(year, month)
+            utils.mkdirs_easy(os.path.dirname(pack_file))
+
+            with open(pack_file, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                for task_id, contents in month_tasks:
+                    f.write(contents)
+                    index[task_id] = (offset, len(contents))
+                    offset += len(contents)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._write_index(year, month, index)
+
+    def _get_year_month(self, task_id):
+        # task_ids end in YYYY_MM_DD, see Task._generate_task_id
+        date_str = task_id[-10:]
+        return date_str[:4], date_str[5:7]
+
+    def _get_pack_file(self, year, month):
+        return os.path.join(self.archive_dir, year, "%s.pack" % month)
+
+    def _get_index_file(self, year, month):
+        return os.path.join(self.archive_dir, year, "%s.idx" % month)
+
+    def _get_index(self, year, month):
+        try:
+            return self._indexes[(year, month)]
+        except KeyError:
+            pass
+
+        index = {}
+        try:
+            with open(self._get_index_file(year, month), "r") as f:
+                for line in f:
+                    task_id, offset, length = line.split()
+                    index[task_id] = (int(offset), int(length))
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+
+        self._indexes[(year, month)] = index
+        return index
+
+    def _write_index(self, year, month, index):
+        index_file = self._get_index_file(year, month)
+        tmp_file = "%s.tmp.%d" % (index_file, os.getpid())
+        with open(tmp_file, "w") as f:
+            for task_id in sorted(index):
+                offset, length = index[task_id]
+                f.write("%s %d %d\n" % (task_id, offset, length))
+        os.rename(tmp_file, index_file)
@@ -0,0 +1,130 @@
+import cPickle as pickle
+import errno
+import os
+import time
+
+from tt import durations
+from tt import timelog
+from tt import utils
+
+
+class TaskCache(object):
+    """Persistent cache of parsed task files.
+
+    Each entry holds a task's name, status, parsed log and running duration
+    totals, keyed by task_id and validated against the (mtime, size) of the
+    task file, so a file that was changed behind our back (e.g. by `tt
+    edit`) is simply re-parsed.
+
+    The cache is sharded by the month the task was created in, so fetching
+    a single task only has to unpickle that month's shard:
+
+        state/cache/2011_01
+    """
+
+    # A file modified this recently may still change again within the same
+    # mtime tick without its size changing, so it isn't trusted to the cache
+    RACY_SECONDS = 2
+
+    # Bumped whenever the shape of an entry changes, so that shards written
+    # by an older tt are treated as cold rather than misread
+    FORMAT = 3
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._shards = {}
+        self._dirty_shards = set()
+
+    def get(self, task_id, task_file, stat=None):
+        """Return the cached (name, status, log, durations) for a task, or
+        None if it's not cached or the task file has changed since.
+        """
+        if stat is None:
+            stat = os.stat(task_file)
+        shard = self._get_shard(task_id)
+        entry = shard.get(task_id)
+        if entry is None:
+            return None
+
+        mtime, size, name, status, log, task_durations = entry
+        if mtime != stat.st_mtime or size != stat.st_size:
+            return None
+
+        return name, status, log.copy(), task_durations.copy()
+
+    def put(self, task_id, task_file, name, status, log, stat=None,
+            task_durations=None):
+        if stat is None:
+            stat = os.stat(task_file)
+        shard = self._get_shard(task_id)
+        if stat.st_mtime > time.time() - self.RACY_SECONDS:
+            # Drop any stale entry but don't trust the new one yet
+            if shard.pop(task_id, None) is not None:
+                self._dirty_shards.add(self._get_shard_key(task_id))
+            return
+
+        if isinstance(log, timelog.TimeLog):
+            log = log.copy()
+        else:
+            log = timelog.TimeLog(log)
+        if task_durations is None:
+            task_durations = durations.Durations(log)
+        shard[task_id] = (stat.st_mtime, stat.st_size, name, status, log,
+                          task_durations.copy())
+        self._dirty_shards.add(self._get_shard_key(task_id))
+
+    def prune(self, task_ids):
+        """Drop entries for every task not in `task_ids` from the shards
+        loaded so far
+        """
+        for shard_key, shard in self._shards.iteritems():
+            for task_id in shard.keys():
+                if task_id not in task_ids:
+                    del shard[task_id]
+                    self._dirty_shards.add(shard_key)
+
+    def save(self):
+        """Write out every shard that has changed"""
+        if not self._dirty_shards:
+            return
+
+        utils.mkdirs_easy(self.cache_dir)
+        for shard_key in self._dirty_shards:
+            shard_file = os.path.join(self.cache_dir, shard_key)
+            tmp_file = "%s.tmp.%d" % (shard_file, os.getpid())
+            with open(tmp_file, "wb") as f:
+                pickle.dump((self.FORMAT, self._shards[shard_key]), f,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, shard_file)
+
+        self._dirty_shards.clear()
+
+    def _get_shard_key(self, task_id):
+        # task_ids end in YYYY_MM_DD, see Task._generate_task_id
+        return task_id[-10:-3]
+
+    def _get_shard(self, task_id):
+        shard_key = self._get_shard_key(task_id)
+        try:
+            return self._shards[shard_key]
+        except KeyError:
+            pass
+
+        shard_file = os.path.join(self.cache_dir, shard_key)
+        try:
+            with open(shard_file, "rb") as f:
+                shard_format, shard = pickle.load(f)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            shard = {}
+        except (EOFError, ValueError, TypeError, AttributeError,
+                pickle.UnpicklingError):
+            # A corrupt shard is just a cold one
+            shard = {}
+        else:
+            if shard_format != self.FORMAT:
+                shard = {}
+
+        self._shards[shard_key] = shard
+        return shard
@@ -0,0 +1,684 @@
+"""The `tt` command-line, run by bin/tt directly or by a `tt serve` daemon on
+behalf of bin/tt.
+"""
+# NOTE: `tt start` and `tt stop` get run from editor and window-manager hooks
+# many times an hour, so keep module-level imports to a minimum; commands
+# import what they need themselves.
+import sys
+
+from tt import exceptions
+
+
+def init(manager, argv):
+    """Create a new repo, kept as plain files unless --sqlite is given. With
+    a directory, the repo is made in it for the project there, e.g.
+            tt init .
+    """
+    import os
+    from tt import projects
+
+    args = argv[2:]
+    backend = None
+    if "--sqlite" in args:
+        args.remove("--sqlite")
+        backend = "sqlite"
+    if len(args) > 1:
+        die("usage: tt init [--sqlite] [<dir>]")
+
+    if args:
+        project_dir = os.path.abspath(os.path.expanduser(args[0]))
+        manager = make_manager(os.path.join(project_dir, ".tt"),
+                               backend=backend)
+    elif backend is not None:
+        manager = make_manager(manager.tt_dir, backend=backend)
+    manager.initialize_state()
+
+    # The directories below now use the new repo
+    found = projects.Projects()
+    found.forget(os.path.dirname(os.path.abspath(manager.tt_dir)))
+    found.add(manager.tt_dir)
+
+
+def add(manager, argv):
+    """Add tasks to tt
+
+    Tasks can be added two ways:
+
+    1. Directly on the command-line as part of the arguments list, e.g.
+            tt add This is a task
+
+    2. As list of tasks read from stdin, e.g.
+            tt add < bunch_of_tasks.txt
+    """
+    if len(argv) > 2:
+        # 1. arg list
+        name = ' '.join(argv[2:])
+        names = [name]
+    else:
+        # 2. stdin
+        lines = sys.stdin.readlines()
+        names = [l.strip() for l in lines if l.strip()]
+
+    if not names:
+        die("Nothing to add.")
+
+    if len(names) == 1:
+        try:
+            manager.add_task(names[0])
+        except exceptions.TTException, e:
+            die(e)
+        return
+
+    tasks, failures = manager.add_tasks(names)
+    for name, e in failures:
+        print >>sys.stderr, "ERROR: '%s' not added: %s" % (name, e)
+
+    if failures:
+        die("%d of %d tasks not added" % (len(failures), len(names)))
+
+
+def print_simple_status(manager, status):
+    tasks = safe_get_tasks_by_status(manager, status)
+    print status.upper()
+    for task in tasks:
+        print " - %s" % task.name
+
+
+def print_timed_status(manager, status):
+    from tt import reports
+
+    sink = reports.TextSink(sys.stdout, " - %(name)s (%(duration)s)",
+                            header=status.upper())
+    try:
+        sink.write(reports.timed_status(manager, status))
+    except exceptions.DirectoryNotFound, e:
+        die(e)
+
+
+def ls(manager, argv):
+    """List tasks by status. With --all-projects, list those of every
+    project in turn
+    """
+    if "--all-projects" in argv[2:]:
+        all_projects_ls()
+        return
+
+    for status in ("started", "stopped", "pending", "done"):
+        if status == "pending":
+            print_simple_status(manager, status)
+        else:
+            print_timed_status(manager, status)
+        print
+
+
+def all_projects_ls():
+    from tt import multi
+    from tt import projects
+
+    tt_dirs = projects.Projects().get_all()
+    for name, tt_dir in zip(multi.get_repo_names(tt_dirs), tt_dirs):
+        print "%s (%s)" % (name, tt_dir)
+        manager = make_manager(tt_dir)
+        try:
+            ls(manager, [])
+        except exceptions.TTException, e:
+            print >>sys.stderr, "WARNING: skipped %s: %s" % (name, e)
+        manager.save_cache()
+
+
+def start(manager, task_id):
+    """Starts a task """
+    task = safe_resolve_task(manager, task_id, ("pending", "stopped"))
+    manager.start_task(task)
+
+
+def stop(manager):
+    try:
+        manager.stop_current_task()
+    except exceptions.TTException, e:
+        die(e)
+
+def done(manager, task_id):
+    task = safe_resolve_task(manager, task_id, ("started", "stopped"))
+    manager.done_task(task)
+
+
+def close(manager):
+    manager.close_done_tasks()
+
+
+def rm(manager, task_id):
+    # Deleting a task is too much to leave to a guess
+    task = safe_resolve_task(manager, task_id, most_recent=False)
+    manager.delete_task(task)
+
+
+def report(manager, argv):
+    """Report on the time worked on a date or range of dates
+
+    With --csv or --json, every report prints a row for each task worked on
+    each date in its range instead, as the rows are computed.
+
+    With --root, once or more, the report covers every repo found under
+    those directories instead of this one, broken down by repo, e.g.
+            tt report --root /srv/tt week
+    With --all-projects, it covers every project's repo on this machine.
+
+    With --status, once or more, only tasks now in those statuses count,
+    and with --weekdays only the time worked Monday to Friday, e.g.
+            tt report --status done --weekdays month
+    """
+    import datetime
+    from tt import utils
+    from tt.task import Task
+
+    args = argv[2:]
+    fmt = "text"
+    for flag in ("--csv", "--json"):
+        if flag in args:
+            args.remove(flag)
+            fmt = flag[2:]
+    all_projects = "--all-projects" in args
+    if all_projects:
+        args.remove("--all-projects")
+    roots = []
+    while "--root" in args:
+        i = args.index("--root")
+        roots.extend(args[i + 1:i + 2])
+        del args[i:i + 2]
+    filters = {}
+    while "--status" in args:
+        i = args.index("--status")
+        filters.setdefault("statuses", []).extend(args[i + 1:i + 2])
+        del args[i:i + 2]
+    for status in filters.get("statuses", []):
+        if status not in Task.STATUSES:
+            die("'%s' is not a status (%s)" % (status,
+                                                ", ".join(Task.STATUSES)))
+    if "--weekdays" in args:
+        args.remove("--weekdays")
+        filters["weekdays"] = range(5)
+    if len(args) != 1:
+        die("usage: tt report [--csv|--json] [--root <dir>|--all-projects] "
+            "[--status <status>] [--weekdays] <date_str>")
+    date_str = args[0]
+
+    today = utils.get_now().date()
+    if date_str == "week":
+        start = today - datetime.timedelta(days=6)
+        end = today
+        text_report = weekly_report
+    elif date_str == "today":
+        start = end = today
+        text_report = daily_report
+    elif date_str == "yesterday":
+        start = end = today - datetime.timedelta(days=1)
+        text_report = daily_report
+    elif date_str == "month":
+        start = today.replace(day=1)
+        end = today
+        text_report = range_report
+    elif date_str == "year":
+        start = today.replace(month=1, day=1)
+        end = today
+        text_report = range_report
+    elif ".." in date_str:
+        start_str, end_str = date_str.split("..", 1)
+        start = safe_get_date_from_str(start_str)
+        end = safe_get_date_from_str(end_str)
+        text_report = range_report
+    elif len(date_str) == len("YYYY-MM"):
+        start = safe_get_date_from_str("%s-01" % date_str)
+        end = utils.get_last_day_of_month(start)
+        text_report = range_report
+    elif len(date_str) == len("YYYY"):
+        start = safe_get_date_from_str("%s-01-01" % date_str)
+        end = start.replace(month=12, day=31)
+        text_report = range_report
+    else:
+        start = end = safe_get_date_from_str(date_str)
+        text_report = daily_report
+
+    if all_projects or roots:
+        multi_report(make_multi_manager(roots, all_projects), start, end,
+                     text_report, fmt, filters)
+    elif fmt == "text":
+        text_report(manager, start, end, filters)
+    else:
+        table_report(manager, start, end, fmt, filters)
+
+
+def weekly_report(manager, start, end, filters):
+    from tt import reports
+
+    days_back = (end - start).days + 1
+    rows = reports.weekly(manager, end, days_back=days_back, **filters)
+    reports.TextSink(sys.stdout, "%(date)s: %(duration)s").write(rows)
+
+
+def range_report(manager, start, end, filters):
+    """Report on each day worked between `start` and `end`, followed by the
+    total for each task over the whole range
+    """
+    from tt import reports
+    from tt import utils
+
+    print "%s..%s" % (start, end)
+    tally = reports.Tally()
+    rows = tally.count(reports.by_date(manager, utils.date_range(start, end),
+                                       **filters))
+    reports.TextSink(sys.stdout, "%(date)s: %(duration)s").write(
+        reports.group_by(rows, "date"))
+
+    print
+    sink = reports.TextSink(sys.stdout, " - %(name)s (%(duration)s)",
+                            footer="\nTotal Duration: %(total)s")
+    sink.write(tally.rows())
+
+
+def daily_report(manager, start, end, filters):
+    from tt import reports
+
+    sink = reports.TextSink(sys.stdout, " - %(name)s (%(duration)s)",
+                            header=start,
+                            footer="\nTotal Duration: %(total)s")
+    sink.write(reports.daily(manager, start, **filters))
+
+
+def table_report(manager, start, end, fmt, filters):
+    from tt import reports
+    from tt import utils
+
+    fields = ("date",) + reports.TASK_FIELDS
+    sink = reports.make_sink(fmt, sys.stdout, fields)
+    sink.write(reports.by_date(manager, utils.date_range(start, end),
+                               **filters))
+
+
+def make_multi_manager(roots, all_projects=False):
+    """Return a MultiTaskManager for the repos under `roots`, or for every
+    project's
+    """
+    import os
+    from tt import multi
+    from tt import projects
+
+    pool_type = os.environ.get("TT_POOL", "thread")
+    try:
+        if all_projects:
+            manager = multi.MultiTaskManager(projects.Projects().get_all(),
+                                             pool_type=pool_type)
+        else:
+            manager = multi.MultiTaskManager.discover(roots,
+                                                      pool_type=pool_type)
+    except ValueError, e:
+        die(e)
+    if not manager.tt_dirs and all_projects:
+        die("No tt projects found")
+    elif not manager.tt_dirs:
+        die("No tt repos found under %s" % ", ".join(roots))
+    return manager
+
+
+def multi_report(manager, start, end, text_report, fmt, filters):
+    """Report on all the repos of MultiTaskManager `manager` together. Text
+    reports are laid out as `text_report` would be for one repo, then broken
+    down by repo and task.
+    """
+    from tt import reports
+    from tt import utils
+
+    dates = list(utils.date_range(start, end))
+    if text_report == weekly_report:
+        dates.reverse()
+    rows = reports.apply_filters(manager.iter_rows(dates), **filters)
+
+    if fmt == "text":
+        multi_text_report(rows, dates, start, end, text_report)
+    else:
+        fields = ("date", "repo") + reports.TASK_FIELDS
+        reports.make_sink(fmt, sys.stdout, fields).write(rows)
+
+    for name, message in manager.errors:
+        print >>sys.stderr, "WARNING: skipped %s: %s" % (name, message)
+
+
+def multi_text_report(rows, dates, start, end, text_report):
+    import datetime
+    from tt import reports
+
+    repo_tally = reports.Tally(keys=("repo",), fields=())
+    task_tally = reports.Tally(keys=("repo", "task_id"))
+    rows = task_tally.count(repo_tally.count(rows))
+    if text_report == daily_report:
+        print start
+        for _ in rows:
+            pass
+    else:
+        if text_report == range_report:
+            print "%s..%s" % (start, end)
+        sink = reports.TextSink(sys.stdout, "%(date)s: %(duration)s")
+        sink.write(reports.group_by(rows, "date", keys=dates))
+        print
+
+    tasks_by_repo = {}
+    for row in task_tally.rows():
+        tasks_by_repo.setdefault(row["repo"], []).append(row)
+    total = datetime.timedelta()
+    for row in repo_tally.rows():
+        total += row["duration"]
+        header = "%s: %s" % (row["repo"],
+                             reports.format_duration(row["duration"]))
+        sink = reports.TextSink(sys.stdout, " - %(name)s (%(duration)s)",
+                                header=header)
+        sink.write(tasks_by_repo[row["repo"]])
+    print
+    print "Total Duration: %s" % reports.format_duration(total)
+
+
+def reindex(manager):
+    manager.rebuild_date_index()
+    manager.rebuild_journal()
+
+
+def export(manager, argv):
+    """Copy every task into a new repo of the given kind, e.g.
+            tt export --sqlite ~/tt-db
+    """
+    import os
+
+    if len(argv) != 4 or argv[2] not in ("--sqlite", "--files"):
+        die("usage: tt export --sqlite|--files <path>")
+
+    other = make_manager(argv[3], backend=argv[2][2:])
+    if os.path.exists(other.tt_dir):
+        die("'%s' already exists" % other.tt_dir)
+    other.initialize_state()
+    imported, skipped = other.import_tasks(manager.get_all_tasks())
+    print "Exported %d tasks to %s" % (len(imported), other.tt_dir)
+
+
+def import_repo(manager, path):
+    """Copy the tasks of the repo at `path`, of either kind, skipping any
+    already here
+    """
+    import os
+
+    other = make_manager(path)
+    if not os.path.exists(other.tt_dir):
+        die("'%s' not found" % other.tt_dir)
+    try:
+        imported, skipped = manager.import_tasks(other.get_all_tasks())
+    except exceptions.StatusChangeException, e:
+        die(e)
+    print "Imported %d tasks, skipped %d already here" % (len(imported),
+                                                        len(skipped))
+
+
+def at(manager, argv):
+    """Show what was being worked on at a given time, e.g.
+            tt at 15:00
+            tt at 2011-01-07 15:00
+    """
+    import datetime
+    from tt import utils
+
+    time_str = " ".join(argv[2:])
+    if len(time_str) == len("HH:MM"):
+        today = utils.get_now().date()
+        time_str = "%s %s" % (today, time_str)
+    try:
+        dt = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M")
+    except ValueError:
+        die("usage: tt at [YYYY-MM-DD] HH:MM")
+
+    try:
+        task_id = manager.get_task_id_at(dt)
+    except exceptions.TTException, e:
+        die(e)
+
+    if task_id:
+        task = safe_get_task(manager, task_id)
+        print "%s: %s" % (dt, task.name)
+    else:
+        print "%s: nothing started" % dt
+
+
+def switches(manager, argv):
+    """Report how many times tasks were switched on a date, by hour"""
+    import datetime
+    from tt import utils
+
+    if len(argv) > 2:
+        date = safe_get_date_from_str(argv[2])
+    else:
+        date = utils.get_now().date()
+
+    start = utils.date2datetime(date)
+    end = start + datetime.timedelta(days=1)
+    try:
+        switches_by_hour = manager.get_context_switches(start, end)
+    except exceptions.TTException, e:
+        die(e)
+
+    print date
+    for hour in sorted(switches_by_hour):
+        print " %s %d" % (hour.strftime("%H:00"), switches_by_hour[hour])
+
+    print
+    print "Total Switches: %d" % sum(switches_by_hour.values())
+
+
+def fsck(manager, argv):
+    """Check the status table against the task files and repair it, or
+    just report with -n
+    """
+    repair = "-n" not in argv[2:]
+    report = manager.rebuild_state(repair=repair)
+    verb = "Fixed" if repair else "Found"
+
+    for task_id, status in report.orphans:
+        print "%s orphaned %s link: %s" % (verb, status, task_id)
+    for task_id, old_status, new_status in report.misplaced:
+        if new_status:
+            print "%s %s link, should be %s: %s" % (
+                verb, old_status, new_status, task_id)
+        else:
+            print "%s stray %s link: %s" % (verb, old_status, task_id)
+    for task_id, status in report.unlinked:
+        print "%s missing %s link: %s" % (verb, status, task_id)
+    for task_id, message in report.invalid:
+        print "Invalid timelog in %s: %s" % (task_id, message)
+
+    print
+    print "Checked %d tasks" % report.num_tasks
+    for phase, seconds in report.timings:
+        print " %-18s %.3fs" % (phase, seconds)
+
+    if report.invalid:
+        sys.exit(1)
+
+
+def archive(manager, argv):
+    """Pack tasks closed more than `days` ago (90 by default) into the
+    archive
+    """
+    import datetime
+    from tt import utils
+
+    days = 90
+    if len(argv) > 2:
+        try:
+            days = int(argv[2])
+        except ValueError:
+            die("usage: tt archive [days]")
+
+    cutoff = utils.get_now().date() - datetime.timedelta(days=days)
+    task_ids = manager.archive_closed_tasks(cutoff)
+    print "Archived %d tasks closed before %s" % (len(task_ids), cutoff)
+
+
+def edit(manager, task_id):
+    import os
+
+    task = safe_resolve_task(manager, task_id)
+    task_file = manager.get_task_file(task)
+    if not os.path.exists(task_file):
+        die("'%s' is archived and can't be edited" % task.task_id)
+    os.system('vim %s' % task_file)
+
+    # The name may have changed
+    manager.reindex_task(task.task_id)
+
+
+def serve(manager):
+    """Run the daemon that later `tt ls`, `start`, `stop` and `report` calls
+    hand over to, until interrupted
+    """
+    from tt import daemon
+
+    try:
+        daemon.serve(manager)
+    except daemon.DaemonRunning, e:
+        die(e)
+
+
+def safe_get_task(manager, task_id):
+    try:
+        task = manager.get_task(task_id)
+        return task
+    except exceptions.BadTaskId, e:
+        die(e)
+
+
+def safe_resolve_task(manager, query, statuses=None, most_recent=True):
+    try:
+        return manager.resolve_task(query, statuses, most_recent)
+    except exceptions.BadTaskId, e:
+        die(e)
+
+
+def safe_get_date_from_str(date_str):
+    from tt import utils
+
+    try:
+        return utils.get_date_from_str(date_str)
+    except ValueError:
+        die("'%s' is not a valid date (YYYY-MM-DD)" % date_str)
+
+
+def safe_get_tasks_by_status(manager, status):
+    try:
+        tasks = manager.get_tasks_by_status(status)
+        return tasks
+    except exceptions.DirectoryNotFound, e:
+        die(e)
+
+
+def die(msg):
+    print >>sys.stderr, "ERROR: %s" % msg
+    sys.exit(1)
+
+
+def usage():
+    cmd = "tt"
+    print "%s <%s>" % (cmd, "|".join(ACTIONS))
+
+
+# Maps each action to its handler and what the handler takes from the
+# command-line besides the manager: nothing, the whole argv, or the single
+# named argument following the action.
+COMMANDS = {
+    "init": (init, "argv"),
+    "add": (add, "argv"),
+    "ls": (ls, "argv"),
+    "start": (start, "task_id"),
+    "stop": (stop, None),
+    "done": (done, "task_id"),
+    "close": (close, None),
+    "rm": (rm, "task_id"),
+    "report": (report, "argv"),
+    "edit": (edit, "task_id"),
+    "reindex": (reindex, None),
+    "at": (at, "argv"),
+    "switches": (switches, "argv"),
+    "archive": (archive, "argv"),
+    "gc": (archive, "argv"),
+    "fsck": (fsck, "argv"),
+    "serve": (serve, None),
+    "export": (export, "argv"),
+    "import": (import_repo, "path"),
+}
+
+ACTIONS = ("init", "add", "start", "close", "done", "edit", "stop", "ls",
+           "report", "rm", "reindex", "at", "switches", "archive", "gc",
+           "fsck", "serve", "export", "import")
+
+# The commands a running daemon answers in place of bin/tt
+DAEMON_ACTIONS = ("ls", "start", "stop", "report")
+
+
+def make_manager(tt_dir, manager_class=None, backend=None):
+    import os
+
+    if manager_class is None:
+        from tt.task_manager import TaskManager as manager_class
+
+    # Bulk task loading can be spread over a pool of workers, which mostly
+    # helps on network filesystems
+    workers = int(os.environ.get("TT_WORKERS", 0))
+    pool_type = os.environ.get("TT_POOL", "thread")
+
+    try:
+        return manager_class(tt_dir, workers=workers, pool_type=pool_type,
+                             backend=backend)
+    except ValueError, e:
+        die(e)
+
+
+def run(manager, argv):
+    """Run the command in `argv` against `manager`, as `main` would"""
+    if len(argv) < 2:
+        usage()
+        sys.exit(1)
+
+    action = argv[1]
+    try:
+        command, arg_name = COMMANDS[action]
+    except KeyError:
+        die("Unrecognized command '%s'" % action)
+
+    if arg_name is None:
+        args = ()
+    elif arg_name == "argv":
+        args = (argv,)
+    elif len(argv) > 2:
+        args = (argv[2],)
+    else:
+        die("usage: tt %s <%s>" % (action, arg_name))
+
+    try:
+        command(manager, *args)
+    except exceptions.TTException, e:
+        die(e)
+
+
+def main():
+    from tt import projects
+
+    tt_dir = projects.Projects().find()
+
+    # The daemon only knows its own repo
+    if (len(sys.argv) > 1 and sys.argv[1] in DAEMON_ACTIONS and
+            "--root" not in sys.argv and "--all-projects" not in sys.argv):
+        from tt import client
+
+        # Hand the command to a running daemon, which already has every
+        # task loaded, or carry on and run it here if there isn't one
+        status = client.call(tt_dir, sys.argv)
+        if status is not None:
+            sys.exit(status)
+
+    manager = make_manager(tt_dir)
+    run(manager, sys.argv)
+    manager.save_cache()
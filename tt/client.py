@@ -0,0 +1,65 @@
+"""The bin/tt side of a `tt serve` daemon, see tt.daemon.
+
+This is imported on every `tt ls`, `start`, `stop` and `report`, so it must
+not import anything beyond the standard library's basics.
+
+The protocol is deliberately dumb. The client sends the command's arguments
+NUL-separated and shuts down its side; the daemon runs the command with
+stdout and stderr captured and replies with
+
+    <exit status> <length of stdout>\\n<stdout><stderr>
+"""
+import os
+import socket
+import sys
+
+
+def get_socket_file(tt_dir):
+    return os.path.join(os.path.expanduser(tt_dir), "state", "daemon.sock")
+
+
+def call(tt_dir, argv):
+    """Run `argv` on the daemon for `tt_dir`, copying its output to ours.
+
+    Returns the command's exit status, or None if no daemon is listening,
+    in which case nothing was run.
+    """
+    socket_file = get_socket_file(tt_dir)
+    if not os.path.exists(socket_file):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_file)
+    except socket.error:
+        # A daemon that died without cleaning up
+        sock.close()
+        return None
+
+    try:
+        sock.sendall("\0".join(argv[1:]))
+        sock.shutdown(socket.SHUT_WR)
+        response = read_all(sock)
+    finally:
+        sock.close()
+
+    # The command may have run, so it mustn't be run again here
+    try:
+        header, output = response.split("\n", 1)
+        status, stdout_len = [int(n) for n in header.split()]
+    except ValueError:
+        print >>sys.stderr, "ERROR: lost connection to tt daemon"
+        return 1
+
+    sys.stdout.write(output[:stdout_len])
+    sys.stderr.write(output[stdout_len:])
+    return status
+
+
+def read_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return "".join(chunks)
+        chunks.append(chunk)
@@ -0,0 +1,216 @@
+"""Columnar duration engine for analytics over many tasks.
+
+Rather than walking each task's (status, datetime) tuples, the timelogs of
+all the tasks are loaded once into flat NumPy arrays (seconds since the
+epoch, a status code and the task's row) and the intervals are worked out
+for all of them at once. The results follow the same rules as
+Task.get_duration and Task.get_duration_for_date, including splitting spans
+that run over midnight between the dates they touch.
+
+NumPy is optional; `available()` says whether this module can be used.
+"""
+import array
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from tt import exceptions
+from tt import timelog
+from tt import utils
+
+
+EPOCH = utils.EPOCH
+DAY = 86400
+HOUR = 3600
+
+# The same codes the TimeLog uses, so its arrays can be taken as they are
+STARTED = timelog.STATUS_CODES["started"]
+STOPPED = timelog.STATUS_CODES["stopped"]
+
+
+def available():
+    return numpy is not None
+
+
+def _to_seconds(dt):
+    delta = dt - EPOCH
+    return delta.days * DAY + delta.seconds + delta.microseconds / 1e6
+
+
+def _to_date(day):
+    return EPOCH.date() + datetime.timedelta(days=int(day))
+
+
+class TimelogColumns(object):
+    """The timelogs of `tasks` as columns, one row per timelog entry.
+
+    Durations come back as seconds in NumPy arrays, with one row per task in
+    the order `tasks` were given (see `task_ids`).
+    """
+
+    def __init__(self, tasks):
+        if numpy is None:
+            raise exceptions.TTException(
+                "The columnar engine requires NumPy")
+
+        self.task_ids = []
+        rows = []
+        codes = array.array('b')
+        times = array.array('l')
+        for row, task in enumerate(tasks):
+            self.task_ids.append(task.task_id)
+            # A Task's log is a TimeLog, whose arrays are already columns
+            log = task.log
+            rows.extend([row] * len(log))
+            codes.extend(log.codes)
+            times.extend(log.times)
+
+        self.rows = numpy.array(rows, dtype=numpy.int64)
+        self.codes = numpy.frombuffer(codes, dtype=numpy.int8)
+        self.times = numpy.frombuffer(times, dtype="l").astype(
+            numpy.float64)
+        self.days = numpy.floor(self.times / DAY).astype(numpy.int64)
+
+    def get_durations(self, boundary):
+        """Return each task's duration, as Task.get_duration with an
+        unclosed start running up to `boundary`
+        """
+        boundaries = numpy.empty(len(self.times))
+        boundaries.fill(_to_seconds(boundary))
+        groups, starts, ends = self._get_intervals(
+            numpy.arange(len(self.times)), self.rows, boundaries)
+        return numpy.bincount(groups, weights=ends - starts,
+                              minlength=len(self.task_ids))
+
+    def get_durations_by_date(self, start, end, now):
+        """Return (dates, matrix), where matrix[row, col] is the duration of
+        task `row` on dates[col], as Task.get_duration_for_date. `start` and
+        `end` are inclusive dates; `now` is where a task that's still running
+        stops counting.
+        """
+        start_day, num_days, rows, days, starts, ends = \
+            self._get_day_intervals(start, end, now)
+        matrix = numpy.bincount(rows * num_days + (days - start_day),
+                                weights=ends - starts,
+                                minlength=len(self.task_ids) * num_days)
+        dates = [_to_date(start_day + i) for i in xrange(num_days)]
+        return dates, matrix.reshape((len(self.task_ids), num_days))
+
+    def get_durations_by_hour(self, start, end, now):
+        """Return a matrix where matrix[row, hour] is the time task `row` was
+        worked on during that hour of the day, summed over the dates from
+        `start` to `end`, inclusive
+        """
+        start_day, num_days, rows, days, starts, ends = \
+            self._get_day_intervals(start, end, now)
+        # The pieces never cross midnight, so each one can be laid over the
+        # hours of its own day
+        starts = starts - days * DAY
+        ends = ends - days * DAY
+
+        matrix = numpy.zeros((len(self.task_ids), 24))
+        for hour in xrange(24):
+            overlap = (numpy.minimum(ends, (hour + 1) * HOUR) -
+                       numpy.maximum(starts, hour * HOUR))
+            matrix[:, hour] = numpy.bincount(
+                rows, weights=numpy.maximum(overlap, 0),
+                minlength=len(self.task_ids))
+        return matrix
+
+    def _get_day_intervals(self, start, end, now):
+        """Return the spans worked, split at midnight into one piece per
+        date from `start` to `end`, as (start_day, num_days, rows, days,
+        starts, ends)
+        """
+        start_day = (start - EPOCH.date()).days
+        num_days = (end - start).days + 1
+        end_day = start_day + num_days - 1
+
+        boundaries = numpy.empty(len(self.times))
+        boundaries.fill(_to_seconds(now))
+        rows, starts, ends = self._get_intervals(
+            numpy.arange(len(self.times)), self.rows, boundaries)
+        # A task started in the future hasn't run yet
+        ends = numpy.maximum(starts, ends)
+
+        # Clip each span to the window, dropping those outside of it
+        first_days = numpy.maximum(
+            numpy.floor(starts / DAY).astype(numpy.int64), start_day)
+        last_days = numpy.minimum(
+            numpy.floor(ends / DAY).astype(numpy.int64), end_day)
+        keep = first_days <= last_days
+        rows = rows[keep]
+        starts = starts[keep]
+        ends = ends[keep]
+        first_days = first_days[keep]
+        num_pieces = last_days[keep] - first_days + 1
+
+        # Repeat each span once for every date it touches, then clip each
+        # copy to its own date
+        spans = numpy.repeat(numpy.arange(len(rows)), num_pieces)
+        offsets = numpy.cumsum(num_pieces) - num_pieces
+        days = first_days[spans] + (numpy.arange(len(spans)) -
+                                    offsets[spans])
+        piece_starts = numpy.maximum(starts[spans], days * DAY)
+        piece_ends = numpy.minimum(ends[spans], (days + 1) * DAY)
+        return (start_day, num_days, rows[spans], days, piece_starts,
+                piece_ends)
+
+    def _get_intervals(self, entries, groups, boundaries):
+        """Return the (groups, starts, ends) of the intervals in each group
+        of `entries`, following the rules of durations.Durations.
+
+        `groups` and `boundaries` run parallel to `entries`; the boundary of
+        a group's last entry is where an unclosed start ends.
+        """
+        # Stable, so each group keeps its log order
+        order = numpy.argsort(groups, kind="mergesort")
+        entries = entries[order]
+        groups = groups[order]
+        boundaries = boundaries[order]
+        times = self.times[entries]
+        codes = self.codes[entries]
+
+        new_group = numpy.ones(len(groups), dtype=bool)
+        new_group[1:] = groups[1:] != groups[:-1]
+        last_in_group = numpy.ones(len(groups), dtype=bool)
+        last_in_group[:-1] = new_group[1:]
+
+        started = codes == STARTED
+        stopped = codes == STOPPED
+
+        # In a valid log, a task is running exactly when the entry before
+        # was a 'started', so every interval is decided by an entry and the
+        # one before it
+        after_start = numpy.zeros(len(groups), dtype=bool)
+        after_start[1:] = started[:-1]
+        after_start &= ~new_group
+
+        invalid = numpy.flatnonzero(after_start & ~stopped)
+        if len(invalid):
+            task_id = self.task_ids[self.rows[entries[invalid[0]]]]
+            raise exceptions.StatusChangeException(
+                "'%s': 'started' entry must have matching 'stopped' entry or "
+                "be the last entry in the log" % task_id)
+
+        # 1. bounded interval
+        bounded = numpy.flatnonzero(stopped & after_start)
+        # 2a. unbounded interval - unclosed start
+        unclosed_start = numpy.flatnonzero(started & last_in_group)
+        # 2b. unbounded interval - unclosed stop
+        unclosed_stop = numpy.flatnonzero(stopped & ~after_start)
+
+        starts = numpy.concatenate([
+            times[bounded - 1],
+            times[unclosed_start],
+            numpy.floor(times[unclosed_stop] / DAY) * DAY])
+        ends = numpy.concatenate([
+            times[bounded],
+            boundaries[unclosed_start],
+            times[unclosed_stop]])
+        groups = numpy.concatenate([
+            groups[bounded], groups[unclosed_start], groups[unclosed_stop]])
+        return groups, starts, ends
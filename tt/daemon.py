@@ -0,0 +1,214 @@
+"""A resident `tt` that answers commands over a Unix socket.
+
+Every bin/tt run otherwise pays for starting a fresh TaskManager: listing
+status directories, unpickling cache shards and re-validating tasks. `tt
+serve` keeps one TaskManager alive instead, with every task loaded into its
+task cache up front, and bin/tt hands `ls`, `start`, `stop` and `report` to
+it, through tt.client, whenever its socket is there, falling back to running
+the command itself when it isn't.
+
+The daemon doesn't trust its memory blindly: task files are still checked
+against their (mtime, size) on every load, as the task cache always does,
+and status directory listings are only reused while the directory's mtime
+is unchanged. Anything done behind its back, by `tt edit`, `tt add` or a
+hand edit, is picked up on the next request.
+"""
+import errno
+import os
+import socket
+import sys
+import time
+
+from tt import cache
+from tt import client
+from tt import exceptions
+from tt import task_manager
+
+
+class DaemonRunning(exceptions.TTException):
+    pass
+
+
+class ResidentTaskManager(task_manager.TaskManager):
+    """A TaskManager for a long-running process. It remembers each status
+    directory's listing until the directory's mtime changes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        task_manager.TaskManager.__init__(self, *args, **kwargs)
+        self._listings = {}
+
+    def get_task_ids_by_status(self, status):
+        if self.backend != "files":
+            # The database is indexed already
+            return task_manager.TaskManager.get_task_ids_by_status(
+                self, status)
+
+        status_dir = self.storage._get_status_dir(status)
+        try:
+            mtime = os.stat(status_dir).st_mtime
+        except OSError:
+            return task_manager.TaskManager.get_task_ids_by_status(
+                self, status)
+
+        listing = self._listings.get(status)
+        if listing is not None and listing[0] == mtime:
+            return list(listing[1])
+
+        task_ids = task_manager.TaskManager.get_task_ids_by_status(
+            self, status)
+        # As with the task cache, a directory changed this recently could
+        # change again without its mtime moving on
+        if mtime < time.time() - cache.TaskCache.RACY_SECONDS:
+            self._listings[status] = (mtime, task_ids)
+        return list(task_ids)
+
+
+class Daemon(object):
+
+    # Connections are served one at a time, so a client that connects and
+    # then never finishes its request mustn't hold up everyone else
+    CONNECTION_TIMEOUT = 5.0
+
+    def __init__(self, manager, socket_file=None):
+        self.manager = manager
+        if socket_file is None:
+            socket_file = client.get_socket_file(manager.tt_dir)
+        self.socket_file = socket_file
+        self.sock = None
+
+    def bind(self):
+        """Start listening, taking over the socket of a daemon that's no
+        longer running
+        """
+        if os.path.exists(self.socket_file):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_file)
+            except socket.error:
+                os.unlink(self.socket_file)
+            else:
+                raise DaemonRunning("tt daemon already running on '%s'" %
+                                    self.socket_file)
+            finally:
+                probe.close()
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the repo's owner gets to run commands on it
+        umask = os.umask(0077)
+        try:
+            self.sock.bind(self.socket_file)
+        finally:
+            os.umask(umask)
+        self.sock.listen(16)
+
+    def close(self):
+        sock = self.sock
+        if sock is None:
+            return
+        self.sock = None
+        try:
+            # Wakes up an accept() waiting in another thread
+            sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        sock.close()
+        try:
+            os.unlink(self.socket_file)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def preload(self):
+        """Load every task, so the first requests find them cached"""
+        for task in self.manager.get_all_tasks():
+            pass
+        self.manager.save_cache()
+
+    def serve_forever(self):
+        while self.sock is not None:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if self.sock is None:
+                    # Closed from another thread or a signal handler
+                    return
+                raise
+            conn.settimeout(self.CONNECTION_TIMEOUT)
+            try:
+                self.handle(conn)
+            except socket.error:
+                # The client gave up waiting, or we gave up on it (a
+                # socket.timeout is a socket.error); nothing to tell it
+                pass
+            finally:
+                conn.close()
+
+    def handle(self, conn):
+        request = client.read_all(conn)
+        if not request:
+            # Just checking we're here, see bind()
+            return
+        argv = ["tt"] + request.split("\0")
+        status, stdout, stderr = self.run(argv)
+        conn.sendall("%d %d\n%s%s" % (status, len(stdout), stdout, stderr))
+
+    def run(self, argv):
+        """Run a command as bin/tt would, returning (exit status, stdout,
+        stderr)
+        """
+        import StringIO
+        import traceback
+        from tt import cli
+
+        if len(argv) < 2 or argv[1] not in cli.DAEMON_ACTIONS:
+            return 1, "", "ERROR: the tt daemon doesn't run '%s'\n" % (
+                " ".join(argv[1:2]))
+
+        real_stdout, real_stderr = sys.stdout, sys.stderr
+        sys.stdout = StringIO.StringIO()
+        sys.stderr = StringIO.StringIO()
+        status = 0
+        try:
+            try:
+                cli.run(self.manager, argv)
+            except SystemExit, e:
+                status = e.code or 0
+            except Exception:
+                # Keep serving; the trace goes to the daemon's own stderr
+                traceback.print_exc(file=real_stderr)
+                print >>sys.stderr, "ERROR: tt daemon failed to run command"
+                status = 1
+            stdout = sys.stdout.getvalue()
+            stderr = sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = real_stdout, real_stderr
+
+        self.manager.save_cache()
+        return status, stdout, stderr
+
+
+def serve(manager):
+    """Serve the repo of `manager` until interrupted or sent SIGTERM"""
+    import signal
+
+    resident = ResidentTaskManager(manager.tt_dir, workers=manager.workers,
+                                   pool_type=manager.pool_type,
+                                   lock_timeout=manager.lock_timeout,
+                                   backend=manager.backend)
+    daemon = Daemon(resident)
+    daemon.bind()
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        daemon.preload()
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
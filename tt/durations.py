@@ -0,0 +1,231 @@
+import array
+import bisect
+import datetime
+
+from tt import exceptions
+from tt import utils
+
+
+DAY = 86400
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _to_seconds(dt):
+    """Seconds since the epoch, keeping the microseconds of a query bound
+    such as now
+    """
+    return utils.datetime_to_seconds(dt) + dt.microsecond / 1e6
+
+
+def _get_overlap(start, end, window_start, window_end):
+    """Return how many seconds of start..end fall within
+    window_start..window_end
+    """
+    return max(min(end, window_end) - max(start, window_start), 0)
+
+
+class Durations(object):
+    """The time a task was worked, as a sorted list of (start, end) spans.
+
+    The spans are built in one pass over the timelog, and then kept up to
+    date as entries are appended. Each is one of:
+
+    1. A bounded interval, a 'started' followed by its 'stopped'.
+
+    2. An unbounded interval, either a 'started' that's the last entry in
+       the log, which runs up to now, or a 'stopped' with no 'started'
+       before it, which runs from the midnight before.
+
+    Anything else after a 'started' is an invalid interval, a broken log
+    that queries raise StatusChangeException for. They're stored with the
+    task in the task cache, which drops them along with the log whenever
+    the task file changes.
+
+    Alongside the spans is a running total of their lengths, so the time
+    worked in any window is found with a couple of bisects: the spans
+    wholly inside the window come from the running total, and only the two
+    at its edges need clipping. A 'started' that hasn't been stopped yet is
+    kept aside as `running` and runs up to whatever "now" the query gives.
+
+    Like the timelog, times are kept as seconds since the epoch in arrays and
+    only turned into datetimes and timedeltas on the way out.
+    """
+
+    __slots__ = ("starts", "ends", "totals", "running", "invalid", "ordered")
+
+    def __init__(self, log=()):
+        self.starts = array.array('l')
+        self.ends = array.array('l')
+        self.totals = array.array('l')
+        self.running = None
+        # When the log breaks the interval rules, the time of the entry that
+        # broke them. Spans stop there, so nothing after it can be answered.
+        self.invalid = None
+        # Hand-edited logs can be out of order or overlap, in which case
+        # the spans can't be bisected and queries scan them all
+        self.ordered = True
+
+        if hasattr(log, "iter_seconds"):
+            entries = log.iter_seconds()
+        else:
+            entries = ((status, utils.datetime_to_seconds(dt))
+                       for status, dt in log)
+        for status, seconds in entries:
+            self._add(status, seconds)
+
+    def add(self, status, dt):
+        self._add(status, utils.datetime_to_seconds(dt))
+
+    def _add(self, status, seconds):
+        if self.invalid is not None:
+            return
+
+        if status == "started" and self.running is None:
+            self.running = seconds
+        elif self.running is not None and status == "stopped":
+            # bounded interval
+            self._add_span(self.running, seconds)
+            self.running = None
+        elif self.running is None and status == "stopped":
+            # unbounded interval - unclosed stop, counted from midnight
+            self._add_span(seconds - seconds % DAY, seconds)
+        elif self.running is not None:
+            # invalid interval
+            self.invalid = seconds
+
+    def _add_span(self, start, end):
+        if end < start or (self.ends and start < self.ends[-1]):
+            self.ordered = False
+        total = self.totals[-1] if self.totals else 0
+        self.starts.append(start)
+        self.ends.append(end)
+        self.totals.append(total + (end - start))
+
+    def copy(self):
+        durations = Durations()
+        durations.starts = array.array('l', self.starts)
+        durations.ends = array.array('l', self.ends)
+        durations.totals = array.array('l', self.totals)
+        durations.running = self.running
+        durations.invalid = self.invalid
+        durations.ordered = self.ordered
+        return durations
+
+    def __getstate__(self):
+        return (self.starts.tostring(), self.ends.tostring(),
+                self.totals.tostring(), self.running, self.invalid,
+                self.ordered)
+
+    def __setstate__(self, state):
+        starts, ends, totals, self.running, self.invalid, self.ordered = state
+        self.starts = array.array('l')
+        self.starts.fromstring(starts)
+        self.ends = array.array('l')
+        self.ends.fromstring(ends)
+        self.totals = array.array('l')
+        self.totals.fromstring(totals)
+
+    def check_valid(self, end=None):
+        """Raise StatusChangeException if the log breaks the interval
+        rules, or, given `end`, if it does so before then
+        """
+        if self.invalid is not None and (end is None or end > self.invalid):
+            raise exceptions.StatusChangeException(
+                "'started' entry must have matching 'stopped' entry or be "
+                "the last entry in the log")
+
+    def get_running_since(self):
+        """Return when the running span was started, or None"""
+        if self.running is None:
+            return None
+        return utils.seconds_to_datetime(self.running)
+
+    def get_duration(self, boundary):
+        """Return the total time worked, running an unclosed start up to
+        `boundary`
+        """
+        self.check_valid()
+        total = datetime.timedelta(
+            seconds=self.totals[-1] if self.totals else 0)
+        if self.running is not None:
+            total += boundary - self.get_running_since()
+        return total
+
+    def get_duration_between(self, start, end, now):
+        """Return the time worked between the datetimes `start` and `end`"""
+        start = _to_seconds(start)
+        end = _to_seconds(end)
+        self.check_valid(end)
+
+        total = 0
+        if self.running is not None:
+            total += _get_overlap(self.running, _to_seconds(now), start, end)
+
+        if not self.ordered:
+            for span_start, span_end in zip(self.starts, self.ends):
+                total += _get_overlap(span_start, span_end, start, end)
+            return datetime.timedelta(seconds=total)
+
+        # Spans first..last-1 overlap the window
+        first = bisect.bisect_right(self.ends, start)
+        last = bisect.bisect_left(self.starts, end)
+        if first < last:
+            total += self.totals[last - 1]
+            if first:
+                total -= self.totals[first - 1]
+            if self.starts[first] < start:
+                total -= start - self.starts[first]
+            if self.ends[last - 1] > end:
+                total -= self.ends[last - 1] - end
+        return datetime.timedelta(seconds=total)
+
+    def get_duration_for_date(self, date, now):
+        midnight = utils.date2datetime(date)
+        return self.get_duration_between(midnight, midnight + ONE_DAY, now)
+
+    def get_durations_by_date(self, start, end, now):
+        """Return a dict mapping each date from `start` to `end`, inclusive,
+        that the task was worked on to the time worked that date. Spans are
+        split at midnight, so a span running over several days counts
+        towards each of them.
+        """
+        window_start = utils.datetime_to_seconds(utils.date2datetime(start))
+        window_end = utils.datetime_to_seconds(utils.date2datetime(end)) + DAY
+        self.check_valid(window_end)
+
+        if self.ordered:
+            # Spans ending right at the window start still touch it
+            first = bisect.bisect_left(self.ends, window_start)
+            last = bisect.bisect_left(self.starts, window_end)
+        else:
+            first, last = 0, len(self.starts)
+        spans = zip(self.starts[first:last], self.ends[first:last])
+        if self.running is not None and self.running < window_end:
+            spans.append((self.running, max(self.running, _to_seconds(now))))
+
+        seconds_by_day = {}
+        for span_start, span_end in spans:
+            day = int(max(span_start, window_start) // DAY * DAY)
+            while day < window_end and day <= span_end:
+                seconds_by_day[day] = seconds_by_day.get(day, 0) + \
+                    _get_overlap(span_start, span_end, day, day + DAY)
+                day += DAY
+
+        durations_by_date = {}
+        for day, seconds in seconds_by_day.iteritems():
+            date = utils.seconds_to_datetime(day).date()
+            durations_by_date[date] = datetime.timedelta(seconds=seconds)
+        return durations_by_date
+
+    def get_dates(self, now):
+        """Return the set of dates any span touches"""
+        spans = zip(self.starts, self.ends)
+        if self.running is not None:
+            spans.append((self.running, max(self.running, _to_seconds(now))))
+
+        days = set()
+        for span_start, span_end in spans:
+            days.update(xrange(int(span_start // DAY),
+                               int(span_end // DAY) + 1))
+        return set(utils.seconds_to_datetime(day * DAY).date()
+                   for day in days)
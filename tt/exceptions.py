@@ -10,6 +10,10 @@ class BadTaskId(TTException):
     pass
 
 
+class AmbiguousTaskId(BadTaskId):
+    pass
+
+
 class DirectoryNotFound(TTException):
     pass
 
@@ -17,3 +21,6 @@ class DirectoryNotFound(TTException):
 class TaskAlreadyExists(TTException):
     pass
 
+
+class LockTimeout(TTException):
+    pass
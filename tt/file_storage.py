@@ -0,0 +1,929 @@
+import contextlib
+import datetime
+import errno
+import os
+
+from tt import archive
+from tt import cache
+from tt import durations
+from tt import exceptions
+from tt import lock
+from tt import storage
+from tt import utils
+from tt.task import Task
+
+
+# These run in the worker pools used by `FileStorage._load_tasks`, so they
+# need to be importable module-level functions for the process pool to
+# pickle them.
+
+def _stat_task_file(task_file):
+    """Return the stat of a task file, or None if it doesn't exist"""
+    try:
+        return os.stat(task_file)
+    except OSError, e:
+        if e.errno == errno.ENOENT:
+            return None
+        else:
+            raise
+
+
+def _read_task_file(task_file):
+    """Parse a task file, returning its (name, status, log)"""
+    with open(task_file, "r") as f:
+        lines = f.readlines()
+    return Task.parse_task_lines(lines)
+
+
+def _try_read_task_file(task_file):
+    """Parse a task file, returning ((name, status, log), None), or (None,
+    message) if it can't be parsed. A pool's imap gives up at the first
+    exception, so one bad file would stop the rest being read.
+    """
+    try:
+        return _read_task_file(task_file), None
+    except ValueError, e:
+        return None, str(e)
+
+
+class FileStorage(storage.Storage):
+    """Tasks kept as plain files, one per task under tasks/YYYY/MM/DD, with
+    a status table of empty pointer-files and the indexes under state/.
+    This is the layout described in docs/DESIGN.rst, and the default.
+    """
+
+    def __init__(self, manager, workers=0, pool_type="thread",
+                 lock_timeout=10):
+        storage.Storage.__init__(self, manager)
+        self.tt_dir = manager.tt_dir
+        self.workers = workers
+        self.pool_type = pool_type
+        self.cache = cache.TaskCache(self._get_cache_dir())
+        self.archive = archive.Archive(self._get_archive_dir())
+        self.lock = lock.RepoLock(self._get_lock_file(), timeout=lock_timeout)
+
+    def initialize(self):
+        """
+.tt/
+    ttconfig
+    state/
+        status/
+            pending/
+            started/
+            stopped/
+            done/
+        dates/
+        cache/
+        completion
+        journal
+        lock
+        transition
+    tasks/
+    archive/
+        """
+        os.makedirs(self.tt_dir)
+
+        for status in Task.DIRECTORY_STATUSES:
+            status_dir = self._get_status_dir(status)
+            os.makedirs(status_dir)
+
+        index_dir = self._get_date_index_dir()
+        os.makedirs(index_dir)
+
+        open(self._get_journal_file(), "w").close()
+
+        tasks_dir = self._get_tasks_dir()
+        os.makedirs(tasks_dir)
+
+    def save_cache(self):
+        self.cache.save()
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the repo lock, first finishing off any transition that a
+        crashed process left half done
+        """
+        with self.lock:
+            self._recover_transition()
+            yield
+
+    @contextlib.contextmanager
+    def transition(self, task_ids):
+        """Make the status changes in the body recoverable.
+
+        A status change touches the status table and the task file in
+        separate steps. Before starting, the task_ids involved are written
+        to state/transition; the record is removed once all the steps are
+        done. If a process dies in between, the next one to take the lock
+        finds the record and puts the status links of those tasks back in
+        line with their task files, which are written last and so are the
+        truth. Must be called with the lock held.
+        """
+        self._write_transition_record(task_ids)
+        try:
+            yield
+        except:
+            self._recover_transition()
+            raise
+        os.unlink(self._get_transition_file())
+
+    def _write_transition_record(self, task_ids):
+        transition_file = self._get_transition_file()
+        tmp_file = "%s.tmp.%d" % (transition_file, os.getpid())
+        with open(tmp_file, "w") as f:
+            for task_id in task_ids:
+                f.write("%s\n" % task_id)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_file, transition_file)
+
+    def _recover_transition(self):
+        transition_file = self._get_transition_file()
+        try:
+            with open(transition_file, "r") as f:
+                task_ids = [l.rstrip('\n') for l in f if l.strip()]
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return
+            else:
+                raise
+
+        for task_id in task_ids:
+            self._repair_status_links(task_id)
+        os.unlink(transition_file)
+
+    def _repair_status_links(self, task_id):
+        """Make the task's status links match its task file"""
+        try:
+            task = self.load_task(task_id, lazy=True)
+            status, name = task.status, task.name
+        except exceptions.BadTaskId:
+            status = name = None
+
+        for link_status in Task.DIRECTORY_STATUSES:
+            link = self._get_status_link(task_id, link_status)
+            exists = os.path.exists(link)
+            if link_status == status and not exists:
+                open(link, "w").close()
+            elif link_status != status and exists:
+                os.unlink(link)
+
+        if status not in Task.DIRECTORY_STATUSES:
+            status = None
+        self.manager.update_completion_cache([(task_id, status, name)])
+
+    def create_task(self, task):
+        """Create the task file, holding just the task's name"""
+        task_dir = self._get_task_dir(task.task_id)
+        utils.mkdirs_easy(task_dir)
+
+        task_file = self.get_task_file(task.task_id)
+
+        if os.path.exists(task_file):
+            raise exceptions.TaskAlreadyExists(
+                "'%s' already exists" % task.task_id)
+
+        with open(task_file, "w") as f:
+            f.write("%s\n" % task.name)
+
+    def create_tasks(self, tasks, now):
+        """The task dir is created once, task_id collisions are found in
+        memory, and the date index and journal are each written once for the
+        whole batch
+        """
+        datetime_str = utils.format_datetime_str(now)
+
+        # Every task_id in the batch is made from `now`, so they share a
+        # task dir
+        task_dir = self._get_task_dir(tasks[0].task_id)
+        utils.mkdirs_easy(task_dir)
+
+        added = []
+        failures = []
+        task_ids = set(os.listdir(task_dir))
+        for task in tasks:
+            slug = os.path.basename(self.get_task_file(task.task_id))
+            if slug in task_ids:
+                failures.append((task.name, exceptions.TaskAlreadyExists(
+                    "'%s' already exists" % task.task_id)))
+            else:
+                task_ids.add(slug)
+                added.append(task)
+
+        if not added:
+            return added, failures
+
+        with self.transition([task.task_id for task in added]):
+            for task in added:
+                with open(self.get_task_file(task.task_id), "w") as f:
+                    f.write("%s\npending %s\n" % (task.name, datetime_str))
+                open(self._get_status_link(task.task_id, "pending"),
+                     "w").close()
+                task.log = [("pending", now)]
+
+            self.add_to_date_index([task.task_id for task in added],
+                                   now.date())
+            self.append_to_journal(
+                [(now, "pending", task.task_id) for task in added])
+
+        return added, failures
+
+    def import_tasks(self, tasks):
+        """Task files and status links are written as they come; the date
+        index and journal are rebuilt once at the end
+        """
+        imported = []
+        skipped = []
+        for task in tasks:
+            task_file = self.get_task_file(task.task_id)
+            if (os.path.exists(task_file) or
+                    self.archive.get(task.task_id) is not None):
+                skipped.append(task)
+                continue
+
+            utils.mkdirs_easy(os.path.dirname(task_file))
+            with open(task_file, "w") as f:
+                f.write("%s\n" % task.name)
+                for status, dt in task.log:
+                    f.write("%s %s\n" % (status,
+                                         utils.format_datetime_str(dt)))
+            if task.status in Task.DIRECTORY_STATUSES:
+                open(self._get_status_link(task.task_id, task.status),
+                     "w").close()
+            imported.append(task)
+
+        if imported:
+            self.rebuild_date_index()
+            self.rebuild_journal()
+        return imported, skipped
+
+    def append_entry(self, task, status, dt):
+        datetime_str = utils.format_datetime_str(dt)
+
+        # Only the first entry on a given date needs to hit the date index.
+        # NOTE: this has to happen before the append so that a lazily loaded
+        # log doesn't pick up the new line twice
+        dates = self._get_entry_dates(task, status, dt)
+        if any(utils.date_match(dt, logged) for _, logged in task.log):
+            dates.pop(0)
+
+        task_file = self.get_task_file(task.task_id)
+        with open(task_file, "a") as f:
+            f.write("%s %s\n" % (status, datetime_str))
+
+        self.append_to_journal([(dt, status, task.task_id)])
+        for date in dates:
+            self.add_to_date_index([task.task_id], date)
+
+    def set_status(self, task_id, old_status, new_status):
+        if old_status is None:
+            link = self._get_status_link(task_id, new_status)
+            try:
+                open(link, "w").close()  # The file's presence is all that
+                                         # matters
+            except IOError, e:
+                if e.errno == errno.ENOENT:
+                    raise exceptions.DirectoryNotFound(
+                        "'%s' not found" % os.path.dirname(link))
+                else:
+                    raise
+        elif new_status is None:
+            os.unlink(self._get_status_link(task_id, old_status))
+        else:
+            os.rename(self._get_status_link(task_id, old_status),
+                      self._get_status_link(task_id, new_status))
+
+    def delete_task(self, task_id):
+        os.unlink(self.get_task_file(task_id))
+
+    def refresh_task(self, task):
+        """Re-read the name and status from the task file. The log is
+        re-read lazily.
+        """
+        task_file = self.get_task_file(task.task_id)
+        if not os.path.exists(task_file):
+            # Archived, and so never changes
+            return
+
+        fresh = self._load_from_file(task_file, lazy=True)
+        task.name = fresh.name
+        task.status = fresh.status
+        task._log = None
+        task._lazy_task_file = task_file
+        task._durations = None
+
+    def check(self, repair=True):
+        """Check the state/status table against the task files, which are
+        the source of truth.
+
+        Every task file is read once; the fixes are then made in one batch
+        of renames.
+        """
+        report = storage.FsckReport()
+
+        def scan_tasks():
+            statuses = {}
+            unreadable = []
+            for task in self._load_tasks(self._walk_task_files(),
+                                         errors=unreadable):
+                statuses[task.task_id] = task.status
+                try:
+                    task.durations.check_valid()
+                except exceptions.StatusChangeException, e:
+                    report.invalid.append((task.task_id, str(e)))
+            for task_id, message in unreadable:
+                # Its status is unknown, so its links are left alone
+                statuses[task_id] = None
+                report.invalid.append(
+                    (task_id, "can't parse task file: %s" % message))
+            report.num_tasks = len(statuses)
+            return statuses
+
+        def scan_links():
+            links = {}
+            for status in Task.DIRECTORY_STATUSES:
+                for task_id in self.get_task_ids_by_status(status):
+                    links.setdefault(task_id, []).append(status)
+            return links
+
+        def compare(statuses, links):
+            for task_id, linked in sorted(links.iteritems()):
+                if task_id in statuses and statuses[task_id] is None:
+                    continue
+                status = statuses.get(task_id)
+                if status is None:
+                    if self.archive.get(task_id) is not None:
+                        # Archived tasks are closed, so unlinked
+                        for old_status in linked:
+                            report.misplaced.append(
+                                (task_id, old_status, None))
+                    else:
+                        for old_status in linked:
+                            report.orphans.append((task_id, old_status))
+                    continue
+
+                linked = list(linked)
+                if status in linked:
+                    linked.remove(status)
+                    wanted = None
+                elif status in Task.DIRECTORY_STATUSES:
+                    wanted = status
+                else:
+                    wanted = None
+
+                for old_status in linked:
+                    report.misplaced.append((task_id, old_status, wanted))
+                    # Only one of the stray links can be moved into place
+                    wanted = None
+
+            for task_id, status in sorted(statuses.iteritems()):
+                if (status in Task.DIRECTORY_STATUSES and
+                        task_id not in links):
+                    report.unlinked.append((task_id, status))
+
+        def repair_links():
+            for task_id, status in report.orphans:
+                os.unlink(self._get_status_link(task_id, status))
+            for task_id, old_status, new_status in report.misplaced:
+                old_link = self._get_status_link(task_id, old_status)
+                if new_status is None:
+                    os.unlink(old_link)
+                else:
+                    os.rename(old_link,
+                              self._get_status_link(task_id, new_status))
+            for task_id, status in report.unlinked:
+                open(self._get_status_link(task_id, status), "w").close()
+            self.manager.rebuild_completion_cache()
+
+        statuses = report.timed("scan tasks", scan_tasks)
+        links = report.timed("scan status table", scan_links)
+        report.timed("compare", lambda: compare(statuses, links))
+        if repair:
+            report.timed("repair", repair_links)
+
+        return report
+
+    def _get_status_link(self, task_id, status):
+        status_dir = self._get_status_dir(status)
+        return os.path.join(status_dir, task_id)
+
+    def get_task_ids_by_status(self, status):
+        status_dir = self._get_status_dir(status)
+        try:
+            task_ids = os.listdir(status_dir)
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                raise exceptions.DirectoryNotFound(
+                    "'%s' not found" % status_dir)
+            else:
+                raise
+        return task_ids
+
+    def load_task(self, task_id, lazy=False):
+        task_file = self.get_task_file(task_id)
+        stat = _stat_task_file(task_file)
+        if stat is None:
+            task = self._load_archived_task(task_id)
+            if task is None:
+                raise exceptions.BadTaskId("'%s' does not exist" % task_id)
+            return task
+
+        task = self._load_task(task_id, task_file, stat, lazy=lazy)
+        return task
+
+    def iter_all_tasks(self):
+        """Yields every task in the system, in task_file order, followed by
+        the archived tasks
+        """
+        task_ids = set()
+        for task in self._load_tasks(self._walk_task_files()):
+            task_ids.add(task.task_id)
+            yield task
+
+        # Having seen every task, anything else in the cache is gone
+        self.cache.prune(task_ids)
+        self.save_cache()
+
+        for task in self._get_archived_tasks(exclude=task_ids):
+            yield task
+
+    def archive_closed_tasks(self, cutoff):
+        archived = []
+        for task_id, task_file in self._walk_task_files():
+            # A task's last line says whether, and when, it was closed, so
+            # only the files being archived need reading in full
+            with open(task_file, "rb") as f:
+                f.readline()
+                if not f.readline():
+                    # Nothing but a name, so never closed
+                    continue
+                status_line = utils.read_last_line(f).rstrip('\n')
+                status, timestamp = status_line.split(" ", 1)
+                if status != "closed":
+                    continue
+                closed_date = utils.parse_datetime_str(timestamp).date()
+                if closed_date >= cutoff:
+                    continue
+                f.seek(0)
+                archived.append((task_id, task_file, f.read()))
+
+        self.archive.add([(task_id, contents)
+                          for task_id, _, contents in archived])
+
+        # Only once the packs are safely written do the loose files go.
+        # If we die part way through, iter_all_tasks ignores the archived
+        # copy of any task still in tasks/
+        tasks_dir = self._get_tasks_dir()
+        for task_id, task_file, _ in archived:
+            os.unlink(task_file)
+            self._remove_empty_dirs(os.path.dirname(task_file), tasks_dir)
+
+        return [task_id for task_id, _, _ in archived]
+
+    def _remove_empty_dirs(self, path, top):
+        """Remove `path` and its parents, up to but not including `top`, for
+        as long as they're empty
+        """
+        while path != top and path.startswith(top):
+            try:
+                os.rmdir(path)
+            except OSError, e:
+                if e.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                    return
+                raise
+            path = os.path.dirname(path)
+
+    def _load_archived_task(self, task_id):
+        contents = self.archive.get(task_id)
+        if contents is None:
+            return None
+        return self._make_archived_task(task_id, contents)
+
+    def _make_archived_task(self, task_id, contents):
+        lines = contents.splitlines(True)
+        name, status, log = Task.parse_task_lines(lines)
+        return Task(manager=self.manager, task_id=task_id, name=name,
+                    status=status, log=log)
+
+    def _get_archived_tasks(self, exclude=()):
+        for task_id, contents in self.archive.iter_all():
+            if task_id not in exclude:
+                yield self._make_archived_task(task_id, contents)
+
+    def _walk_task_files(self):
+        """Return (task_id, task_file) for every task file, sorted by path.
+
+        This lists each level itself rather than using os.walk, which would
+        stat every task file to find out whether it's a directory.
+        """
+        task_files = []
+        tasks_dir = self._get_tasks_dir()
+        for year in self._list_date_dirs(tasks_dir):
+            year_dir = os.path.join(tasks_dir, year)
+            for month in self._list_date_dirs(year_dir):
+                month_dir = os.path.join(year_dir, month)
+                for day in self._list_date_dirs(month_dir):
+                    day_dir = os.path.join(month_dir, day)
+                    date_str = "%s_%s_%s" % (year, month, day)
+                    for slug in sorted(os.listdir(day_dir)):
+                        task_file = os.path.join(day_dir, slug)
+                        task_id = "%s-%s" % (slug, date_str)
+                        task_files.append((task_id, task_file))
+        return task_files
+
+    def _list_date_dirs(self, parent_dir):
+        """Sorted list of the numeric YYYY, MM or DD entries of a dir"""
+        try:
+            names = os.listdir(parent_dir)
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                return []
+            else:
+                raise
+        return sorted(name for name in names if name.isdigit())
+
+    def _load_tasks(self, task_files, errors=None):
+        """Yields a task for each (task_id, task_file) pair, in order. Tasks
+        whose task file doesn't exist are looked for in the archive, and
+        skipped if they aren't there either.
+
+        A task file that can't be parsed raises ValueError, unless an
+        `errors` list is given, in which case it's skipped and its (task_id,
+        message) added to `errors`.
+
+        With `workers` set, the task files are stat'd and then any not in
+        the cache are parsed using a pool of workers.
+        """
+        if not self.workers:
+            for task_id, task_file in task_files:
+                stat = _stat_task_file(task_file)
+                if stat is not None:
+                    try:
+                        task = self._load_task(task_id, task_file, stat)
+                    except ValueError, e:
+                        if errors is None:
+                            raise
+                        errors.append((task_id, str(e)))
+                        continue
+                    yield task
+                else:
+                    task = self._load_archived_task(task_id)
+                    if task is not None:
+                        yield task
+            return
+
+        pool = self._make_pool()
+        try:
+            paths = [task_file for _, task_file in task_files]
+            stats = pool.map(_stat_task_file, paths)
+
+            cached = []
+            misses = []
+            for (task_id, task_file), stat in zip(task_files, stats):
+                if stat is None:
+                    cached.append(None)
+                    continue
+                entry = self.cache.get(task_id, task_file, stat=stat)
+                cached.append(entry)
+                if entry is None:
+                    misses.append(task_file)
+
+            chunksize = max(1, len(misses) // (self.workers * 4))
+            parsed = pool.imap(_try_read_task_file, misses, chunksize)
+
+            for (task_id, task_file), stat, entry in zip(task_files, stats,
+                                                         cached):
+                if stat is None:
+                    task = self._load_archived_task(task_id)
+                    if task is not None:
+                        yield task
+                    continue
+                if entry is None:
+                    result, error = parsed.next()
+                    if error is not None:
+                        if errors is None:
+                            raise ValueError(error)
+                        errors.append((task_id, error))
+                        continue
+                    name, status, log = result
+                    task_durations = durations.Durations(log)
+                    self.cache.put(task_id, task_file, name, status, log,
+                                   stat=stat, task_durations=task_durations)
+                else:
+                    name, status, log, task_durations = entry
+                yield Task(manager=self.manager, task_id=task_id, name=name,
+                           status=status, log=log, durations=task_durations)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _make_pool(self):
+        if self.pool_type == "process":
+            import multiprocessing
+            return multiprocessing.Pool(self.workers)
+        else:
+            from multiprocessing.pool import ThreadPool
+            return ThreadPool(self.workers)
+
+    def _load_task(self, task_id, task_file, stat=None, lazy=False):
+        """Load a task, using the parsed-task cache when the task file hasn't
+        changed since it was cached
+        """
+        if stat is None:
+            stat = os.stat(task_file)
+
+        cached = self.cache.get(task_id, task_file, stat=stat)
+        if cached is not None:
+            name, status, log, task_durations = cached
+            return Task(manager=self.manager, task_id=task_id, name=name,
+                        status=status, log=log, durations=task_durations)
+
+        if lazy:
+            # Reading the whole file just to cache it would defeat the point
+            return self._load_from_file(task_file, lazy=True)
+
+        task = self._load_from_file(task_file)
+        self.cache.put(task_id, task_file, task.name, task.status, task.log,
+                       stat=stat, task_durations=task.durations)
+        return task
+
+    def _load_from_file(self, task_file, lazy=False):
+        """Load a task from its task file.
+
+        With `lazy`, only the name and the last status line are read; the
+        rest of the timelog is parsed the first time `log` is needed.
+        """
+        task_id = self._get_task_id_from_task_file(task_file)
+
+        if lazy:
+            with open(task_file, "r") as f:
+                name = f.readline().rstrip('\n')
+                status_line = utils.read_last_line(f).rstrip('\n')
+            # The last status line reflects the current status
+            status, _ = status_line.split(" ", 1)
+            task = Task(manager=self.manager, task_id=task_id, name=name,
+                        status=status, lazy_task_file=task_file)
+        else:
+            name, status, log = _read_task_file(task_file)
+            task = Task(manager=self.manager, task_id=task_id, name=name,
+                        status=status, log=log)
+        return task
+
+    def get_tasks_on_dates(self, dates):
+        """This consults the date index so that only the tasks touched on
+        those dates are loaded, each at most once. Repos created before the
+        index existed fall back to loading every task; run
+        `rebuild_date_index` to fix that.
+        """
+        if not os.path.exists(self._get_date_index_dir()):
+            for task in self.iter_all_tasks():
+                yield task
+            return
+
+        for task in super(FileStorage, self).get_tasks_on_dates(dates):
+            yield task
+
+    def _load_tasks_by_id(self, task_ids):
+        # Index entries aren't removed when a task is deleted, which
+        # _load_tasks takes care of by skipping missing task files
+        return self._load_tasks([(task_id, self.get_task_file(task_id))
+                                 for task_id in task_ids])
+
+    def get_task_ids_for_date(self, date):
+        """Return the task_ids the date index lists for the given date"""
+        index_file = self._get_date_index_file(date)
+        try:
+            with open(index_file, "r") as f:
+                lines = f.readlines()
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return []
+            else:
+                raise
+
+        # A task may be listed more than once if it was hand-edited or the
+        # index was rebuilt on top of itself
+        task_ids = []
+        seen = set()
+        for line in lines:
+            task_id = line.rstrip('\n')
+            if task_id and task_id not in seen:
+                seen.add(task_id)
+                task_ids.append(task_id)
+        return task_ids
+
+    def add_to_date_index(self, task_ids, date):
+        """Record that each of `task_ids` has a timelog entry on `date`"""
+        index_dir = self._get_date_index_dir()
+        if not os.path.exists(index_dir):
+            # Pre-index repo, everything falls back to a full scan until
+            # `rebuild_date_index` is run
+            return
+
+        index_file = self._get_date_index_file(date)
+        with open(index_file, "a") as f:
+            f.write("".join("%s\n" % task_id for task_id in task_ids))
+
+    def append_to_journal(self, events):
+        """Record status changes, given as (datetime, status, task_id), in
+        the repo-wide journal.
+
+        Each line is '<timestamp> <status> <task_id>'. Lines are appended as
+        status changes happen, so the journal is in time order, which is
+        what lets `get_journal_events` binary search it.
+        """
+        journal_file = self._get_journal_file()
+        if not os.path.exists(journal_file):
+            # The journal would be missing history, so it's only kept once
+            # `rebuild_journal` has created it
+            return
+
+        lines = []
+        for dt, status, task_id in events:
+            datetime_str = utils.format_datetime_str(dt)
+            lines.append("%s %s %s\n" % (datetime_str, status, task_id))
+        with open(journal_file, "a") as f:
+            f.write("".join(lines))
+
+    def rebuild_journal(self):
+        """Recreate the journal from the task files"""
+        events = []
+        for task in self.iter_all_tasks():
+            for status, dt in task.log:
+                events.append((dt, status, task.task_id))
+        # Switching tasks stops one and starts the other within the same
+        # second, keep the stop first like the live journal would. The sort
+        # is stable, so a task's own entries stay in log order.
+        events.sort(key=lambda e: (e[0], e[1] == "started"))
+
+        journal_file = self._get_journal_file()
+        tmp_file = "%s.tmp.%d" % (journal_file, os.getpid())
+        with open(tmp_file, "w") as f:
+            for dt, status, task_id in events:
+                datetime_str = utils.format_datetime_str(dt)
+                f.write("%s %s %s\n" % (datetime_str, status, task_id))
+        os.rename(tmp_file, journal_file)
+
+    def get_journal_events(self, start=None, end=None):
+        """Only the slice of the journal inside that range is read: the
+        start of it is found by binary searching on byte offsets.
+        """
+        journal_file = self._get_journal_file()
+        if not os.path.exists(journal_file):
+            raise exceptions.TTException(
+                "No journal, run 'tt reindex' to create one")
+
+        end_str = utils.format_datetime_str(end) if end else None
+        with open(journal_file, "r") as f:
+            if start:
+                offset = self._find_journal_offset(f, start)
+            else:
+                offset = 0
+            f.seek(offset)
+            for line in f:
+                datetime_str = line[:19]
+                if end_str and datetime_str >= end_str:
+                    break
+                status, task_id = line[20:].rstrip('\n').split(" ", 1)
+                dt = utils.parse_datetime_str(datetime_str)
+                yield dt, status, task_id
+
+    def get_task_id_at(self, dt):
+        journal_file = self._get_journal_file()
+        if not os.path.exists(journal_file):
+            raise exceptions.TTException(
+                "No journal, run 'tt reindex' to create one")
+
+        with open(journal_file, "r") as f:
+            # Include status changes made during that very second
+            offset = self._find_journal_offset(
+                f, dt + datetime.timedelta(seconds=1))
+            for line in utils.iter_lines_reversed(f, offset):
+                status, task_id = line[20:].split(" ", 1)
+                if status == "started":
+                    return task_id
+                elif status == "stopped":
+                    return None
+        return None
+
+    def _find_journal_offset(self, f, dt):
+        """Return the byte offset of the first journal line at or after
+        `dt`
+        """
+        key = utils.format_datetime_str(dt)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+        def line_start(pos):
+            # Offset of the first line starting at or after `pos`
+            if pos == 0:
+                return 0
+            f.seek(pos - 1)
+            f.readline()
+            return f.tell()
+
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(line_start(mid))
+            line = f.readline()
+            if line and line[:19] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return line_start(lo)
+
+    def rebuild_date_index(self):
+        """Recreate the date index from the task files"""
+        index_dir = self._get_date_index_dir()
+        utils.mkdirs_easy(index_dir)
+        for filename in os.listdir(index_dir):
+            os.unlink(os.path.join(index_dir, filename))
+
+        now = utils.get_now()
+        task_ids_by_date = {}
+        for task in self.iter_all_tasks():
+            for date in self._get_task_dates(task, now):
+                task_ids_by_date.setdefault(date, []).append(task.task_id)
+
+        for date, task_ids in task_ids_by_date.iteritems():
+            index_file = self._get_date_index_file(date)
+            with open(index_file, "w") as f:
+                for task_id in task_ids:
+                    f.write("%s\n" % task_id)
+
+    def _get_task_dir(self, task_id):
+        tasks_dir = self._get_tasks_dir()
+        slug, year, month, day = Task._get_task_id_parts(task_id)
+        task_dir = os.path.join(tasks_dir, year, month, day)
+        return task_dir
+
+    def get_task_file(self, task_id):
+        """Return the file under tasks/year/month/day/slug for this task"""
+        task_dir = self._get_task_dir(task_id)
+        slug, year, month, day = Task._get_task_id_parts(task_id)
+        task_file = os.path.join(task_dir, slug)
+        return task_file
+
+    def _get_task_id_from_task_file(self, task_file):
+        """Return the task_id for a given task_file
+
+        ./tasks/2011/1/2/do_something -> do_something-2011-01-02
+        """
+        base, slug = os.path.split(task_file)
+        base, day = os.path.split(base)
+        base, month = os.path.split(base)
+        base, year = os.path.split(base)
+        date_str = "%s_%s_%s" % (year, month, day)
+        return "%s-%s" % (slug, date_str)
+
+    def _get_state_dir(self):
+        state_dir = os.path.join(self.tt_dir, "state")
+        return state_dir
+
+    def _get_cache_dir(self):
+        state_dir = self._get_state_dir()
+        cache_dir = os.path.join(state_dir, "cache")
+        return cache_dir
+
+    def _get_status_dir(self, status):
+        state_dir = self._get_state_dir()
+        status_dir = os.path.join(state_dir, "status", status)
+        return status_dir
+
+    def _get_date_index_dir(self):
+        state_dir = self._get_state_dir()
+        index_dir = os.path.join(state_dir, "dates")
+        return index_dir
+
+    def _get_lock_file(self):
+        state_dir = self._get_state_dir()
+        lock_file = os.path.join(state_dir, "lock")
+        return lock_file
+
+    def _get_transition_file(self):
+        state_dir = self._get_state_dir()
+        transition_file = os.path.join(state_dir, "transition")
+        return transition_file
+
+    def _get_journal_file(self):
+        state_dir = self._get_state_dir()
+        journal_file = os.path.join(state_dir, "journal")
+        return journal_file
+
+    def _get_date_index_file(self, date):
+        """Return the state/dates/YYYY-MM-DD file listing the tasks with a
+        timelog entry on that date
+        """
+        index_dir = self._get_date_index_dir()
+        date_str = utils.format_date_str(date)
+        index_file = os.path.join(index_dir, date_str)
+        return index_file
+
+    def _get_archive_dir(self):
+        archive_dir = os.path.join(self.tt_dir, "archive")
+        return archive_dir
+
+    def _get_tasks_dir(self):
+        tasks_dir = os.path.join(self.tt_dir, "tasks")
+        return tasks_dir
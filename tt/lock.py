@@ -0,0 +1,71 @@
+import errno
+import fcntl
+import os
+import time
+
+from tt import exceptions
+
+
+class RepoLock(object):
+    """An exclusive, re-entrant, fcntl-based lock on the repo.
+
+    Usable as a context manager. Acquiring it polls for up to `timeout`
+    seconds before raising LockTimeout, so a wedged process can't hang
+    every hook that runs `tt` after it.
+    """
+
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, lock_file, timeout=10):
+        self.lock_file = lock_file
+        self.timeout = timeout
+        self._fd = None
+        self._depth = 0
+
+    def acquire(self):
+        if self._depth:
+            self._depth += 1
+            return
+
+        try:
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0644)
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                raise exceptions.DirectoryNotFound(
+                    "'%s' not found" % os.path.dirname(self.lock_file))
+            else:
+                raise
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except IOError, e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            if time.time() >= deadline:
+                os.close(fd)
+                raise exceptions.LockTimeout(
+                    "Timed out waiting for '%s'" % self.lock_file)
+            time.sleep(self.POLL_INTERVAL)
+
+        self._fd = fd
+        self._depth = 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth:
+            return
+
+        fd = self._fd
+        self._fd = None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
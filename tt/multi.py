@@ -0,0 +1,173 @@
+"""Reports across many tt repos at once.
+
+A `MultiTaskManager` stands in front of a set of repos, e.g. every
+engineer's `.tt` gathered under one directory, and answers report queries
+for all of them together. Each repo is read by its own TaskManager in a pool
+of workers, and the rows that come back, each tagged with the repo it came
+from, are merged into one stream in date order for the usual report sinks.
+"""
+import heapq
+import os
+import sqlite3
+
+from tt import exceptions
+from tt import reports
+from tt import storage
+from tt import task_manager
+
+
+def find_repos(root):
+    """Return the repos at or under `root`, sorted by path. Hidden
+    directories other than `.tt` aren't searched, nor are the repos
+    themselves.
+    """
+    root = os.path.expanduser(root)
+    if storage.is_repo(root):
+        return [root]
+
+    tt_dirs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if ".tt" in dirnames:
+            tt_dir = os.path.join(dirpath, ".tt")
+            if storage.is_repo(tt_dir):
+                tt_dirs.append(tt_dir)
+        dirnames[:] = sorted(name for name in dirnames
+                             if not name.startswith("."))
+    return sorted(tt_dirs)
+
+
+def get_repo_names(tt_dirs):
+    """Name each repo after the directory holding it, relative to the
+    directory all of them are in
+    """
+    parents = [os.path.dirname(os.path.normpath(tt_dir))
+               if os.path.basename(os.path.normpath(tt_dir)) == ".tt"
+               else os.path.normpath(tt_dir) for tt_dir in tt_dirs]
+    if len(parents) < 2:
+        return [os.path.basename(parent) for parent in parents]
+
+    common = os.path.dirname(
+        os.path.commonprefix([parent + os.sep for parent in parents]))
+    names = []
+    for parent in parents:
+        name = os.path.relpath(parent, common)
+        names.append(os.path.basename(parent) if name == "." else name)
+    return names
+
+
+# These run in the worker pool, so for the process pool they need to be
+# module-level functions taking and returning picklable values. A repo that
+# can't be read gives its error back rather than spoiling the whole report.
+
+READ_ERRORS = (exceptions.TTException, EnvironmentError, sqlite3.Error)
+
+def _scan_repo(args):
+    tt_dir, dates = args
+    try:
+        manager = task_manager.TaskManager(tt_dir)
+        rows = list(reports.by_date(manager, dates))
+        manager.save_cache()
+    except READ_ERRORS, e:
+        return None, str(e)
+    return rows, None
+
+
+def _scan_journal(args):
+    tt_dir, start, end = args
+    try:
+        manager = task_manager.TaskManager(tt_dir)
+        events = list(manager.get_journal_events(start, end))
+    except READ_ERRORS, e:
+        return None, str(e)
+    return events, None
+
+
+class MultiTaskManager(object):
+    """Reads many repos concurrently. Repos that fail to be read are skipped
+    and listed in `errors`, as (repo name, message).
+    """
+
+    def __init__(self, tt_dirs, workers=8, pool_type="thread"):
+        if pool_type not in task_manager.TaskManager.POOL_TYPES:
+            raise ValueError("pool_type must be one of %s" %
+                             ", ".join(task_manager.TaskManager.POOL_TYPES))
+        self.tt_dirs = [os.path.expanduser(tt_dir) for tt_dir in tt_dirs]
+        self.names = get_repo_names(self.tt_dirs)
+        self.workers = workers
+        self.pool_type = pool_type
+        self.errors = []
+
+    @classmethod
+    def discover(cls, roots, **kwargs):
+        """A MultiTaskManager for all the repos found under `roots`"""
+        tt_dirs = []
+        for root in roots:
+            for tt_dir in find_repos(root):
+                if tt_dir not in tt_dirs:
+                    tt_dirs.append(tt_dir)
+        return cls(tt_dirs, **kwargs)
+
+    def _map(self, fn, args):
+        """Return fn(arg) for each of `args`, in order, run on the pool"""
+        if not self.workers or len(args) < 2:
+            return map(fn, args)
+
+        if self.pool_type == "process":
+            import multiprocessing
+            pool = multiprocessing.Pool(min(self.workers, len(args)))
+        else:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(self.workers, len(args)))
+        try:
+            return pool.map(fn, args, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _collect(self, results):
+        """Yields (repo name, result) for each repo that could be read"""
+        for name, (result, error) in zip(self.names, results):
+            if error is not None:
+                self.errors.append((name, error))
+            else:
+                yield name, result
+
+    def iter_rows(self, dates):
+        """Yields a row, as `reports.by_date` gives, for each task worked on
+        each of `dates` in every repo, with a `repo` field added. Rows come
+        in the order of `dates`, and by repo within a date.
+        """
+        dates = list(dates)
+        position = dict((date, i) for i, date in enumerate(dates))
+        results = self._map(_scan_repo,
+                            [(tt_dir, dates) for tt_dir in self.tt_dirs])
+
+        streams = []
+        for repo_index, (name, rows) in enumerate(self._collect(results)):
+            streams.append(self._tag(rows, name, repo_index, position))
+        for _, _, _, row in heapq.merge(*streams):
+            yield row
+
+    def _tag(self, rows, name, repo_index, position):
+        for row_index, row in enumerate(rows):
+            row["repo"] = name
+            yield position[row["date"]], repo_index, row_index, row
+
+    def get_journal_events(self, start=None, end=None):
+        """Yields (datetime, status, task_id, repo name) for each status
+        change in every repo from `start` up to, but not including, `end`,
+        in time order
+        """
+        results = self._map(_scan_journal, [(tt_dir, start, end)
+                                            for tt_dir in self.tt_dirs])
+        streams = []
+        for repo_index, (name, events) in enumerate(self._collect(results)):
+            streams.append(self._tag_events(events, name, repo_index))
+        for _, event in heapq.merge(*streams):
+            yield event
+
+    def _tag_events(self, events, name, repo_index):
+        for i, (dt, status, task_id) in enumerate(events):
+            # Stops before starts within a second, as in a single journal
+            yield ((dt, status == "started", repo_index, i),
+                   (dt, status, task_id, name))
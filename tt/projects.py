@@ -0,0 +1,160 @@
+"""Finding the repo to use from the current directory.
+
+A project can keep its own `.tt` at its top, as it would a `.git`, and tt
+uses the most specific repo: the first `.tt` found walking up from the
+current directory, or ~/.tt if there's none. Completion and hooks run tt
+constantly from deep in source trees, often on network filesystems, so the
+answer for each directory is cached in ~/.cache/tt/lookups and rechecked
+with a single look at the repo. A walk stops at the first directory with a
+cached answer, and caches one for every directory it passed.
+
+A cached answer doesn't notice a `.tt` made later in a directory in between,
+so `tt init` forgets the answers it would change. Every repo found or made
+is also listed in ~/.cache/tt/projects, for `--all-projects`.
+"""
+import errno
+import os
+
+from tt import storage
+from tt import utils
+
+
+DEFAULT_TT_DIR = "~/.tt"
+
+# Past this many cached directories, the cache starts again from the lookup
+# that overflowed it
+MAX_LOOKUPS = 1000
+
+
+def get_cache_dir():
+    cache_home = (os.environ.get("XDG_CACHE_HOME") or
+                  os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "tt")
+
+
+def _read_lines(path):
+    try:
+        with open(path, "r") as f:
+            return [line.rstrip("\n") for line in f]
+    except IOError, e:
+        if e.errno == errno.ENOENT:
+            return []
+        raise
+
+
+def _write_lines(path, lines):
+    """Replace `path` with `lines`. This is only a cache, so failing to
+    write it, e.g. on a read-only home, isn't an error
+    """
+    tmp_file = "%s.tmp.%d" % (path, os.getpid())
+    try:
+        utils.mkdirs_easy(os.path.dirname(path))
+        with open(tmp_file, "w") as f:
+            for line in lines:
+                f.write("%s\n" % line)
+        os.rename(tmp_file, path)
+    except EnvironmentError:
+        pass
+
+
+class Projects(object):
+    """The repos of the projects on this machine, and which to use where"""
+
+    def __init__(self, cache_dir=None, default_tt_dir=DEFAULT_TT_DIR):
+        if cache_dir is None:
+            cache_dir = get_cache_dir()
+        self.lookups_file = os.path.join(cache_dir, "lookups")
+        self.projects_file = os.path.join(cache_dir, "projects")
+        self.default_tt_dir = os.path.expanduser(default_tt_dir)
+
+    def _read_lookups(self):
+        """Return the cached {directory: tt_dir}"""
+        lookups = {}
+        for line in _read_lines(self.lookups_file):
+            try:
+                path, tt_dir = line.split("\t", 1)
+            except ValueError:
+                continue
+            lookups[path] = tt_dir
+        return lookups
+
+    def _write_lookups(self, lookups):
+        _write_lines(self.lookups_file,
+                     ["%s\t%s" % item for item in sorted(lookups.items())])
+
+    def _is_valid(self, tt_dir):
+        # No project repo above, which stays true whether or not the default
+        # exists yet
+        return tt_dir == self.default_tt_dir or storage.is_repo(tt_dir)
+
+    def find(self, cwd=None):
+        """Return the repo to use from `cwd`, the current directory by
+        default
+        """
+        if cwd is None:
+            try:
+                cwd = os.getcwd()
+            except OSError:
+                # Run from a directory since removed
+                return self.default_tt_dir
+        path = os.path.abspath(cwd)
+
+        lookups = self._read_lookups()
+        walked = []
+        while True:
+            tt_dir = lookups.get(path)
+            if tt_dir is not None and self._is_valid(tt_dir):
+                break
+            walked.append(path)
+            tt_dir = os.path.join(path, ".tt")
+            if storage.is_repo(tt_dir):
+                self.add(tt_dir)
+                break
+            parent = os.path.dirname(path)
+            if parent == path:
+                tt_dir = self.default_tt_dir
+                break
+            path = parent
+
+        if walked:
+            if len(lookups) + len(walked) > MAX_LOOKUPS:
+                lookups = {}
+            for path in walked:
+                lookups[path] = tt_dir
+            self._write_lookups(lookups)
+        return tt_dir
+
+    def forget(self, path):
+        """Drop the cached answers for `path` and the directories under it,
+        e.g. when a repo is made there
+        """
+        path = os.path.abspath(path)
+        prefix = os.path.join(path, "")
+        lookups = self._read_lookups()
+        kept = dict((p, tt_dir) for p, tt_dir in lookups.iteritems()
+                    if p != path and not p.startswith(prefix))
+        if len(kept) != len(lookups):
+            self._write_lookups(kept)
+
+    def add(self, tt_dir):
+        """List `tt_dir` among the projects"""
+        tt_dir = os.path.abspath(os.path.expanduser(tt_dir))
+        tt_dirs = _read_lines(self.projects_file)
+        if tt_dir not in tt_dirs:
+            self._write_projects(tt_dirs + [tt_dir])
+
+    def _write_projects(self, tt_dirs):
+        _write_lines(self.projects_file, sorted(tt_dirs))
+
+    def get_all(self):
+        """Return every known repo that's still there, sorted by path, the
+        default included
+        """
+        listed = _read_lines(self.projects_file)
+        tt_dirs = [tt_dir for tt_dir in listed if storage.is_repo(tt_dir)]
+        if len(tt_dirs) != len(listed):
+            self._write_projects(tt_dirs)
+        if (self.default_tt_dir not in tt_dirs and
+                storage.is_repo(self.default_tt_dir)):
+            tt_dirs.append(self.default_tt_dir)
+        return sorted(tt_dirs)
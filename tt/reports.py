@@ -0,0 +1,301 @@
+"""Streaming report pipeline.
+
+A report is a chain of generators, each taking the rows of the stage before
+it and yielding its own:
+
+    source -> filter_* -> group_by -> sink
+
+Rows are dicts of plain fields: the task_id, name, status and duration of a
+task, and for dated rows the date. Dated sources work through their dates a
+month at a time, loading each task worked that month once however many of
+its days it covers, so a report over any range runs in memory bounded by
+the busiest month rather than the length of the range. Undated rows start
+out holding the Task itself, which `with_durations` swaps for its fields.
+Sinks write each row as it arrives.
+"""
+import csv
+import datetime
+import itertools
+
+from tt import utils
+
+
+TASK_FIELDS = ("task_id", "name", "status", "duration")
+
+
+def format_duration(duration):
+    """Return a human readable form of total duration"""
+    #TODO: write code to go from secs -> min -> hours -> days -> weeks
+    # -> months -> years
+    seconds = float(duration.seconds)
+    minutes = seconds / 60
+    seconds %= 60
+
+    hours = (minutes / 60) + (duration.days * 24)
+    minutes %= 60
+
+    duration_str = "%02d:%02d:%02d" % (hours, minutes, seconds)
+    return duration_str
+
+
+def get_seconds(duration):
+    return duration.days * 86400 + duration.seconds
+
+
+# Sources
+
+def iter_durations_by_date(manager, dates):
+    """Yields a {date, task_id, name, status, duration} row for each task
+    worked on each of `dates`, in the order given, loading the tasks of one
+    month of them at a time
+    """
+    months = itertools.groupby(dates, lambda date: (date.year, date.month))
+    for _, month_dates in months:
+        month_dates = list(month_dates)
+        durations_by_date = manager.get_durations_by_date(min(month_dates),
+                                                          max(month_dates))
+        for date in month_dates:
+            for task, duration in durations_by_date[date]:
+                yield _get_task_row(task, duration, date=date)
+
+
+def with_durations(rows):
+    """Replace each row's task with its task_id, name, status and total
+    duration
+    """
+    for row in rows:
+        task = row.pop("task")
+        row.update(_get_task_row(task, task.get_duration()))
+        yield row
+
+
+def _get_task_row(task, duration, **fields):
+    fields.update(task_id=task.task_id, name=task.name, status=task.status,
+                  duration=duration)
+    return fields
+
+
+# Filters
+
+def filter_status(rows, statuses):
+    """Drop rows of tasks whose status isn't one of `statuses`"""
+    for row in rows:
+        if row["status"] in statuses:
+            yield row
+
+
+def filter_dates(rows, start=None, end=None, weekdays=None):
+    """Drop rows dated before `start`, after `end`, or on a day of the week
+    not in `weekdays` (0 is Monday)
+    """
+    for row in rows:
+        date = row["date"]
+        if start is not None and date < start:
+            continue
+        if end is not None and date > end:
+            continue
+        if weekdays is not None and date.weekday() not in weekdays:
+            continue
+        yield row
+
+
+def apply_filters(rows, statuses=None, weekdays=None):
+    """Pass dated rows through the filters asked for, if any"""
+    if statuses is not None:
+        rows = filter_status(rows, statuses)
+    if weekdays is not None:
+        rows = filter_dates(rows, weekdays=weekdays)
+    return rows
+
+
+# Grouping
+
+def group_by(rows, key, keys=None):
+    """Sum the durations of consecutive rows sharing the same `key` field,
+    yielding a {key, duration} row for each run. This streams, so rows
+    should already be in `key` order, as the date-ordered sources are.
+
+    If `keys` is given, it's the full sequence of keys expected, and any
+    with no rows get a zero duration.
+    """
+    groups = _iter_groups(rows, key)
+    if keys is None:
+        for value, duration in groups:
+            yield {key: value, "duration": duration}
+        return
+
+    pending = None
+    for expected in keys:
+        if pending is None:
+            pending = next(groups, None)
+        if pending is not None and pending[0] == expected:
+            yield {key: expected, "duration": pending[1]}
+            pending = None
+        else:
+            yield {key: expected, "duration": datetime.timedelta()}
+
+
+def _iter_groups(rows, key):
+    current = None
+    total = None
+    for row in rows:
+        value = row[key]
+        if total is not None and value != current:
+            yield current, total
+            total = None
+        if total is None:
+            current = value
+            total = datetime.timedelta()
+        total += row["duration"]
+    if total is not None:
+        yield current, total
+
+
+class Tally(object):
+    """Totals the duration of each task over the rows passed through
+    `count`, for reports that end with a per-task summary. Holds one entry
+    per task, not per row.
+
+    Rows are told apart by their `keys` fields, and the `fields` of the last
+    row counted for each are kept alongside its total.
+    """
+
+    def __init__(self, keys=("task_id",), fields=("name",)):
+        self.keys = keys
+        self.fields = keys + fields
+        self.entries = {}
+        self.durations = {}
+
+    def count(self, rows):
+        for row in rows:
+            key = tuple(row[field] for field in self.keys)
+            self.entries[key] = [row[field] for field in self.fields]
+            self.durations[key] = self.durations.get(
+                key, datetime.timedelta()) + row["duration"]
+            yield row
+
+    def rows(self):
+        """Yields a row of the `fields` and duration per entry, longest
+        first and then in key order
+        """
+        for key in sorted(sorted(self.durations), key=self.durations.get,
+                          reverse=True):
+            row = dict(zip(self.fields, self.entries[key]))
+            row["duration"] = self.durations[key]
+            yield row
+
+
+# Sinks
+
+class TextSink(object):
+    """Writes each row with `row_format`, a %-format over the row's fields
+    with the duration made human readable. `header` is written first and
+    `footer`, which may use %(total)s, last.
+    """
+
+    def __init__(self, stream, row_format, header=None, footer=None):
+        self.stream = stream
+        self.row_format = row_format
+        self.header = header
+        self.footer = footer
+
+    def write(self, rows):
+        if self.header is not None:
+            self.stream.write("%s\n" % self.header)
+
+        total = datetime.timedelta()
+        for row in rows:
+            total += row["duration"]
+            fields = dict(row)
+            fields["duration"] = format_duration(row["duration"])
+            self.stream.write("%s\n" % (self.row_format % fields))
+
+        if self.footer is not None:
+            footer = self.footer % {"total": format_duration(total)}
+            self.stream.write("%s\n" % footer)
+
+
+def _get_plain_value(value):
+    if isinstance(value, datetime.timedelta):
+        return get_seconds(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class CSVSink(object):
+    """Writes a header line of `fields` then one line per row, with dates in
+    ISO format and durations in seconds
+    """
+
+    def __init__(self, stream, fields):
+        self.writer = csv.writer(stream)
+        self.fields = fields
+
+    def write(self, rows):
+        self.writer.writerow(self.fields)
+        for row in rows:
+            self.writer.writerow(
+                [_get_plain_value(row.get(field)) for field in self.fields])
+
+
+class JSONSink(object):
+    """Writes one JSON object per row and line, with dates in ISO format and
+    durations in seconds, so the output can be streamed into other tools
+    """
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.fields = fields
+
+    def write(self, rows):
+        import json
+
+        for row in rows:
+            obj = dict((field, _get_plain_value(row.get(field)))
+                       for field in self.fields)
+            self.stream.write("%s\n" % json.dumps(obj, sort_keys=True))
+
+
+def make_sink(fmt, stream, fields, **text_layout):
+    """Return the sink for output format `fmt` ('text', 'csv' or 'json').
+    `text_layout` is passed on to the TextSink and ignored by the others.
+    """
+    if fmt == "csv":
+        return CSVSink(stream, fields)
+    elif fmt == "json":
+        return JSONSink(stream, fields)
+    elif fmt == "text":
+        return TextSink(stream, **text_layout)
+    raise ValueError("Unknown report format '%s'" % fmt)
+
+
+# Reports, as configurations of the above. The dated ones take the keywords
+# of `apply_filters`.
+
+def daily(manager, date, **filters):
+    """Rows of the time worked on each task on `date`"""
+    return by_date(manager, [date], **filters)
+
+
+def by_date(manager, dates, **filters):
+    """Rows of the time worked on each task on each of `dates`"""
+    return apply_filters(iter_durations_by_date(manager, dates), **filters)
+
+
+def weekly(manager, end, days_back=7, **filters):
+    """A {date, duration} row for each of the `days_back` days up to `end`,
+    newest first, including days with nothing worked
+    """
+    start = end - datetime.timedelta(days=days_back - 1)
+    dates = list(utils.date_range(start, end))
+    dates.reverse()
+    return group_by(by_date(manager, dates, **filters), "date", keys=dates)
+
+
+def timed_status(manager, status):
+    """Rows of the total time worked on each task with `status`"""
+    # Durations need the whole timelog, so skip the lazy load and let the
+    # task cache serve the running totals
+    tasks = manager.get_tasks_by_status(status, lazy=False)
+    return with_durations({"task": task} for task in tasks)
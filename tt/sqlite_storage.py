@@ -0,0 +1,413 @@
+import contextlib
+import itertools
+import os
+
+from tt import exceptions
+from tt import storage
+from tt import timelog
+from tt import utils
+from tt.task import Task
+
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE tasks (
+    task_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX tasks_status ON tasks (status);
+
+CREATE TABLE events (
+    task_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    PRIMARY KEY (task_id, seq)
+);
+CREATE INDEX events_time ON events (time);
+
+CREATE TABLE dates (
+    date TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    PRIMARY KEY (date, task_id)
+);
+"""
+
+# Journal order: by time, with a stop made in the same second as a start
+# coming first, as it does when switching tasks
+JOURNAL_ORDER = "time, status = 'started', rowid"
+
+# Keeps IN (...) lists under SQLite's limit on bound parameters
+CHUNK_SIZE = 500
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _marks(items):
+    return ",".join("?" * len(items))
+
+
+class SQLiteStorage(storage.Storage):
+    """Tasks kept in an SQLite database, `tt.db` in the tt directory.
+
+    `tasks` holds each task's name and current status, indexed by status,
+    and `events` its timelog, indexed by time, which makes it the journal
+    too. `dates` is the date index: a row for every date a task has a
+    timelog entry on or ran through. The completion cache and the daemon's
+    socket still live under state/.
+
+    Every change is made inside one `BEGIN IMMEDIATE` transaction held by
+    `locked`, so it's all-or-nothing without a transition record, and other
+    `tt` processes wait for it as they would for the plain-file repo lock.
+    """
+
+    def __init__(self, manager, lock_timeout=10):
+        storage.Storage.__init__(self, manager)
+        self.tt_dir = manager.tt_dir
+        self.db_file = storage.get_db_file(self.tt_dir)
+        self.lock_timeout = lock_timeout
+        self._db = None
+        self._depth = 0
+
+    @property
+    def db(self):
+        if self._db is None:
+            if not os.path.exists(self.db_file):
+                raise exceptions.DirectoryNotFound(
+                    "'%s' not found" % self.db_file)
+            self._db = self._connect()
+        return self._db
+
+    def _connect(self):
+        import sqlite3
+
+        # Transactions are begun explicitly, see `locked`. The daemon may
+        # use the connection from a thread other than the one that made it.
+        db = sqlite3.connect(self.db_file, timeout=self.lock_timeout,
+                             isolation_level=None, check_same_thread=False)
+        # Task names and statuses are byte strings everywhere else
+        db.text_factory = str
+        return db
+
+    def initialize(self):
+        os.makedirs(self.tt_dir)
+        os.makedirs(os.path.join(self.tt_dir, "state"))
+
+        self._db = self._connect()
+        # Readers, like the status line in a prompt hook, then don't wait
+        # for a status change to finish
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.executescript(SCHEMA)
+        self._db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold a write transaction on the database, rolling it back if the
+        body raises
+        """
+        import sqlite3
+
+        if self._depth:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError, e:
+            raise exceptions.LockTimeout(
+                "Timed out waiting for '%s': %s" % (self.db_file, e))
+        self._depth = 1
+        try:
+            yield
+        except:
+            self._depth = 0
+            self.db.execute("ROLLBACK")
+            # The completion cache may have been told about changes that
+            # never happened
+            self.manager.rebuild_completion_cache()
+            raise
+        self._depth = 0
+        self.db.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def transition(self, task_ids):
+        """The transaction held by `locked` already makes the changes
+        all-or-nothing
+        """
+        yield
+
+    def create_task(self, task):
+        import sqlite3
+
+        try:
+            self.db.execute(
+                "INSERT INTO tasks (task_id, name, status) VALUES (?, ?, ?)",
+                (task.task_id, task.name, task.status))
+        except sqlite3.IntegrityError:
+            raise exceptions.TaskAlreadyExists(
+                "'%s' already exists" % task.task_id)
+
+    def create_tasks(self, tasks, now):
+        seconds = utils.datetime_to_seconds(now)
+        date_str = utils.format_date_str(now)
+
+        task_ids = self._get_existing_task_ids(
+            [task.task_id for task in tasks])
+        added = []
+        failures = []
+        for task in tasks:
+            if task.task_id in task_ids:
+                failures.append((task.name, exceptions.TaskAlreadyExists(
+                    "'%s' already exists" % task.task_id)))
+            else:
+                task_ids.add(task.task_id)
+                added.append(task)
+
+        self.db.executemany(
+            "INSERT INTO tasks (task_id, name, status) VALUES (?, ?, ?)",
+            [(task.task_id, task.name, "pending") for task in added])
+        self.db.executemany(
+            "INSERT INTO events (task_id, seq, status, time) "
+            "VALUES (?, 0, 'pending', ?)",
+            [(task.task_id, seconds) for task in added])
+        self.db.executemany(
+            "INSERT OR IGNORE INTO dates (date, task_id) VALUES (?, ?)",
+            [(date_str, task.task_id) for task in added])
+        for task in added:
+            task.log = [("pending", now)]
+
+        return added, failures
+
+    def import_tasks(self, tasks):
+        task_ids = self._get_existing_task_ids(
+            [task.task_id for task in tasks])
+        imported = []
+        skipped = []
+        now = utils.get_now()
+        for task in tasks:
+            if task.task_id in task_ids:
+                skipped.append(task)
+                continue
+            task_ids.add(task.task_id)
+
+            self.db.execute(
+                "INSERT INTO tasks (task_id, name, status) VALUES (?, ?, ?)",
+                (task.task_id, task.name, task.status))
+            self.db.executemany(
+                "INSERT INTO events (task_id, seq, status, time) "
+                "VALUES (?, ?, ?, ?)",
+                [(task.task_id, seq, status, seconds) for seq, (status,
+                 seconds) in enumerate(task.log.iter_seconds())])
+            self._index_dates(task, now)
+            imported.append(task)
+
+        return imported, skipped
+
+    def _get_existing_task_ids(self, task_ids):
+        existing = set()
+        for chunk in _chunks(task_ids):
+            rows = self.db.execute(
+                "SELECT task_id FROM tasks WHERE task_id IN (%s)" %
+                _marks(chunk), chunk)
+            existing.update(row[0] for row in rows)
+        return existing
+
+    def _index_dates(self, task, now):
+        dates = self._get_task_dates(task, now)
+        self.db.executemany(
+            "INSERT OR IGNORE INTO dates (date, task_id) VALUES (?, ?)",
+            [(utils.format_date_str(date), task.task_id)
+             for date in dates])
+
+    def append_entry(self, task, status, dt):
+        dates = self._get_entry_dates(task, status, dt)
+        row = self.db.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM events WHERE task_id = ?",
+            (task.task_id,)).fetchone()
+        self.db.execute(
+            "INSERT INTO events (task_id, seq, status, time) "
+            "VALUES (?, ?, ?, ?)",
+            (task.task_id, row[0], status, utils.datetime_to_seconds(dt)))
+        self.db.execute("UPDATE tasks SET status = ? WHERE task_id = ?",
+                        (status, task.task_id))
+        self.db.executemany(
+            "INSERT OR IGNORE INTO dates (date, task_id) VALUES (?, ?)",
+            [(utils.format_date_str(date), task.task_id)
+             for date in dates])
+
+    def set_status(self, task_id, old_status, new_status):
+        # Closed tasks keep their row; the status column is all there is to
+        # the status table
+        if new_status is not None:
+            self.db.execute("UPDATE tasks SET status = ? WHERE task_id = ?",
+                            (new_status, task_id))
+
+    def delete_task(self, task_id):
+        for table in ("tasks", "events", "dates"):
+            self.db.execute("DELETE FROM %s WHERE task_id = ?" % table,
+                            (task_id,))
+
+    def refresh_task(self, task):
+        fresh = self.load_task(task.task_id)
+        task.name = fresh.name
+        task.status = fresh.status
+        task.log = fresh.log
+
+    def get_task_ids_by_status(self, status):
+        rows = self.db.execute(
+            "SELECT task_id FROM tasks WHERE status = ? ORDER BY task_id",
+            (status,))
+        return [row[0] for row in rows]
+
+    def load_task(self, task_id, lazy=False):
+        for task in self._load_tasks([task_id]):
+            return task
+        raise exceptions.BadTaskId("'%s' does not exist" % task_id)
+
+    def iter_all_tasks(self):
+        rows = self.db.execute(
+            "SELECT task_id, name, status FROM tasks ORDER BY rowid")
+        tasks = rows.fetchall()
+        logs = self._get_logs()
+        for task_id, name, status in tasks:
+            yield Task(manager=self.manager, task_id=task_id, name=name,
+                       status=status, log=logs.get(task_id))
+
+    def _load_tasks(self, task_ids):
+        """Yields the tasks with the given task_ids, in that order, skipping
+        any that don't exist. They're read a chunk at a time.
+        """
+        for chunk in _chunks(list(task_ids)):
+            marks = _marks(chunk)
+            rows = self.db.execute(
+                "SELECT task_id, name, status FROM tasks "
+                "WHERE task_id IN (%s)" % marks, chunk)
+            found = dict((row[0], row[1:]) for row in rows)
+            logs = self._get_logs("task_id IN (%s)" % marks, chunk)
+            for task_id in chunk:
+                if task_id not in found:
+                    continue
+                name, status = found[task_id]
+                yield Task(manager=self.manager, task_id=task_id, name=name,
+                           status=status, log=logs.get(task_id))
+
+    def _get_logs(self, where="1", params=()):
+        """Return {task_id: TimeLog} for the events matching `where`"""
+        rows = self.db.execute(
+            "SELECT task_id, status, time FROM events WHERE %s "
+            "ORDER BY task_id, seq" % where, params)
+        logs = {}
+        for task_id, entries in itertools.groupby(rows, lambda r: r[0]):
+            logs[task_id] = timelog.TimeLog.from_seconds(
+                (status, seconds) for _, status, seconds in entries)
+        return logs
+
+    def _get_task_ids_for_dates(self, dates):
+        task_ids = []
+        seen = set()
+        date_strs = [utils.format_date_str(date) for date in dates]
+        for chunk in _chunks(date_strs):
+            rows = self.db.execute(
+                "SELECT task_id FROM dates WHERE date IN (%s) "
+                "ORDER BY rowid" % _marks(chunk), chunk)
+            for (task_id,) in rows:
+                if task_id not in seen:
+                    seen.add(task_id)
+                    task_ids.append(task_id)
+        return task_ids
+
+    def _load_tasks_by_id(self, task_ids):
+        return self._load_tasks(task_ids)
+
+    def get_task_ids_for_date(self, date):
+        rows = self.db.execute(
+            "SELECT task_id FROM dates WHERE date = ? ORDER BY rowid",
+            (utils.format_date_str(date),))
+        return [row[0] for row in rows]
+
+    def get_journal_events(self, start=None, end=None):
+        where = []
+        params = []
+        if start:
+            where.append("time >= ?")
+            params.append(utils.datetime_to_seconds(start))
+        if end:
+            where.append("time < ?")
+            params.append(utils.datetime_to_seconds(end))
+        rows = self.db.execute(
+            "SELECT time, status, task_id FROM events WHERE %s ORDER BY %s" %
+            (" AND ".join(where) or "1", JOURNAL_ORDER), params)
+        for seconds, status, task_id in rows:
+            yield utils.seconds_to_datetime(seconds), status, task_id
+
+    def get_task_id_at(self, dt):
+        # Include status changes made during that very second
+        row = self.db.execute(
+            "SELECT status, task_id FROM events "
+            "WHERE time <= ? AND status IN ('started', 'stopped') "
+            "ORDER BY time DESC, status = 'started' DESC, rowid DESC "
+            "LIMIT 1", (utils.datetime_to_seconds(dt),)).fetchone()
+        if row is not None and row[0] == "started":
+            return row[1]
+        return None
+
+    def check(self, repair=True):
+        """Check each task's status against the last entry of its timelog,
+        and look for timelogs left without a task
+        """
+        report = storage.FsckReport()
+
+        def scan_tasks():
+            for task in self.iter_all_tasks():
+                report.num_tasks += 1
+                try:
+                    task.durations.check_valid()
+                except exceptions.StatusChangeException, e:
+                    report.invalid.append((task.task_id, str(e)))
+                if task.log and task.log[-1][0] != task.status:
+                    report.misplaced.append(
+                        (task.task_id, task.status, task.log[-1][0]))
+
+        def scan_orphans():
+            # A timelog left without its task, reported with its last
+            # status
+            rows = self.db.execute(
+                "SELECT task_id, status FROM events AS e "
+                "WHERE task_id NOT IN (SELECT task_id FROM tasks) "
+                "AND seq = (SELECT MAX(seq) FROM events "
+                "WHERE task_id = e.task_id) ORDER BY task_id")
+            report.orphans.extend(rows)
+
+        def repair_rows():
+            for task_id, _, status in report.misplaced:
+                self.set_status(task_id, None, status)
+            for task_id, _ in report.orphans:
+                self.delete_task(task_id)
+            self.manager.rebuild_completion_cache()
+
+        report.timed("scan tasks", scan_tasks)
+        report.timed("scan orphans", scan_orphans)
+        if repair:
+            report.timed("repair", repair_rows)
+
+        return report
+
+    def rebuild_date_index(self):
+        now = utils.get_now()
+        with self.locked():
+            self.db.execute("DELETE FROM dates")
+            for task in list(self.iter_all_tasks()):
+                self._index_dates(task, now)
+
+    def rebuild_journal(self):
+        """The events table is the journal, so there's nothing to do"""
+        pass
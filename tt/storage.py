@@ -0,0 +1,256 @@
+"""Where a TaskManager keeps its tasks.
+
+TaskManager and Task decide what happens to a task; a Storage records it.
+The default, tt.file_storage, is the plain-file layout described in
+docs/DESIGN.rst. tt.sqlite_storage keeps the same tasks in an SQLite
+database instead, so that status lookups and date queries are indexed.
+
+A repo's backend is fixed when it's created: an SQLite repo is a tt
+directory holding `tt.db`. `TaskManager.import_tasks` copies tasks between
+repos of either kind, which is what `tt import` and `tt export` use.
+"""
+import datetime
+import os
+import time
+
+from tt import exceptions
+from tt import utils
+
+
+BACKENDS = ("files", "sqlite")
+
+
+def get_db_file(tt_dir):
+    return os.path.join(tt_dir, "tt.db")
+
+
+def is_repo(tt_dir):
+    """Whether `tt_dir` holds a repo of either kind"""
+    return (os.path.isdir(os.path.join(tt_dir, "state")) or
+            os.path.exists(get_db_file(tt_dir)))
+
+
+def detect_backend(tt_dir):
+    """Return the backend of the repo at `tt_dir`; plain files unless it
+    holds an SQLite database
+    """
+    if os.path.exists(get_db_file(tt_dir)):
+        return "sqlite"
+    return "files"
+
+
+class FsckReport(object):
+    """What `Storage.check` found, and how long each phase took"""
+
+    def __init__(self):
+        self.num_tasks = 0
+        # (task_id, status) for links in state/status without a task file
+        self.orphans = []
+        # (task_id, status) for tasks whose status link was missing
+        self.unlinked = []
+        # (task_id, old_status, new_status) for links in the wrong place,
+        # new_status is None if the link shouldn't exist at all
+        self.misplaced = []
+        # (task_id, message) for tasks whose timelog breaks the interval
+        # rules of Durations. These need fixing by hand.
+        self.invalid = []
+        self.timings = []
+
+    def has_problems(self):
+        return bool(self.orphans or self.unlinked or self.misplaced or
+                    self.invalid)
+
+    def timed(self, phase, fn):
+        """Run one phase of the check, returning what `fn` does"""
+        start = time.time()
+        result = fn()
+        self.timings.append((phase, time.time() - start))
+        return result
+
+
+class Storage(object):
+    """The operations TaskManager and Task need from a backend.
+
+    Tasks are handed out as Task objects bound to `manager`. A task's
+    status is always that of the last entry in its timelog; the status
+    table only exists to find the tasks with a given status quickly.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def initialize(self):
+        """Create a brand new, empty repo"""
+        raise NotImplementedError
+
+    def save_cache(self):
+        """Persist anything worth keeping for the next run"""
+        pass
+
+    # Changes
+
+    def locked(self):
+        """Context manager holding exclusive access to the repo while a
+        status change reads and then writes it
+        """
+        raise NotImplementedError
+
+    def transition(self, task_ids):
+        """Context manager making the changes to `task_ids` in its body
+        all-or-nothing. Must be used with the lock held.
+        """
+        raise NotImplementedError
+
+    def create_task(self, task):
+        """Record a new task with no timelog, raising TaskAlreadyExists if
+        its task_id is taken
+        """
+        raise NotImplementedError
+
+    def create_tasks(self, tasks, now):
+        """Record many new pending tasks, each with a single 'pending' entry
+        at `now`, and index them. Returns (added, failures) as
+        `TaskManager.add_tasks` does.
+        """
+        raise NotImplementedError
+
+    def import_tasks(self, tasks):
+        """Record existing tasks, with their whole timelogs, skipping those
+        whose task_id is taken. Returns (imported, skipped) lists of tasks.
+        """
+        raise NotImplementedError
+
+    def append_entry(self, task, status, dt):
+        """Add a (status, dt) entry to the end of the task's timelog, along
+        with whatever indexes it touches. `task.log` doesn't hold it yet.
+        """
+        raise NotImplementedError
+
+    def _get_entry_dates(self, task, status, dt):
+        """Return the dates for the date index of a (status, dt) entry about
+        to be appended to the task: its own first, then, if it stops the
+        task days after it was started, the days in between, which the
+        task was worked on too though its log has no entries for them
+        """
+        dates = [dt.date()]
+        log = task.log
+        if status == "stopped" and log and log[-1][0] == "started":
+            one_day = datetime.timedelta(days=1)
+            dates.extend(utils.date_range(log[-1][1].date() + one_day,
+                                          dt.date() - one_day))
+        return dates
+
+    def set_status(self, task_id, old_status, new_status):
+        """Move the task in the status table; None for either end means it
+        isn't in the table
+        """
+        raise NotImplementedError
+
+    def delete_task(self, task_id):
+        raise NotImplementedError
+
+    def refresh_task(self, task):
+        """Reload the task's name, status and log, in case another process
+        changed them since it was loaded
+        """
+        raise NotImplementedError
+
+    # Lookups
+
+    def get_task_ids_by_status(self, status):
+        raise NotImplementedError
+
+    def load_task(self, task_id, lazy=False):
+        """Return the task, raising BadTaskId if there's no such task. With
+        `lazy`, the backend may put off reading the timelog.
+        """
+        raise NotImplementedError
+
+    def iter_all_tasks(self):
+        raise NotImplementedError
+
+    def get_tasks_on_dates(self, dates):
+        """Yields each task with a timelog entry on, or that was running
+        through, any of the given dates, loading each at most once
+        """
+        dates = list(dates)
+        task_ids = self._get_task_ids_for_dates(dates)
+        seen = set(task_ids)
+
+        # The index only learns the days a task ran through once it's
+        # stopped, so the running task has to be checked separately
+        started_task_id = self.manager.get_started_task_id()
+        if started_task_id is not None and started_task_id not in seen:
+            task_ids.append(started_task_id)
+
+        for task in self._load_tasks_by_id(task_ids):
+            if task.task_id == started_task_id and task.task_id not in seen:
+                running = task.durations.get_running_since()
+                if running is None or running.date() > max(dates):
+                    continue
+            yield task
+
+    def _get_task_ids_for_dates(self, dates):
+        """Return the task_ids the date index lists for any of `dates`, each
+        once, in index order
+        """
+        task_ids = []
+        seen = set()
+        for date in dates:
+            for task_id in self.get_task_ids_for_date(date):
+                if task_id not in seen:
+                    seen.add(task_id)
+                    task_ids.append(task_id)
+        return task_ids
+
+    def _load_tasks_by_id(self, task_ids):
+        """Yields the tasks with the given task_ids, in that order, skipping
+        any that don't exist
+        """
+        raise NotImplementedError
+
+    def get_task_ids_for_date(self, date):
+        raise NotImplementedError
+
+    def _get_task_dates(self, task, now):
+        """Return the dates for the date index of a whole task: those of its
+        log entries, and the days it ran through without one
+        """
+        dates = set(dt.date() for _, dt in task.log)
+        dates.update(task.durations.get_dates(now))
+        return dates
+
+    def get_journal_events(self, start=None, end=None):
+        """Yields (datetime, status, task_id) for each status change from
+        `start` up to, but not including, `end`, in time order
+        """
+        raise NotImplementedError
+
+    def get_task_id_at(self, dt):
+        """Return the task_id of the task that was started at `dt`, or None
+        if no task was running then
+        """
+        raise NotImplementedError
+
+    def get_task_file(self, task_id):
+        """Return the file a user can edit to change the task"""
+        raise exceptions.TTException(
+            "'%s' isn't kept in a file that can be edited" % task_id)
+
+    # Maintenance
+
+    def check(self, repair=True):
+        """Check the repo's indexes against its tasks, fixing them up unless
+        `repair` is False. Returns an FsckReport.
+        """
+        raise NotImplementedError
+
+    def rebuild_date_index(self):
+        raise NotImplementedError
+
+    def rebuild_journal(self):
+        raise NotImplementedError
+
+    def archive_closed_tasks(self, cutoff):
+        raise exceptions.TTException(
+            "Only plain-file repos are archived")
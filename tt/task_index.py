@@ -0,0 +1,180 @@
+"""The task index: a line of "status task_id name" for every open task,
+sorted by task_id, in state/completion.
+
+Bash completion reads it directly, and `TaskManager.resolve_task` looks up
+the task_id prefixes and bits of names given to `tt start` and the like in
+it. It's kept as the sorted file rather than parsed into a structure: the
+file is read as one string, binary searched by offset for task_ids, and
+searched whole by str.find for names, and an update writes its lines between
+the unchanged parts of that string around it. Splitting the file into
+lines would cost more than all of that put together: with 100k open tasks
+an update or a lookup by task_id takes a few milliseconds, and a search of
+the names, mostly spent lower-casing them, under twenty.
+"""
+import errno
+import os
+
+
+def _get_line_end(contents, start):
+    end = contents.find("\n", start)
+    if end == -1:
+        return len(contents)
+    return end
+
+
+def _get_task_id(line):
+    parts = line.split(" ", 2)
+    if len(parts) < 2:
+        return ""
+    return parts[1]
+
+
+def _search(contents, task_id):
+    """Return the offset of the line for `task_id` in the sorted index
+    `contents`, or of where it would go
+    """
+    lo, hi = 0, len(contents)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = max(lo, contents.rfind("\n", 0, mid) + 1)
+        end = _get_line_end(contents, start)
+        if _get_task_id(contents[start:end]) < task_id:
+            lo = end + 1
+        else:
+            hi = start
+    return min(lo, len(contents))
+
+
+def get_task_date_str(task_id):
+    """Return the YYYY_MM_DD a task_id was made on, which sorts by date"""
+    return task_id.rsplit("-", 1)[-1]
+
+
+class TaskIndex(object):
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+
+    def _read(self):
+        """Return the index as one string, or None if there isn't one"""
+        try:
+            with open(self.index_file, "r") as f:
+                contents = f.read()
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return None
+            else:
+                raise
+
+        first_line = contents[:contents.find("\n")]
+        if first_line and first_line.count(" ") < 2:
+            # Written before names were kept, so it has to be rebuilt
+            return None
+        return contents
+
+    def _write(self, contents, splices=()):
+        """Write `contents`, with each (start, end, lines) of `splices`
+        replacing contents[start:end], in order
+        """
+        tmp_file = "%s.tmp.%d" % (self.index_file, os.getpid())
+        with open(tmp_file, "w") as f:
+            pos = 0
+            for start, end, lines in splices:
+                # Buffers, to not copy the unchanged parts
+                f.write(buffer(contents, pos, start - pos))
+                f.write(lines)
+                pos = end
+            f.write(buffer(contents, pos))
+        os.rename(tmp_file, self.index_file)
+
+    def get_entries(self):
+        """Return the (status, task_id, name) entries, or None if there's no
+        index
+        """
+        contents = self._read()
+        if contents is None:
+            return None
+        return [tuple(line.split(" ", 2)) for line in contents.splitlines()]
+
+    def write(self, entries):
+        """Replace the index with (status, task_id, name) `entries`"""
+        self._write("".join("%s %s %s\n" % entry
+                            for entry in sorted(entries, key=lambda e: e[1])))
+
+    def update(self, changes):
+        """Apply (task_id, status, name) `changes`, where a status of None
+        drops the task. Returns False, having changed nothing, if there's no
+        index to update.
+        """
+        contents = self._read()
+        if contents is None:
+            return False
+
+        # The last change to each task counts
+        changes = dict((task_id, (status, name))
+                       for task_id, status, name in changes)
+        splices = []
+        for task_id in sorted(changes):
+            status, name = changes[task_id]
+            start = end = _search(contents, task_id)
+            line_end = _get_line_end(contents, start)
+            if _get_task_id(contents[start:line_end]) == task_id:
+                end = min(line_end + 1, len(contents))
+            line = ""
+            if status is not None:
+                line = "%s %s %s\n" % (status, task_id, name)
+            splices.append((start, end, line))
+        self._write(contents, splices)
+        return True
+
+    def get(self, task_id):
+        """Return the (status, task_id, name) entry for `task_id`, or None if
+        it isn't there. Returns None too if there's no index.
+        """
+        contents = self._read()
+        if contents is None:
+            return None
+        start = _search(contents, task_id)
+        entry = tuple(contents[start:_get_line_end(contents, start)].split(
+            " ", 2))
+        if len(entry) == 3 and entry[1] == task_id:
+            return entry
+        return None
+
+    def find(self, query):
+        """Return the (status, task_id, name) entries whose task_id starts
+        with `query` or whose name contains it, ignoring case, in task_id
+        order. Returns None if there's no index.
+        """
+        contents = self._read()
+        if contents is None:
+            return None
+        query = query.lower()
+        if not query:
+            return []
+        found = {}
+
+        # Task_ids are lower case and sorted, so those starting with the
+        # query are all together
+        start = _search(contents, query)
+        while start < len(contents):
+            end = _get_line_end(contents, start)
+            entry = tuple(contents[start:end].split(" ", 2))
+            if len(entry) < 3 or not entry[1].startswith(query):
+                break
+            found[entry[1]] = entry
+            start = end + 1
+
+        # Then every line holding the query anywhere, which is left to
+        # str.find, keeping those where it's in the name
+        lowered = contents.lower()
+        pos = lowered.find(query)
+        while pos != -1:
+            start = lowered.rfind("\n", 0, pos) + 1
+            end = _get_line_end(lowered, pos)
+            entry = tuple(contents[start:end].split(" ", 2))
+            if len(entry) == 3 and query in entry[2].lower():
+                found[entry[1]] = entry
+            pos = lowered.find(query, end)
+
+        return [found[task_id] for task_id in sorted(found)]
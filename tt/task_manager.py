@@ -1,13 +1,57 @@
-import errno
+import datetime
 import os
 
 from tt import exceptions
+from tt import storage
+from tt import utils
 from tt.task import Task
+from tt.task_index import TaskIndex, get_task_date_str
+
 
 class TaskManager(object):
 
-    def __init__(self, tt_dir):
+    POOL_TYPES = ("thread", "process")
+
+    def __init__(self, tt_dir, workers=0, pool_type="thread",
+                 lock_timeout=10, backend=None):
+        """
+        `workers` is the number of workers used to load task files in bulk,
+        0 loads them serially. Threads suit filesystems where each open is a
+        round trip (e.g. NFS); processes suit local disks where parsing is
+        the bottleneck.
+
+        `lock_timeout` is how many seconds a status change waits for
+        another `tt` process to finish before giving up.
+
+        `backend` is one of `storage.BACKENDS`. By default it's whichever
+        the repo at `tt_dir` already uses, or plain files for a new repo.
+        """
+        if pool_type not in self.POOL_TYPES:
+            raise ValueError("pool_type must be one of %s" %
+                             ", ".join(self.POOL_TYPES))
         self.tt_dir = os.path.expanduser(tt_dir)
+        if backend is None:
+            backend = storage.detect_backend(self.tt_dir)
+        if backend not in storage.BACKENDS:
+            raise ValueError("backend must be one of %s" %
+                             ", ".join(storage.BACKENDS))
+        self.backend = backend
+        self.workers = workers
+        self.pool_type = pool_type
+        self.lock_timeout = lock_timeout
+        self.storage = self._make_storage()
+        self.task_index = TaskIndex(self._get_completion_cache_file())
+
+    def _make_storage(self):
+        if self.backend == "sqlite":
+            from tt import sqlite_storage
+            return sqlite_storage.SQLiteStorage(
+                self, lock_timeout=self.lock_timeout)
+        else:
+            from tt import file_storage
+            return file_storage.FileStorage(
+                self, workers=self.workers, pool_type=self.pool_type,
+                lock_timeout=self.lock_timeout)
 
     def get_task_file(self, task):
         """Returns task file for given task"""
@@ -17,43 +61,140 @@ class TaskManager(object):
     def add_task(self, name):
         """This adds a task and adjusts the TaskManager state accordingly"""
         task = Task.create(manager=self, name=name, status="pending")
-        task.initialize_task()
+        with self.storage.locked():
+            with self.storage.transition([task.task_id]):
+                task.initialize_task()
         return task
 
+    def add_tasks(self, names):
+        """Add many tasks at once, e.g. when importing from another tracker.
+
+        Rather than going through `add_task` for each name, the storage
+        writes the whole batch in one go, and the completion cache is
+        written once.
+
+        Returns (tasks, failures), where failures is a list of (name,
+        TTException) for the names that couldn't be added. A failure
+        doesn't stop the rest of the batch.
+        """
+        # One time for the whole batch, so that it all goes in one day's
+        # task dir even if it runs over midnight
+        now = utils.get_now()
+        tasks = [Task.create(manager=self, name=name, status="pending",
+                             now=now)
+                 for name in names]
+        if not tasks:
+            return [], []
+
+        with self.storage.locked():
+            added, failures = self.storage.create_tasks(tasks, now)
+            if added:
+                self.update_completion_cache(
+                    [(task.task_id, "pending", task.name) for task in added])
+
+        return added, failures
+
+    def import_tasks(self, tasks):
+        """Copy tasks, timelogs and all, from another repo, skipping any
+        whose task_id is already taken here. Returns (imported, skipped)
+        lists of tasks.
+        """
+        tasks = [Task(manager=self, task_id=task.task_id, name=task.name,
+                      status=task.status, log=task.log.copy())
+                 for task in tasks]
+        with self.storage.locked():
+            self._check_one_started(tasks)
+            imported, skipped = self.storage.import_tasks(tasks)
+            if imported:
+                self.rebuild_completion_cache()
+        return imported, skipped
+
+    def _check_one_started(self, tasks):
+        """Raise StatusChangeException, before anything is imported, if
+        importing `tasks` would leave more than one task started
+        """
+        started = []
+        for task in tasks:
+            if task.status != "started":
+                continue
+            try:
+                self.storage.load_task(task.task_id, lazy=True)
+            except exceptions.BadTaskId:
+                started.append(task.task_id)
+            # Otherwise it's already here, and will be skipped
+
+        started_task_id = self.get_started_task_id()
+        if started_task_id is not None:
+            started.append(started_task_id)
+        if len(started) > 1:
+            raise exceptions.StatusChangeException(
+                "Only one task can be started, stop all but one of %s "
+                "first" % ", ".join(sorted(started)))
+
     def start_task(self, task):
         """Start a task, stopping the current one"""
-        cur_task = self.get_started_task()
-        if cur_task:
-            cur_task.stop()
+        with self.storage.locked():
+            task.refresh()
+            # Before stopping the current task, which the file backend
+            # couldn't take back. A started task, the current one included,
+            # fails this too.
+            task.check_can_start()
+            cur_task = self.get_started_task()
+            task_ids = [task.task_id]
+            if cur_task:
+                task_ids.append(cur_task.task_id)
+
+            with self.storage.transition(task_ids):
+                if cur_task:
+                    cur_task.stop()
 
-        task.start()
+                task.start()
 
     def stop_current_task(self):
-        cur_task = self.get_started_task()
-        if not cur_task:
-            raise exceptions.StatusChangeException("No started tasks")
+        with self.storage.locked():
+            cur_task = self.get_started_task()
+            if not cur_task:
+                raise exceptions.StatusChangeException("No started tasks")
 
-        cur_task.stop()
+            with self.storage.transition([cur_task.task_id]):
+                cur_task.stop()
 
     def delete_task(self, task):
-        task.delete()
+        with self.storage.locked():
+            task.refresh()
+            with self.storage.transition([task.task_id]):
+                task.delete()
 
     def done_task(self, task):
         """Finish a task, if it's in progress, stop it, then finish it """
-        if task.status == "started":
-            task.stop()
+        with self.storage.locked():
+            task.refresh()
+            with self.storage.transition([task.task_id]):
+                if task.status == "started":
+                    task.stop()
 
-        task.done()
+                task.done()
 
     def close_done_tasks(self):
         """Close all done tasks"""
-        tasks = self.get_tasks_by_status("done")
-        for task in tasks:
-            task.close()
+        with self.storage.locked():
+            tasks = list(self.get_tasks_by_status("done"))
+            with self.storage.transition([task.task_id for task in tasks]):
+                for task in tasks:
+                    task.close()
+
+    def rebuild_state(self, repair=True):
+        """Check the status table against the tasks, which are the source
+        of truth, and fix it up unless `repair` is False. Returns an
+        FsckReport.
+        """
+        with self.storage.locked():
+            return self.storage.check(repair)
 
     def initialize_state(self):
         """Creates a brand new instance of tt"""
-        self._create_tt_dir()
+        self.storage.initialize()
+        self.rebuild_completion_cache()
 
     def get_started_task_id(self):
         task_ids = self.get_task_ids_by_status("started")
@@ -66,43 +207,120 @@ class TaskManager(object):
         return task
 
     def get_task_ids_by_status(self, status):
-        status_dir = self._get_status_dir(status)
-        try:
-            task_ids = os.listdir(status_dir)
-        except OSError, e:
-            if e.errno == errno.ENOENT:
-                raise exceptions.DirectoryNotFound(
-                    "'%s' not found" % status_dir)
-            else:
-                raise
-        return task_ids
-
-    def get_tasks_by_status(self, status):
+        return self.storage.get_task_ids_by_status(status)
+
+    def get_tasks_by_status(self, status, lazy=True):
+        """Yields the tasks with the given status. By default these are loaded
+        lazily, since listing callers often only need the names.
+        """
         task_ids = self.get_task_ids_by_status(status)
         for task_id in task_ids:
-            task = self.get_task(task_id)
+            task = self.get_task(task_id, lazy=lazy)
             yield task
 
-    def get_task(self, task_id):
-        task = Task.load(self, task_id)
-        return task
+    def get_task(self, task_id, lazy=False):
+        return self.storage.load_task(task_id, lazy=lazy)
 
     def get_all_tasks(self):
         """Yields every task in the system"""
-        tasks_dir = self._get_tasks_dir()
-        for root, dirs, files in os.walk(tasks_dir):
-            for file in files:
-                task_file = os.path.join(root, file)
-                task = Task.load_from_file(self, task_file)
-                yield task
+        return self.storage.iter_all_tasks()
+
+    def archive_closed_tasks(self, cutoff):
+        """Move tasks closed before the `cutoff` date out of tasks/ and into
+        the archive, returning their task_ids
+        """
+        with self.storage.locked():
+            return self.storage.archive_closed_tasks(cutoff)
+
+    def resolve_task(self, query, statuses=None, most_recent=True):
+        """Return the task `query` refers to: its task_id, the start of its
+        task_id or part of its name, among the open tasks with one of
+        `statuses`, or all of them by default. A whole task_id is taken as
+        is, whatever the task's status.
+
+        When several tasks match and `most_recent` is set, the one made last
+        is taken, unless another was made the same day. Otherwise, that's an
+        AmbiguousTaskId.
+        """
+        if self.task_index.get(query) is not None:
+            return self.get_task(query)
+        if "-" in query:
+            # Slugs have no dashes, so this could be the task_id of a closed
+            # task, which isn't in the index
+            try:
+                return self.get_task(query)
+            except exceptions.BadTaskId:
+                pass
+
+        matches = self.task_index.find(query)
+        if matches is None:
+            self.rebuild_completion_cache()
+            matches = self.task_index.find(query)
+        task_ids = [task_id for status, task_id, _ in matches
+                    if statuses is None or status in statuses]
+        if not task_ids:
+            raise exceptions.BadTaskId("'%s' doesn't match any %stask" % (
+                query, "%s " % " or ".join(statuses) if statuses else ""))
+        if len(task_ids) > 1 and most_recent:
+            task_ids.sort(key=get_task_date_str, reverse=True)
+            newest = get_task_date_str(task_ids[0])
+            if get_task_date_str(task_ids[1]) != newest:
+                task_ids = task_ids[:1]
+        if len(task_ids) > 1:
+            shown = ", ".join(sorted(task_ids)[:10])
+            if len(task_ids) > 10:
+                shown += ", ..."
+            raise exceptions.AmbiguousTaskId(
+                "'%s' matches %d tasks: %s" % (query, len(task_ids), shown))
+        return self.get_task(task_ids[0])
+
+    def update_completion_cache(self, changes):
+        """Record new task statuses in the completion cache, which is the
+        task index. `changes` is a list of (task_id, status, name), where a
+        status of None drops the task from the cache.
+
+        The cache must be written *after* the status table changes, since
+        the bash completion hook treats a status dir newer than the cache as
+        a sign that the cache is stale.
+        """
+        if not self.task_index.update(changes):
+            self.rebuild_completion_cache()
+
+    def reindex_task(self, task_id):
+        """Update the task's entry in the completion cache after it's been
+        edited by hand
+        """
+        with self.storage.locked():
+            task = self.get_task(task_id, lazy=True)
+            if task.status in Task.DIRECTORY_STATUSES:
+                self.update_completion_cache(
+                    [(task.task_id, task.status, task.name)])
+
+    def rebuild_completion_cache(self):
+        """Recreate the completion cache from the state/status table"""
+        entries = []
+        for status in Task.DIRECTORY_STATUSES:
+            for task in self.get_tasks_by_status(status):
+                entries.append((status, task.task_id, task.name))
+        self.task_index.write(entries)
+
+    def save_cache(self):
+        """Persist tasks parsed since the last save so the next run doesn't
+        have to parse them again
+        """
+        self.storage.save_cache()
+
+    def get_tasks_on_date(self, date):
+        """Yields tasks that have at least one timelog entry on the given
+        date
+        """
+        return self.get_tasks_on_dates([date])
 
     def get_tasks_with_status_on_date(self, status, date):
         """Return tasks that have a timelog entry of the given status on the
         given date. `date` should be a datetime or datetime.date obj
-
-        Since this scans all tasks, this is very expensive.
         """
-        tasks = self.get_all_tasks()
+        tasks = self.get_tasks_on_date(date)
         for task in tasks:
             entries = task.get_log_entries_for_date(date)
             statuses = [s for s, _ in entries]
@@ -110,47 +328,95 @@ class TaskManager(object):
                 yield task
 
     def get_tasks_worked_on_date(self, date):
-        """Tasks were 'worked' on a date if they were either started or
-        stopped on that date
+        """Tasks were 'worked' on a date if they were started, stopped or
+        running at some point that date
         """
-        tasks = self.get_all_tasks()
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        now = utils.get_now()
+        tasks = self.get_tasks_on_date(date)
         for task in tasks:
-            entries = task.get_log_entries_for_date(date)
-            for status, dt in entries:
-                if status in ('started', 'stopped'):
-                    yield task
-                    break
+            if date in task.durations.get_durations_by_date(date, date, now):
+                yield task
 
-    def _create_tt_dir(self):
+    def get_tasks_on_dates(self, dates):
+        """Yields each task with a timelog entry on, or that was running
+        through, any of the given dates, loading every task at most once
         """
-.tt/
-    ttconfig
-    state/
-        status/
-            pending/
-            started/
-            stopped/
-            done/
-    tasks/
+        return self.storage.get_tasks_on_dates(dates)
+
+    def get_durations_by_date(self, start, end):
+        """Return the time worked on each task for every date from `start` to
+        `end`, inclusive.
+
+        The result maps each date in the range to a list of (task, duration)
+        tuples; dates with no work map to an empty list. Each task is loaded
+        once, and only the spans of its log that fall in the range are
+        looked at, no matter how many days it spans.
         """
-        os.makedirs(self.tt_dir)
+        dates = list(utils.date_range(start, end))
+        durations_by_date = dict((date, []) for date in dates)
 
-        for status in Task.DIRECTORY_STATUSES:
-            status_dir = self._get_status_dir(status)
-            os.makedirs(status_dir)
+        now = utils.get_now()
+        for task in self.get_tasks_on_dates(dates):
+            task_durations = task.durations.get_durations_by_date(start, end,
+                                                                  now)
+            for date in sorted(task_durations):
+                durations_by_date[date].append((task, task_durations[date]))
+
+        return durations_by_date
 
-        tasks_dir = self._get_tasks_dir()
-        os.makedirs(tasks_dir)
+    def get_task_ids_for_date(self, date):
+        """Return the task_ids with a timelog entry on the given date"""
+        return self.storage.get_task_ids_for_date(date)
+
+    def rebuild_journal(self):
+        """Recreate the journal from the tasks"""
+        with self.storage.locked():
+            self.storage.rebuild_journal()
+
+    def get_journal_events(self, start=None, end=None):
+        """Yields (datetime, status, task_id) for each status change from
+        `start` up to, but not including, `end`
+        """
+        return self.storage.get_journal_events(start, end)
+
+    def get_task_id_at(self, dt):
+        """Return the task_id of the task that was started at `dt`, or None
+        if no task was running then
+        """
+        task_id = self.storage.get_task_id_at(dt)
+        if task_id is None:
+            return None
+        try:
+            self.storage.load_task(task_id, lazy=True)
+        except exceptions.BadTaskId:
+            # Deleting a task leaves its status changes in the journal, but
+            # what it was worked on no longer counts
+            return None
+        return task_id
+
+    def get_context_switches(self, start, end):
+        """Return the number of times a task was started between `start` and
+        `end`, bucketed by hour as {datetime_of_hour: count}
+        """
+        switches = {}
+        for dt, status, task_id in self.get_journal_events(start, end):
+            if status == "started":
+                hour = dt.replace(minute=0, second=0)
+                switches[hour] = switches.get(hour, 0) + 1
+        return switches
+
+    def rebuild_date_index(self):
+        """Recreate the date index from the tasks"""
+        with self.storage.locked():
+            self.storage.rebuild_date_index()
 
     def _get_state_dir(self):
         state_dir = os.path.join(self.tt_dir, "state")
         return state_dir
 
-    def _get_status_dir(self, status):
+    def _get_completion_cache_file(self):
         state_dir = self._get_state_dir()
-        status_dir = os.path.join(state_dir, "status", status)
-        return status_dir
-
-    def _get_tasks_dir(self):
-        tasks_dir = os.path.join(self.tt_dir, "tasks")
-        return tasks_dir
+        cache_file = os.path.join(state_dir, "completion")
+        return cache_file
@@ -0,0 +1,130 @@
+import array
+
+from tt import utils
+
+
+# The statuses tt writes, in the order of their codes. These must only ever
+# be added to, since the codes end up in the task cache.
+STATUSES = ("pending", "started", "stopped", "done", "closed", "deleted")
+STATUS_CODES = dict((status, code) for code, status in enumerate(STATUSES))
+
+
+class TimeLog(object):
+    """A task's timelog, stored compactly.
+
+    Rather than a list of (status, datetime) tuples, a timelog keeps each
+    entry as a status code in an array('b') and seconds since the epoch in
+    an array('l'), which is a handful of bytes per entry instead of a tuple,
+    a string reference and a datetime. It still behaves like the list it
+    replaces: iterating, indexing and appending all deal in (status,
+    datetime), with the datetimes only built as they're asked for.
+
+    A status tt doesn't know about, from a hand-edited file, is kept in
+    `other_statuses` and given a code after the known ones.
+    """
+
+    __slots__ = ("codes", "times", "other_statuses")
+
+    def __init__(self, entries=()):
+        self.codes = array.array('b')
+        self.times = array.array('l')
+        self.other_statuses = None
+        for entry in entries:
+            self.append(entry)
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Parse the '<status> <timestamp>' lines of a task file"""
+        log = cls()
+        parse = utils.parse_timestamp_seconds
+        append_code = log.codes.append
+        append_time = log.times.append
+        for line in lines:
+            status, timestamp = line.rstrip('\n').split(" ", 1)
+            seconds = parse(timestamp)
+            append_code(log._get_code(status))
+            append_time(seconds)
+        return log
+
+    @classmethod
+    def from_seconds(cls, entries):
+        """Build a timelog from (status, seconds since the epoch) pairs"""
+        log = cls()
+        for status, seconds in entries:
+            log.codes.append(log._get_code(status))
+            log.times.append(seconds)
+        return log
+
+    def _get_code(self, status):
+        try:
+            return STATUS_CODES[status]
+        except KeyError:
+            pass
+
+        if self.other_statuses is None:
+            self.other_statuses = []
+        if status not in self.other_statuses:
+            self.other_statuses.append(status)
+        return len(STATUSES) + self.other_statuses.index(status)
+
+    def get_status(self, code):
+        if code < len(STATUSES):
+            return STATUSES[code]
+        return self.other_statuses[code - len(STATUSES)]
+
+    def append(self, entry):
+        status, dt = entry
+        self.codes.append(self._get_code(status))
+        self.times.append(utils.datetime_to_seconds(dt))
+
+    def copy(self):
+        log = TimeLog()
+        log.codes = array.array('b', self.codes)
+        log.times = array.array('l', self.times)
+        if self.other_statuses is not None:
+            log.other_statuses = list(self.other_statuses)
+        return log
+
+    def iter_seconds(self):
+        """Yields (status, seconds since the epoch) without building any
+        datetimes
+        """
+        get_status = self.get_status
+        for code, seconds in zip(self.codes, self.times):
+            yield get_status(code), seconds
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        to_datetime = utils.seconds_to_datetime
+        for status, seconds in self.iter_seconds():
+            yield status, to_datetime(seconds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return (self.get_status(self.codes[index]),
+                utils.seconds_to_datetime(self.times[index]))
+
+    def __eq__(self, other):
+        if isinstance(other, TimeLog):
+            return list(self.iter_seconds()) == list(other.iter_seconds())
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "TimeLog(%r)" % list(self)
+
+    def __getstate__(self):
+        return (self.codes.tostring(), self.times.tostring(),
+                self.other_statuses)
+
+    def __setstate__(self, state):
+        codes, times, self.other_statuses = state
+        self.codes = array.array('b')
+        self.codes.fromstring(codes)
+        self.times = array.array('l')
+        self.times.fromstring(times)
@@ -27,6 +27,90 @@ def get_datetime_from_str(datetime_str):
     return datetime.datetime.strptime(datetime_str, fmt)
 
 
+# Maps 'YYYY-MM-DD' prefixes to (year, month, day); a task file only spans a
+# handful of dates so this hits almost every time
+_DATE_PREFIX_CACHE = {}
+_DATE_PREFIX_CACHE_MAX = 4096
+
+
+def parse_datetime_str(datetime_str):
+    """Parse a 'YYYY-MM-DD HH:MM:SS' timestamp.
+
+    This is a fixed-width parser that avoids the overhead of `strptime`.
+    Anything that doesn't look exactly like that format is handed to
+    `get_datetime_from_str`, which either parses it or raises ValueError.
+    """
+    s = datetime_str
+    if (len(s) != 19 or s[10] != " " or s[13] != ":" or s[16] != ":" or
+            not (s[11:13] + s[14:16] + s[17:19]).isdigit()):
+        return get_datetime_from_str(datetime_str)
+
+    date_str = s[:10]
+    try:
+        year, month, day = _DATE_PREFIX_CACHE[date_str]
+    except KeyError:
+        if (s[4] != "-" or s[7] != "-" or
+                not (s[0:4] + s[5:7] + s[8:10]).isdigit()):
+            return get_datetime_from_str(datetime_str)
+
+        year, month, day = int(s[0:4]), int(s[5:7]), int(s[8:10])
+        if len(_DATE_PREFIX_CACHE) >= _DATE_PREFIX_CACHE_MAX:
+            _DATE_PREFIX_CACHE.clear()
+        _DATE_PREFIX_CACHE[date_str] = (year, month, day)
+
+    try:
+        return datetime.datetime(year, month, day,
+                                 int(s[11:13]), int(s[14:16]), int(s[17:19]))
+    except ValueError:
+        # Out of range field, e.g. month 13, let strptime report it
+        return get_datetime_from_str(datetime_str)
+
+
+# Naive datetimes are stored as seconds since this, treating them as UTC so
+# that no timezone or DST rules come into it
+EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+def datetime_to_seconds(dt):
+    """Return a naive datetime as whole seconds since the epoch"""
+    return ((dt.toordinal() - _EPOCH_ORDINAL) * 86400 + dt.hour * 3600 +
+            dt.minute * 60 + dt.second)
+
+
+def seconds_to_datetime(seconds):
+    """Inverse of `datetime_to_seconds`"""
+    return EPOCH + datetime.timedelta(seconds=seconds)
+
+
+# Maps 'YYYY-MM-DD' prefixes to the seconds since the epoch at midnight
+_DATE_SECONDS_CACHE = {}
+
+
+def parse_timestamp_seconds(datetime_str):
+    """Parse a 'YYYY-MM-DD HH:MM:SS' timestamp straight to seconds since the
+    epoch, without building a datetime, falling back to
+    `parse_datetime_str` for anything unusual
+    """
+    s = datetime_str
+    if (len(s) == 19 and s[10] == " " and s[13] == ":" and s[16] == ":" and
+            (s[11:13] + s[14:16] + s[17:19]).isdigit()):
+        date_str = s[:10]
+        midnight = _DATE_SECONDS_CACHE.get(date_str)
+        if midnight is None:
+            dt = parse_datetime_str(date_str + " 00:00:00")
+            midnight = datetime_to_seconds(dt)
+            if len(_DATE_SECONDS_CACHE) >= _DATE_PREFIX_CACHE_MAX:
+                _DATE_SECONDS_CACHE.clear()
+            _DATE_SECONDS_CACHE[date_str] = midnight
+
+        hour, minute, second = int(s[11:13]), int(s[14:16]), int(s[17:19])
+        if hour < 24 and minute < 60 and second < 60:
+            return midnight + hour * 3600 + minute * 60 + second
+
+    return datetime_to_seconds(parse_datetime_str(datetime_str))
+
+
 def get_date_from_str(date_str):
     fmt = "%Y-%m-%d"
     return datetime.datetime.strptime(date_str, fmt).date()
@@ -47,6 +131,66 @@ def date2datetime(date1):
     return datetime1
 
 
+def date_range(start, end):
+    """Yield each date from `start` to `end`, inclusive"""
+    one_day = datetime.timedelta(days=1)
+    date = start
+    while date <= end:
+        yield date
+        date += one_day
+
+
+def get_last_day_of_month(date1):
+    """Return the date of the last day in the month of `date1`"""
+    if date1.month == 12:
+        first_of_next = datetime.date(date1.year + 1, 1, 1)
+    else:
+        first_of_next = datetime.date(date1.year, date1.month + 1, 1)
+    return first_of_next - datetime.timedelta(days=1)
+
+
+def read_last_line(f, block_size=512):
+    """Return the last line of an open file without reading the whole thing,
+    by reading backwards from the end in blocks
+    """
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    pos = end
+    data = ""
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+        # Ignore the trailing newline of the last line itself
+        newline = data.rfind("\n", 0, len(data) - 1)
+        if newline != -1:
+            return data[newline + 1:]
+    return data
+
+
+def iter_lines_reversed(f, end, block_size=4096):
+    """Yield the lines of an open file that end at or before byte offset
+    `end`, last line first. `end` should fall on a line boundary.
+    """
+    pos = end
+    tail = ""
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + tail
+        lines = data.split("\n")
+        # The first piece may be the end of a line that starts in an
+        # earlier block
+        tail = lines.pop(0)
+        for line in reversed(lines):
+            if line:
+                yield line
+    if tail:
+        yield tail
+
+
 def mkdirs_easy(dir):
     """mkdirs but don't raise if it exists"""
     try: